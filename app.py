@@ -1,18 +1,247 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, abort, current_app, g, has_request_context, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_cors import CORS
-from datetime import datetime
+from sqlalchemy import delete, event, insert, inspect, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import partial
+import atexit
+import base64
+import hashlib
+import json
+import math
 import os
+import shutil
+import sys
+import tempfile
+import time
 
-app = Flask(__name__)
-CORS(app)
+import click
 
-# Database configuration
+from cache import create_cache
+import compression
+from database import DEFAULT_SQLITE_PRAGMAS, apply_sqlite_pragmas, copy_sqlite_database, database_uri, engine_options, replica_uris
+from events import EventLog, format_event
+from jobs import JobQueue
+from json_provider import create_json_provider
+from metrics import DEFAULT_COUNT_BUCKETS, DEFAULT_SIZE_BUCKETS, MetricsRegistry
+from ratelimit import ConcurrencyLimiter, create_rate_limiter
+from replicas import ReadYourWrites, ReplicaSet
+from writebehind import WriteBuffer
+import search
+
+class RoutingSession(FlaskSession):
+    """db.session, sending every statement to the request's read replica when one was chosen."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if bind is None and replica is not None:
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+api = Blueprint('api', __name__, cli_group=None)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "app.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+def configure(app):
+    """Default configuration, with overrides read from the environment."""
+    # Browsers may reuse a preflight response for CORS_MAX_AGE seconds instead of
+    # sending OPTIONS before every cross-origin write
+    app.config['CORS_MAX_AGE'] = int(os.environ.get('CORS_MAX_AGE', 86400))
+
+    # Database configuration (DATABASE_URL overrides the local SQLite file)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(os.path.join(basedir, 'app.db'))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_SQLITE_PRAGMAS)
+
+    # Read replicas (REPLICA_URLS, comma-separated), bound as replica_1, replica_2, ...
+    # GETs to REPLICA_READ_RULES go to the healthy ones in turn. A replica is healthy when
+    # it answers and its latest write is at most REPLICA_MAX_LAG_SECONDS behind the
+    # primary's; health is rechecked every REPLICA_CHECK_INTERVAL seconds. A client that
+    # wrote reads from the primary until a replica has the sync revision its write reached.
+    app.config['REPLICA_URLS'] = replica_uris()
+    app.config['REPLICA_READ_RULES'] = ('/api/tasks', '/api/tasks/<int:task_id>/comments', '/api/comments', '/api/search')
+    app.config['REPLICA_CHECK_INTERVAL'] = 5.0
+    app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+
+    # Pagination configuration
+    app.config['TASKS_DEFAULT_LIMIT'] = 50
+    app.config['TASKS_MAX_LIMIT'] = 500
+    app.config['TASK_COMMENTS_DEFAULT_LIMIT'] = 20
+    app.config['TASK_COMMENTS_MAX_LIMIT'] = 100
+
+    # Bulk endpoint configuration
+    app.config['BULK_MAX_BATCH_SIZE'] = 1000
+
+    # Instrumentation configuration
+    app.config['SLOW_REQUEST_LOG_ENABLED'] = os.environ.get('SLOW_REQUEST_LOG_ENABLED', '').lower() in ('1', 'true')
+    app.config['SLOW_REQUEST_THRESHOLD_MS'] = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+
+    # Search configuration
+    app.config['SEARCH_DEFAULT_LIMIT'] = 20
+    app.config['SEARCH_MAX_LIMIT'] = 100
+
+    # Statistics configuration
+    app.config['STATS_DEFAULT_DAYS'] = 30
+    app.config['STATS_MAX_DAYS'] = 366
+
+    # Export/import configuration
+    app.config['EXPORT_BATCH_SIZE'] = 500
+    app.config['IMPORT_CHUNK_SIZE'] = 1000
+    app.config['IMPORT_MAX_REPORTED_ERRORS'] = 100
+
+    # Read-through cache configuration ('memory', 'redis' or 'null')
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CACHE_MAX_ENTRIES'] = 10000
+    app.config['CACHE_TTL'] = 60
+
+    # Change feed configuration (/api/events)
+    app.config['EVENTS_LOG_SIZE'] = 1000
+    app.config['EVENTS_MAX_CONNECTIONS'] = int(os.environ.get('EVENTS_MAX_CONNECTIONS', 100))
+    app.config['EVENTS_HEARTBEAT_SECONDS'] = 15
+    app.config['EVENTS_STREAM_TIMEOUT'] = 300
+    app.config['EVENTS_RETRY_MS'] = 3000
+
+    # Delta sync configuration (/api/sync)
+    app.config['SYNC_MAX_CHANGES'] = 5000
+    app.config['SYNC_TOMBSTONE_RETENTION_DAYS'] = 30
+
+    # ASGI deployment configuration (asgi.py): database calls allowed in flight per
+    # process, and threads serving the routes delegated to the Flask app
+    app.config['ASGI_DB_CONCURRENCY'] = int(os.environ.get('ASGI_DB_CONCURRENCY', 30))
+    app.config['ASGI_WSGI_THREADS'] = int(os.environ.get('ASGI_WSGI_THREADS', 10))
+
+    # Background jobs (/api/jobs): worker threads per process, how often idle workers
+    # look for jobs queued by other processes, and when a running job counts as abandoned
+    app.config['JOBS_WORKERS'] = int(os.environ.get('JOBS_WORKERS', 2))
+    app.config['JOBS_POLL_SECONDS'] = 1.0
+    # A running job's worker records a heartbeat every JOBS_HEARTBEAT_SECONDS; one with
+    # no heartbeat for JOBS_STALE_SECONDS belongs to a process that died
+    app.config['JOBS_HEARTBEAT_SECONDS'] = 10.0
+    app.config['JOBS_STALE_SECONDS'] = 60
+    app.config['JOBS_SHUTDOWN_TIMEOUT'] = 30
+    app.config['JOBS_RETENTION_DAYS'] = 7
+    # Work above these sizes is handed to a job and answered with 202
+    app.config['DELETE_ASYNC_MIN_COMMENTS'] = 1000
+    app.config['DELETE_BATCH_SIZE'] = 500
+    app.config['IMPORT_ASYNC_MIN_BYTES'] = 1024 * 1024
+    # Queued import bodies wait here for their job, which deletes them; every process
+    # that runs jobs must see this directory
+    app.config['IMPORT_SPOOL_DIR'] = os.environ.get('IMPORT_SPOOL_DIR', tempfile.gettempdir())
+
+    # Archival: completed tasks not updated for ARCHIVE_AFTER_DAYS move, with their comments,
+    # to the archive tables (POST /api/archive or flask archive-tasks), ARCHIVE_BATCH_SIZE per transaction
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    app.config['ARCHIVE_BATCH_SIZE'] = 500
+
+    # Rate limiting: token buckets per client (API key, else IP address) with separate read
+    # and write budgets, refilled at RATE requests per second up to BURST ('memory' or 'redis')
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1').lower() in ('1', 'true')
+    app.config['RATELIMIT_BACKEND'] = os.environ.get('RATELIMIT_BACKEND', 'memory')
+    app.config['RATELIMIT_REDIS_URL'] = os.environ.get('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['RATELIMIT_READ_RATE'] = float(os.environ.get('RATELIMIT_READ_RATE', 50))
+    app.config['RATELIMIT_READ_BURST'] = int(os.environ.get('RATELIMIT_READ_BURST', 200))
+    app.config['RATELIMIT_WRITE_RATE'] = float(os.environ.get('RATELIMIT_WRITE_RATE', 10))
+    app.config['RATELIMIT_WRITE_BURST'] = int(os.environ.get('RATELIMIT_WRITE_BURST', 50))
+    app.config['RATELIMIT_MAX_CLIENTS'] = 100000
+    app.config['RATELIMIT_API_KEY_HEADER'] = 'X-API-Key'
+    # Keys that get their own buckets; clients without one of these are limited by address
+    app.config['RATELIMIT_API_KEYS'] = frozenset(filter(None, os.environ.get('RATELIMIT_API_KEYS', '').split(',')))
+    app.config['RATELIMIT_EXEMPT'] = ('/api/health',)
+    # Admission control: writes in flight per process, and how many more may wait (for at
+    # most WRITE_QUEUE_TIMEOUT seconds) before further writes are shed with 503
+    app.config['WRITE_CONCURRENCY'] = int(os.environ.get('WRITE_CONCURRENCY', 4))
+    app.config['WRITE_QUEUE'] = int(os.environ.get('WRITE_QUEUE', 64))
+    app.config['WRITE_QUEUE_TIMEOUT'] = 5.0
+    app.config['WRITE_SHED_RETRY_AFTER'] = 1
+
+    # Write-behind for PUT /api/tasks/<id>: updates are merged per task in process memory
+    # and committed together every WRITE_BEHIND_INTERVAL_MS or WRITE_BEHIND_MAX_OPERATIONS updates
+    app.config['WRITE_BEHIND_ENABLED'] = os.environ.get('WRITE_BEHIND_ENABLED', '0').lower() in ('1', 'true')
+    app.config['WRITE_BEHIND_INTERVAL_MS'] = int(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 50))
+    app.config['WRITE_BEHIND_MAX_OPERATIONS'] = int(os.environ.get('WRITE_BEHIND_MAX_OPERATIONS', 100))
+
+    # Response compression (brotli when installed, else gzip); smaller bodies are sent as is
+    app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1').lower() in ('1', 'true')
+    app.config['COMPRESSION_MIN_SIZE'] = 500
+    app.config['COMPRESSION_LEVELS'] = dict(compression.DEFAULT_LEVELS)
+    app.config['COMPRESSION_MIMETYPES'] = ('application/json', 'application/x-ndjson', 'text/plain')
+
+    # JSON encoding ('auto' picks orjson when it is installed, else 'stdlib')
+    app.config['JSON_PROVIDER'] = os.environ.get('JSON_PROVIDER', 'auto')
+
+def create_app(config=None):
+    """Build the application; config overrides the defaults from configure().
+
+    Nothing here touches the database: engines connect on first use, and the
+    schema is created and upgraded by the migrations (flask db upgrade).
+    """
+    app = Flask(__name__)
+    configure(app)
+    if config:
+        app.config.update(config)
+        if 'SQLALCHEMY_DATABASE_URI' in config and 'SQLALCHEMY_ENGINE_OPTIONS' not in config:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{
+        key: dict(engine_options(uri), url=uri)
+        for key, uri in zip(replica_bind_keys(app.config), app.config['REPLICA_URLS'])
+    })
+    CORS(app, expose_headers=['ETag'], max_age=app.config['CORS_MAX_AGE'])
+    app.json = create_json_provider(app)
+    db.init_app(app)
+    app.cli.add_command(MigrationCommands(app))
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        for key in replica_bind_keys(app.config):
+            apply_sqlite_pragmas(db.engines[key], replica_sqlite_pragmas(app.config))
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', record_statement_start)
+            event.listen(engine, 'after_cursor_execute', record_statement_end)
+    app.register_blueprint(api)
+    return app
+
+def init_migrations(app):
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=os.path.join(basedir, 'migrations'), command='db',
+            render_as_batch=True, include_object=include_schema_object)
+
+class MigrationCommands(click.Group):
+    """Flask-Migrate's `flask db` commands, set up only when one is used.
+
+    Importing Flask-Migrate pulls in alembic, which would otherwise add to
+    every worker's import time.
+    """
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def migrate_commands(self):
+        if 'migrate' not in self.app.extensions:
+            init_migrations(self.app)
+        from flask_migrate.cli import db as commands
+        return commands
+
+    def list_commands(self, ctx):
+        return self.migrate_commands().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self.migrate_commands().get_command(ctx, name)
+
+def upgrade_schema():
+    """Create or upgrade the database schema to the latest migration (same as flask db upgrade)."""
+    from flask_migrate import upgrade
+    if 'migrate' not in current_app.extensions:
+        init_migrations(current_app)
+    upgrade()
+
+def include_schema_object(object, name, type_, reflected, compare_to):
+    # The FTS tables are created by raw SQL in the migrations, not from the models
+    return not (type_ == 'table' and search.is_index_table(name))
 
 # Models
 class Task(db.Model):
@@ -22,6 +251,21 @@ class Task(db.Model):
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Sync revision of the transaction that last wrote the row (see next_sync_revision)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Number of comments, adjusted in the same transaction as every comment write
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Composite indexes backing keyset pagination, with and without the completed filter
+    __table_args__ = (
+        db.Index('ix_task_created_at_id', 'created_at', 'id'),
+        db.Index('ix_task_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_task_completed_created_at_id', 'completed', 'created_at', 'id'),
+        db.Index('ix_task_completed_updated_at_id', 'completed', 'updated_at', 'id'),
+        db.Index('ix_task_revision', 'revision'),
+        # Ids are never handed out twice, even after the newest tasks are archived or deleted
+        {'sqlite_autoincrement': True},
+    )
     
     # Relationship with comments
     comments = db.relationship('Comment', backref='task', lazy=True, cascade='all, delete-orphan')
@@ -33,7 +277,8 @@ class Task(db.Model):
             'description': self.description,
             'completed': self.completed,
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'updated_at': self.updated_at.isoformat(),
+            'comment_count': self.comment_count
         }
 
 class Comment(db.Model):
@@ -42,6 +287,16 @@ class Comment(db.Model):
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Back a task's comments in page order (and, by its prefix, the per-task GROUP BY
+    # in /api/stats), the created-per-day histogram and /api/sync's revision range scan
+    __table_args__ = (
+        db.Index('ix_comment_task_id_created_at_id', 'task_id', 'created_at', 'id'),
+        db.Index('ix_comment_created_at', 'created_at'),
+        db.Index('ix_comment_revision', 'revision'),
+        {'sqlite_autoincrement': True},
+    )
     
     def to_dict(self):
         return {
@@ -52,22 +307,1506 @@ class Comment(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
-# Create tables
-with app.app_context():
-    db.create_all()
+class ArchivedTask(db.Model):
+    """A completed task moved out of the task table by the archive policy.
+
+    Keeps the id it had, so it can be restored in place; see archive_tasks().
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    completed = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Keyset pagination of ?archived=true listings
+    __table_args__ = (
+        db.Index('ix_archived_task_created_at_id', 'created_at', 'id'),
+        db.Index('ix_archived_task_updated_at_id', 'updated_at', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'completed': self.completed,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'comment_count': self.comment_count,
+            'archived_at': self.archived_at.isoformat()
+        }
+
+class ArchivedComment(db.Model):
+    """A comment of an archived task."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('archived_task.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_archived_comment_task_id_created_at_id', 'task_id', 'created_at', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'task_id': self.task_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+class TableRevision(db.Model):
+    """Per-table revision counter, bumped in the same transaction as every write.
+
+    Gives read endpoints an O(1) version signal for ETags and Last-Modified.
+    The 'sync' and 'sync_horizon' rows hold /api/sync's global change revision
+    and the newest revision whose tombstones have been compacted.
+    """
+    table_name = db.Column(db.String(50), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Tombstone(db.Model):
+    """A deleted task or comment, kept so /api/sync can report the deletion."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    task_id = db.Column(db.Integer, nullable=True)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_tombstone_revision', 'revision'),
+    )
+
+class StatCounter(db.Model):
+    """Running totals for /api/stats, adjusted in the same transaction as every write."""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    """A unit of background work run by the job workers; payload and result are JSON."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    payload = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Workers claim the oldest queued job
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result is not None else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+# Revision tracking and cache invalidation
+TRACKED_TABLES = (Task.__tablename__, Comment.__tablename__)
+
+def get_cache():
+    if 'cache' not in current_app.extensions:
+        current_app.extensions['cache'] = create_cache(current_app.config)
+    return current_app.extensions['cache']
+
+def bump_revisions(connection, table_names):
+    revisions = TableRevision.__table__
+    now = datetime.utcnow()
+    for table_name in sorted(table_names):
+        result = connection.execute(
+            revisions.update()
+            .where(revisions.c.table_name == table_name)
+            .values(revision=revisions.c.revision + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(revisions.insert().values(table_name=table_name, revision=1, updated_at=now))
+
+def invalidate_on_commit(session, keys):
+    """Queue cache keys to drop once the current transaction commits.
+
+    Dropping them earlier would let a concurrent reader re-cache the old rows
+    before the new ones become visible.
+    """
+    session.info.setdefault('cache_invalidations', set()).update(keys)
+
+def mark_changed(session, table_names, keys=()):
+    bump_revisions(session.connection(), table_names)
+    invalidate_on_commit(session, keys)
+
+@event.listens_for(Session, 'after_flush')
+def track_flushed_changes(session, flush_context):
+    changed = set()
+    keys = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, (Task, Comment)):
+            changed.add(obj.__tablename__)
+            keys.add(f'{obj.__tablename__}:{obj.id}')
+    for obj in session.dirty:
+        if isinstance(obj, (Task, Comment)) and session.is_modified(obj):
+            changed.add(obj.__tablename__)
+            keys.add(f'{obj.__tablename__}:{obj.id}')
+    # Deleting a task cascades to its comments; the ORM cascade loads them into
+    # session.deleted above, so their entries are dropped too
+    if any(isinstance(obj, Task) for obj in session.deleted):
+        changed.add(Comment.__tablename__)
+    if changed:
+        mark_changed(session, changed, keys)
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_changes(orm_execute_state):
+    # ORM-enabled insert()/update()/delete() statements bypass the flush; the
+    # bulk routes queue the affected entity keys themselves
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table_name = orm_execute_state.statement.table.name
+        if table_name in TRACKED_TABLES:
+            mark_changed(orm_execute_state.session, {table_name})
+
+# Statistics counters
+STAT_COUNTERS = ('tasks_total', 'tasks_completed', 'comments_total')
+
+def adjust_counters(connection, deltas):
+    counters = StatCounter.__table__
+    for name, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        result = connection.execute(
+            counters.update().where(counters.c.name == name).values(value=counters.c.value + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(counters.insert().values(name=name, value=delta))
+
+def adjust_comment_counts(session, deltas):
+    """Apply {task_id: delta} to Task.comment_count.
+
+    The count is part of the task's representation, so the tasks are stamped
+    with the sync revision and their cached copies dropped like any task write;
+    updated_at is left alone. Tasks deleted in the same transaction are skipped.
+    """
+    deltas = {task_id: delta for task_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    tasks = Task.__table__
+    revision = next_sync_revision(session)
+    by_delta = {}
+    for task_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(task_id)
+    for delta, task_ids in sorted(by_delta.items()):
+        for chunk in chunked(sorted(task_ids)):
+            session.connection().execute(
+                tasks.update()
+                .where(tasks.c.id.in_(chunk))
+                .values(comment_count=tasks.c.comment_count + delta, revision=revision, updated_at=tasks.c.updated_at)
+            )
+    mark_changed(session, {Task.__tablename__}, [f'task:{task_id}' for task_id in deltas])
+
+def count_actual(connection):
+    """Compute the counters from scratch with full table scans."""
+    tasks_total, tasks_completed = connection.execute(
+        db.select(db.func.count(), db.func.coalesce(db.func.sum(db.cast(Task.completed, db.Integer)), 0))
+    ).one()
+    comments_total = connection.execute(db.select(db.func.count()).select_from(Comment)).scalar()
+    return {'tasks_total': tasks_total, 'tasks_completed': tasks_completed, 'comments_total': comments_total}
+
+def read_counters(connection):
+    rows = connection.execute(db.select(StatCounter.name, StatCounter.value)).all()
+    counters = dict.fromkeys(STAT_COUNTERS, 0)
+    counters.update({row.name: row.value for row in rows})
+    return counters
+
+def write_counters(connection, values):
+    connection.execute(delete(StatCounter))
+    connection.execute(insert(StatCounter), [{'name': name, 'value': value} for name, value in values.items()])
+
+@event.listens_for(Session, 'after_flush')
+def count_flushed_changes(session, flush_context):
+    deltas = Counter()
+    comment_deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Task):
+            deltas['tasks_total'] += 1
+            deltas['tasks_completed'] += bool(obj.completed)
+        elif isinstance(obj, Comment):
+            deltas['comments_total'] += 1
+            comment_deltas[obj.task_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            deltas['tasks_total'] -= 1
+            deltas['tasks_completed'] -= bool(obj.completed)
+        elif isinstance(obj, Comment):
+            deltas['comments_total'] -= 1
+            comment_deltas[obj.task_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Task):
+            history = inspect(obj).attrs.completed.history
+            if history.added:
+                before = bool(history.deleted[0]) if history.deleted else False
+                deltas['tasks_completed'] += bool(history.added[0]) - before
+        elif isinstance(obj, Comment):
+            history = inspect(obj).attrs.task_id.history
+            if history.added and history.deleted:
+                comment_deltas[history.deleted[0]] -= 1
+                comment_deltas[history.added[0]] += 1
+    if any(deltas.values()):
+        adjust_counters(session.connection(), deltas)
+    adjust_comment_counts(session, comment_deltas)
+
+@event.listens_for(Session, 'do_orm_execute')
+def count_bulk_changes(orm_execute_state):
+    """Adjust counters for ORM-enabled insert()/update()/delete() statements.
+
+    Handles the shapes the app issues: inserts and primary-key updates with
+    parameter lists, and deletes with a WHERE clause (counted before they run).
+    Comment inserts and deletes also adjust their tasks' comment_count.
+    """
+    statement = orm_execute_state.statement
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if statement.table.name not in TRACKED_TABLES:
+        return
+    session = orm_execute_state.session
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+    is_task = statement.table.name == Task.__tablename__
+    deltas = Counter()
+    comment_deltas = Counter()
+    
+    if orm_execute_state.is_insert:
+        if is_task:
+            deltas['tasks_total'] += len(rows)
+            deltas['tasks_completed'] += sum(bool(row.get('completed')) for row in rows)
+        else:
+            deltas['comments_total'] += len(rows)
+            comment_deltas.update(row['task_id'] for row in rows)
+    elif orm_execute_state.is_update:
+        changes = {row['id']: bool(row['completed']) for row in rows if is_task and 'completed' in row}
+        for chunk in chunked(list(changes)):
+            current = session.execute(db.select(Task.id, Task.completed).where(Task.id.in_(chunk)))
+            for task_id, completed in current:
+                deltas['tasks_completed'] += changes[task_id] - bool(completed)
+    elif is_task:
+        removed, removed_completed = session.execute(
+            db.select(db.func.count(), db.func.coalesce(db.func.sum(db.cast(Task.completed, db.Integer)), 0))
+            .where(statement.whereclause)
+        ).one()
+        deltas['tasks_total'] -= removed
+        deltas['tasks_completed'] -= removed_completed
+    else:
+        removed = session.execute(
+            db.select(Comment.task_id, db.func.count()).where(statement.whereclause).group_by(Comment.task_id)
+        ).all()
+        for task_id, count in removed:
+            deltas['comments_total'] -= count
+            comment_deltas[task_id] -= count
+    
+    if any(deltas.values()):
+        adjust_counters(session.connection(), deltas)
+    adjust_comment_counts(session, comment_deltas)
+
+@api.cli.command('check-stats')
+@click.option('--repair', is_flag=True, help='Overwrite the counters with the recomputed values.')
+def check_stats_command(repair):
+    """Compare the /api/stats counters with a full recount, optionally repairing them."""
+    with db.engine.begin() as connection:
+        stored = read_counters(connection)
+        actual = count_actual(connection)
+        mismatches = {name: (stored[name], actual[name]) for name in STAT_COUNTERS if stored[name] != actual[name]}
+        for name, (stored_value, actual_value) in mismatches.items():
+            print(f'{name}: stored {stored_value}, actual {actual_value}')
+        if not mismatches:
+            print('Counters are consistent')
+        elif repair:
+            write_counters(connection, actual)
+            print('Counters repaired')
+    if mismatches and not repair:
+        sys.exit(1)
+
+@event.listens_for(Session, 'after_commit')
+def apply_cache_invalidations(session):
+    keys = session.info.pop('cache_invalidations', None)
+    if keys:
+        get_cache().delete(*keys)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_cache_invalidations(session):
+    session.info.pop('cache_invalidations', None)
+
+# Change feed
+def get_event_log():
+    if 'events' not in current_app.extensions:
+        current_app.extensions['events'] = EventLog(max_events=current_app.config['EVENTS_LOG_SIZE'])
+    return current_app.extensions['events']
+
+def publish_on_commit(session, events):
+    """Queue (type, data) change events to publish once the transaction commits."""
+    session.info.setdefault('pending_events', []).extend(events)
+
+def deleted_event_data(obj):
+    if isinstance(obj, Comment):
+        return {'id': obj.id, 'task_id': obj.task_id}
+    return {'id': obj.id}
+
+@event.listens_for(Session, 'after_flush')
+def queue_flushed_events(session, flush_context):
+    # ORM-enabled insert()/update()/delete() statements bypass the flush; the
+    # bulk routes publish their own events
+    events = []
+    for obj in session.new:
+        if isinstance(obj, (Task, Comment)):
+            events.append((f'{obj.__tablename__}.created', obj.to_dict()))
+    for obj in session.dirty:
+        if isinstance(obj, (Task, Comment)) and session.is_modified(obj):
+            events.append((f'{obj.__tablename__}.updated', obj.to_dict()))
+    for obj in session.deleted:
+        if isinstance(obj, (Task, Comment)):
+            events.append((f'{obj.__tablename__}.deleted', deleted_event_data(obj)))
+    if events:
+        publish_on_commit(session, events)
+
+@event.listens_for(Session, 'after_commit')
+def publish_pending_events(session):
+    events = session.info.pop('pending_events', None)
+    if events:
+        get_event_log().publish(events)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending_events(session):
+    session.info.pop('pending_events', None)
+
+# Delta sync
+SYNC_REVISION = 'sync'
+SYNC_HORIZON = 'sync_horizon'
+
+def read_revision(connection, name):
+    revisions = TableRevision.__table__
+    return connection.execute(
+        db.select(revisions.c.revision).where(revisions.c.table_name == name)
+    ).scalar() or 0
+
+def next_sync_revision(session):
+    """Return the sync revision stamped on every row the current transaction writes.
+
+    It is allocated once per transaction by bumping the 'sync' row, whose row
+    lock is held until commit, so revisions become visible in increasing order.
+    """
+    if 'sync_revision' not in session.info:
+        connection = session.connection()
+        bump_revisions(connection, [SYNC_REVISION])
+        session.info['sync_revision'] = read_revision(connection, SYNC_REVISION)
+    return session.info['sync_revision']
+
+def with_sync_revision(session, rows):
+    revision = next_sync_revision(session)
+    return [dict(row, revision=revision) for row in rows]
+
+def record_tombstones(session, deleted):
+    """Insert tombstones for (kind, id, task_id) rows deleted in this transaction."""
+    if not deleted:
+        return
+    revision = next_sync_revision(session)
+    now = datetime.utcnow()
+    session.connection().execute(insert(Tombstone.__table__), [
+        {'kind': kind, 'ref_id': ref_id, 'task_id': task_id, 'revision': revision, 'deleted_at': now}
+        for kind, ref_id, task_id in deleted
+    ])
+
+@event.listens_for(Session, 'before_flush')
+def stamp_sync_revisions(session, flush_context, instances):
+    # ORM-enabled insert()/update() statements bypass the flush; the bulk routes
+    # stamp their rows with with_sync_revision()
+    for obj in session.new:
+        if isinstance(obj, (Task, Comment)):
+            obj.revision = next_sync_revision(session)
+    for obj in session.dirty:
+        if isinstance(obj, (Task, Comment)) and session.is_modified(obj):
+            obj.revision = next_sync_revision(session)
+
+@event.listens_for(Session, 'after_flush')
+def record_flushed_tombstones(session, flush_context):
+    record_tombstones(session, [
+        (obj.__tablename__, obj.id, obj.task_id if isinstance(obj, Comment) else obj.id)
+        for obj in session.deleted if isinstance(obj, (Task, Comment))
+    ])
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def reset_sync_revision(session):
+    session.info.pop('sync_revision', None)
+
+def compact_tombstones(connection, cutoff):
+    """Delete tombstones older than cutoff and advance the sync horizon past them.
+
+    Clients syncing from before the horizon could miss deletions, so /api/sync
+    answers them with 410 and they refetch everything.
+    """
+    tombstones = Tombstone.__table__
+    horizon = connection.execute(
+        db.select(db.func.max(tombstones.c.revision)).where(tombstones.c.deleted_at < cutoff)
+    ).scalar()
+    if horizon is None:
+        return 0
+    removed = connection.execute(tombstones.delete().where(tombstones.c.revision <= horizon)).rowcount
+    revisions = TableRevision.__table__
+    if read_revision(connection, SYNC_HORIZON) < horizon:
+        bump_revisions(connection, [SYNC_HORIZON])
+        connection.execute(
+            revisions.update().where(revisions.c.table_name == SYNC_HORIZON).values(revision=horizon)
+        )
+    return removed
+
+@api.cli.command('compact-tombstones')
+@click.option('--days', type=int, default=None, help='Keep tombstones this many days (default SYNC_TOMBSTONE_RETENTION_DAYS).')
+def compact_tombstones_command(days):
+    """Delete old deletion tombstones; /api/sync positions before them get 410."""
+    if days is None:
+        days = current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS']
+    with db.engine.begin() as connection:
+        removed = compact_tombstones(connection, datetime.utcnow() - timedelta(days=days))
+    print(f'Removed {removed} tombstones')
+
+# Background jobs
+JOB_HANDLERS = {}
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+def job_handler(kind):
+    """Register the function the workers run for jobs of this kind.
+
+    It is called in an app context with the job's payload, commits its own
+    work, and returns a JSON-compatible result that is stored on the job.
+    """
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+def get_job_queue():
+    if 'jobs' not in current_app.extensions:
+        # Workers run outside any request, in contexts of this app
+        flask_app = current_app._get_current_object()
+        current_app.extensions['jobs'] = JobQueue(
+            partial(claim_next_job, flask_app), partial(run_job, flask_app),
+            workers=current_app.config['JOBS_WORKERS'], poll_interval=current_app.config['JOBS_POLL_SECONDS'],
+            heartbeat=partial(record_job_heartbeat, flask_app),
+            heartbeat_interval=current_app.config['JOBS_HEARTBEAT_SECONDS'],
+        )
+    return current_app.extensions['jobs']
+
+def start_job_workers():
+    """Start this process's workers once, failing jobs whose worker has stopped sending heartbeats."""
+    queue = get_job_queue()
+    if queue.start():
+        with db.engine.begin() as connection:
+            fail_stale_jobs(connection, datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_STALE_SECONDS']))
+        atexit.register(queue.stop, current_app.config['JOBS_SHUTDOWN_TIMEOUT'])
+    return queue
+
+def enqueue_job(session, kind, payload, unique=False):
+    """Add a job in the current transaction; the workers are woken once it commits.
+
+    With unique=True an identical job that is still queued or running is
+    returned instead of adding another.
+    """
+    document = json.dumps(payload, sort_keys=True)
+    if unique:
+        existing = session.scalars(
+            db.select(Job)
+            .where(Job.status.in_(ACTIVE_JOB_STATUSES), Job.kind == kind, Job.payload == document)
+            .limit(1)
+        ).first()
+        if existing is not None:
+            return existing
+    job = Job(kind=kind, payload=document)
+    session.add(job)
+    session.flush()
+    session.info['jobs_enqueued'] = True
+    return job
+
+@event.listens_for(Session, 'after_commit')
+def wake_job_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        get_job_queue().notify()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_job_wakeup(session):
+    session.info.pop('jobs_enqueued', None)
+
+def claim_next_job(app):
+    """Mark the oldest queued job running and return its id, or None if there is none.
+
+    The UPDATE only matches while the job is still queued, so when workers
+    (in this or another process) race for a job exactly one of them wins.
+    """
+    jobs = Job.__table__
+    with app.app_context():
+        while True:
+            job_id = db.session.scalar(
+                db.select(jobs.c.id).where(jobs.c.status == 'queued').order_by(jobs.c.id).limit(1)
+            )
+            if job_id is None:
+                return None
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                jobs.update()
+                .where(jobs.c.id == job_id, jobs.c.status == 'queued')
+                .values(status='running', started_at=now, heartbeat_at=now)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+
+def run_job(app, job_id):
+    with app.app_context():
+        kind, payload = db.session.execute(db.select(Job.kind, Job.payload).where(Job.id == job_id)).one()
+        db.session.commit()
+        try:
+            result = JOB_HANDLERS[kind](json.loads(payload))
+        except Exception as error:
+            db.session.rollback()
+            current_app.logger.exception('Job %s (%s) failed', job_id, kind)
+            finish_job(job_id, 'failed', error=str(error) or type(error).__name__)
+        else:
+            finish_job(job_id, 'succeeded', result=result)
+
+def record_job_heartbeat(app, job_id):
+    """Stamp a running job as still alive; called by its worker's heartbeat thread."""
+    jobs = Job.__table__
+    with app.app_context():
+        db.session.execute(
+            jobs.update().where(jobs.c.id == job_id, jobs.c.status == 'running').values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+def finish_job(job_id, status, result=None, error=None):
+    jobs = Job.__table__
+    db.session.execute(jobs.update().where(jobs.c.id == job_id).values(
+        status=status,
+        result=json.dumps(result) if result is not None else None,
+        error=error,
+        finished_at=datetime.utcnow(),
+    ))
+    db.session.commit()
+
+def fail_stale_jobs(connection, cutoff):
+    """Fail running jobs with no heartbeat since cutoff: their process died, possibly part way through.
+
+    A live worker keeps its job's heartbeat fresh however long the job runs, so
+    jobs running in other processes are left alone. Jobs claimed before
+    heartbeats were recorded fall back to their start time.
+    """
+    jobs = Job.__table__
+    return connection.execute(
+        jobs.update()
+        .where(jobs.c.status == 'running', db.func.coalesce(jobs.c.heartbeat_at, jobs.c.started_at) < cutoff)
+        .values(status='failed', error='Interrupted before completion', finished_at=datetime.utcnow())
+    ).rowcount
+
+def prune_jobs(connection, cutoff):
+    jobs = Job.__table__
+    return connection.execute(
+        jobs.delete().where(jobs.c.status.not_in(ACTIVE_JOB_STATUSES), jobs.c.finished_at < cutoff)
+    ).rowcount
+
+@api.cli.command('prune-jobs')
+@click.option('--days', type=int, default=None, help='Keep finished jobs this many days (default JOBS_RETENTION_DAYS).')
+def prune_jobs_command(days):
+    """Delete finished jobs; their status URLs then return 404."""
+    if days is None:
+        days = current_app.config['JOBS_RETENTION_DAYS']
+    with db.engine.begin() as connection:
+        removed = prune_jobs(connection, datetime.utcnow() - timedelta(days=days))
+    print(f'Removed {removed} jobs')
+
+def job_accepted(job):
+    """202 response for a queued job, pointing at its status URL."""
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+def get_revisions(*table_names):
+    """Return {table_name: (revision, updated_at)} for the given tables.
+
+    Read from the database on every request rather than cached: it is a
+    primary-key lookup, and a cached copy could be stored by a reader that
+    loaded it just before a writer committed, serving stale ETags until it
+    expired. On a replica session this reads the replica's own revisions,
+    which describe the rows it serves.
+    """
+    return loaded_revisions(table_names, db.session.execute(revisions_statement(table_names)).all())
+
+def revisions_statement(table_names):
+    return (
+        db.select(TableRevision.table_name, TableRevision.revision, TableRevision.updated_at)
+        .where(TableRevision.table_name.in_(table_names))
+    )
+
+def loaded_revisions(table_names, rows):
+    """Map the rows of revisions_statement() by table; tables never written are at 0."""
+    loaded = {table_name: (0, None) for table_name in table_names}
+    loaded.update({row.table_name: (row.revision, row.updated_at) for row in rows})
+    return loaded
+
+# Full-text search index, kept in sync with task and comment rows by triggers.
+# Deployed databases get the index and the initial counters from the migrations;
+# these hooks do the same for schemas built with db.create_all() (tests, benchmarks).
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    if search.is_supported(connection) and not search.index_exists(connection):
+        search.create_index(connection)
+
+@event.listens_for(db.metadata, 'after_create')
+def initialize_counters(target, connection, **kw):
+    if connection.execute(db.select(db.func.count()).select_from(StatCounter)).scalar() == 0:
+        write_counters(connection, count_actual(connection))
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if search.is_supported(connection):
+        search.drop_index(connection)
+
+@api.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Drop and rebuild the full-text search index from the task and comment tables."""
+    with db.engine.begin() as connection:
+        search.rebuild_index(connection)
+    print('Search index rebuilt')
+
+# Error handling
+class APIError(Exception):
+    def __init__(self, message, status_code=400, payload=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.payload = payload
+
+@api.app_errorhandler(APIError)
+def handle_api_error(error):
+    body = dict(error.payload or {})
+    body['error'] = error.message
+    return jsonify(body), error.status_code
+
+# Instrumentation
+metrics_registry = MetricsRegistry()
+REQUEST_LATENCY = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', ('method', 'endpoint'))
+REQUESTS_TOTAL = metrics_registry.counter(
+    'http_requests_total', 'Requests handled, by status code.', ('method', 'endpoint', 'status'))
+REQUEST_SIZE = metrics_registry.histogram(
+    'http_request_size_bytes', 'Request body size.', ('method', 'endpoint'), DEFAULT_SIZE_BUCKETS)
+RESPONSE_SIZE = metrics_registry.histogram(
+    'http_response_size_bytes', 'Response body size (streamed responses are not counted).',
+    ('method', 'endpoint'), DEFAULT_SIZE_BUCKETS)
+REQUEST_SQL_STATEMENTS = metrics_registry.histogram(
+    'db_statements_per_request', 'SQL statements executed per request.', ('method', 'endpoint'), DEFAULT_COUNT_BUCKETS)
+REQUEST_SQL_DURATION = metrics_registry.histogram(
+    'db_request_query_duration_seconds', 'Total SQL time per request.', ('method', 'endpoint'))
+SQL_STATEMENT_DURATION = metrics_registry.histogram(
+    'db_statement_duration_seconds', 'Duration of individual SQL statements.')
+CACHE_OPERATIONS = metrics_registry.gauge(
+    'cache_operations', 'Read-through cache lookups and evictions in this process.', ('result',))
+
+def record_statement_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+def record_statement_end(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_start'].pop()
+    SQL_STATEMENT_DURATION.observe(elapsed)
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats is not None:
+        stats['count'] += 1
+        stats['duration'] += elapsed
+        if stats['statements'] is not None:
+            stats['statements'].append((statement, elapsed))
+
+@api.before_app_request
+def ensure_job_workers():
+    # Started on first use rather than at import, so CLI commands and tests run without threads
+    if not get_job_queue().started:
+        start_job_workers()
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.sql_stats = {
+        'count': 0,
+        'duration': 0.0,
+        # Statement texts are only kept when the slow-request log can use them
+        'statements': [] if current_app.config['SLOW_REQUEST_LOG_ENABLED'] else None,
+    }
+
+# Rate limiting and admission control
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def get_rate_limiter():
+    if 'ratelimit' not in current_app.extensions:
+        current_app.extensions['ratelimit'] = create_rate_limiter(current_app.config)
+    return current_app.extensions['ratelimit']
+
+def get_write_limiter():
+    if 'write_limiter' not in current_app.extensions:
+        current_app.extensions['write_limiter'] = ConcurrencyLimiter(
+            current_app.config['WRITE_CONCURRENCY'], current_app.config['WRITE_QUEUE'], current_app.config['WRITE_QUEUE_TIMEOUT'],
+        )
+    return current_app.extensions['write_limiter']
+
+def client_key(api_key, remote_addr):
+    """Identify the client by a configured API key, else by address; keys are hashed before they are stored.
+
+    An unknown key counts as no key, or sending a new one with every request
+    would get a fresh bucket each time.
+    """
+    if api_key and api_key in current_app.config['RATELIMIT_API_KEYS']:
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    return f'ip:{remote_addr}'
+
+def is_limited(method, rule):
+    return current_app.config['RATELIMIT_ENABLED'] and method != 'OPTIONS' and rule not in current_app.config['RATELIMIT_EXEMPT']
+
+def check_rate_limit(method, rule, api_key, remote_addr):
+    """Take a token from the client's read or write budget.
+
+    Returns None when the request may proceed, else (status_code, message,
+    retry_after_seconds) for the rejection.
+    """
+    if not is_limited(method, rule):
+        return None
+    budget = 'write' if method in WRITE_METHODS else 'read'
+    allowed, retry_after = get_rate_limiter().take(client_key(api_key, remote_addr), budget)
+    if allowed:
+        return None
+    return 429, f'Rate limit exceeded for {budget} requests', retry_after
+
+def needs_write_slot(method, rule):
+    return method in WRITE_METHODS and is_limited(method, rule)
+
+def write_shed_rejection():
+    return 503, 'Too many writes in progress', current_app.config['WRITE_SHED_RETRY_AFTER']
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+def rejection_response(rejection):
+    status_code, message, retry_after = rejection
+    response = jsonify({'error': message})
+    response.status_code = status_code
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+@api.before_app_request
+def admit_request():
+    rule = request.url_rule.rule if request.url_rule else None
+    api_key = request.headers.get(current_app.config['RATELIMIT_API_KEY_HEADER'])
+    rejection = check_rate_limit(request.method, rule, api_key, request.remote_addr)
+    if rejection is None and needs_write_slot(request.method, rule):
+        if get_write_limiter().acquire():
+            # Kept in the environ rather than g, which teardown cannot rely on having
+            request.environ['task_manager.write_slot'] = True
+        else:
+            rejection = write_shed_rejection()
+    if rejection is not None:
+        return rejection_response(rejection)
+
+@api.teardown_app_request
+def release_write_slot(exc):
+    # Runs when the request context ends: after the last chunk for stream_with_context responses
+    if request.environ.pop('task_manager.write_slot', False):
+        get_write_limiter().release()
+
+# Read replicas
+def replica_bind_keys(config):
+    return [f'replica_{index}' for index in range(1, len(config['REPLICA_URLS']) + 1)]
+
+def replica_sqlite_pragmas(config):
+    # Replicas are only read through; query_only turns a stray write into an error
+    # instead of a change the primary never sees
+    return dict(config['SQLITE_PRAGMAS'], query_only='ON')
+
+def get_replica_set():
+    if 'replicas' not in current_app.extensions:
+        current_app.extensions['replicas'] = ReplicaSet(
+            replica_bind_keys(current_app.config), check_replica, current_app.config['REPLICA_CHECK_INTERVAL'],
+        )
+    return current_app.extensions['replicas']
+
+def get_read_your_writes():
+    if 'read_your_writes' not in current_app.extensions:
+        current_app.extensions['read_your_writes'] = ReadYourWrites(current_app.config['RATELIMIT_MAX_CLIENTS'])
+    return current_app.extensions['read_your_writes']
+
+def sync_position(connection):
+    """(sync revision, time of the latest write) of a database; (0, None) before its first write."""
+    revisions = TableRevision.__table__
+    row = connection.execute(
+        db.select(revisions.c.revision, revisions.c.updated_at).where(revisions.c.table_name == SYNC_REVISION)
+    ).first()
+    return tuple(row) if row is not None else (0, None)
+
+def check_replica(name):
+    """Health check for ReplicaSet: the replica's sync revision, or None when it is too far behind.
+
+    Lag is the time between the latest write the primary has and the latest
+    the replica has, so an idle primary never makes an up-to-date replica
+    look stale.
+    """
+    with db.engines[name].connect() as connection:
+        position, replica_stamp = sync_position(connection)
+    with db.engine.connect() as connection:
+        _, primary_stamp = sync_position(connection)
+    if primary_stamp is None:
+        return position
+    if replica_stamp is None:
+        return None
+    if (primary_stamp - replica_stamp).total_seconds() > current_app.config['REPLICA_MAX_LAG_SECONDS']:
+        return None
+    return position
+
+def choose_replica(method, rule, api_key, remote_addr):
+    """Return the replica a request reads from, or None for the primary.
+
+    A client that wrote only reads from a replica that has the sync revision
+    its write reached, however far behind the lag limit lets that replica be.
+    """
+    if not current_app.config['REPLICA_URLS'] or method not in ('GET', 'HEAD'):
+        return None
+    if rule not in current_app.config['REPLICA_READ_RULES']:
+        return None
+    return get_replica_set().choose(get_read_your_writes().position(client_key(api_key, remote_addr)))
+
+def record_write(method, status_code, api_key, remote_addr):
+    """After a successful write, remember the primary's sync revision for the client.
+
+    Read once the write has committed, so it is at or past the revision the
+    write itself was stamped with.
+    """
+    if current_app.config['REPLICA_URLS'] and method in WRITE_METHODS and status_code < 400:
+        with db.engine.connect() as connection:
+            position = read_revision(connection, SYNC_REVISION)
+        get_read_your_writes().record_write(client_key(api_key, remote_addr), position)
+
+@api.before_app_request
+def route_reads():
+    rule = request.url_rule.rule if request.url_rule else None
+    api_key = request.headers.get(current_app.config['RATELIMIT_API_KEY_HEADER'])
+    replica = choose_replica(request.method, rule, api_key, request.remote_addr)
+    if replica is not None:
+        db.session.info['replica'] = replica
+        request.environ['task_manager.replica'] = replica
+
+@api.after_app_request
+def pin_writers(response):
+    api_key = request.headers.get(current_app.config['RATELIMIT_API_KEY_HEADER'])
+    record_write(request.method, response.status_code, api_key, request.remote_addr)
+    return response
+
+@api.teardown_app_request
+def release_replica(exc):
+    replica = request.environ.pop('task_manager.replica', None)
+    if replica is None:
+        return
+    if isinstance(exc, OperationalError):
+        get_replica_set().mark_failed(replica, str(exc.orig))
+    # The session outlives the request when an app context was already pushed (tests, CLI)
+    db.session.info.pop('replica', None)
+    db.session.rollback()
+
+@api.cli.command('copy-replicas')
+@click.option('--interval', type=float, default=None, help='Keep copying, every this many seconds.')
+def copy_replicas_command(interval):
+    """Copy the primary SQLite database over each replica, standing in for replication."""
+    while True:
+        for key in replica_bind_keys(current_app.config):
+            copy_sqlite_database(db.engine.url, db.engines[key].url)
+            print(f'Copied the primary to {key}')
+        if interval is None:
+            break
+        time.sleep(interval)
+
+@api.after_app_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # Route templates rather than raw paths keep label cardinality bounded
+    labels = {'method': request.method, 'endpoint': request.url_rule.rule if request.url_rule else 'unmatched'}
+    REQUEST_LATENCY.observe(elapsed, **labels)
+    REQUESTS_TOTAL.inc(status=response.status_code, **labels)
+    REQUEST_SIZE.observe(request.content_length or 0, **labels)
+    if not response.is_streamed and response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, **labels)
+    stats = g.sql_stats
+    REQUEST_SQL_STATEMENTS.observe(stats['count'], **labels)
+    REQUEST_SQL_DURATION.observe(stats['duration'], **labels)
+    
+    if current_app.config['SLOW_REQUEST_LOG_ENABLED'] and elapsed * 1000 >= current_app.config['SLOW_REQUEST_THRESHOLD_MS']:
+        log_slow_request(elapsed, response.status_code, stats)
+    return response
+
+def log_slow_request(elapsed, status_code, stats):
+    """Log a slow request with its SQL grouped by statement text, most repeated first.
+
+    A statement repeated once per row (an N+1 pattern) shows up as a single
+    line with a large repeat count.
+    """
+    grouped = {}
+    for statement, duration in stats['statements']:
+        count, total = grouped.get(statement, (0, 0.0))
+        grouped[statement] = (count + 1, total + duration)
+    lines = [
+        f'Slow request: {request.method} {request.full_path.rstrip("?")} -> {status_code} '
+        f'in {elapsed * 1000:.1f}ms, {stats["count"]} SQL statements in {stats["duration"] * 1000:.1f}ms'
+    ]
+    for statement, (count, total) in sorted(grouped.items(), key=lambda item: (-item[1][0], -item[1][1])):
+        flag = '  <-- repeated' if count > 1 else ''
+        lines.append(f'  {count}x {total * 1000:.1f}ms {" ".join(statement.split())}{flag}')
+    current_app.logger.warning('\n'.join(lines))
+
+# Pagination helpers
+# Columns tasks can be sorted by, on Task and ArchivedTask alike
+TASK_SORT_KEYS = ('created_at', 'updated_at')
+
+def encode_cursor(sort, value, row_id):
+    payload = json.dumps([sort, value.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        value = datetime.fromisoformat(value)
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise APIError('Invalid cursor')
+    if cursor_sort != sort:
+        raise APIError('Cursor does not match sort order')
+    return value, row_id
+
+def parse_bool_arg(name, args=None):
+    value = (request.args if args is None else args).get(name)
+    if value is None:
+        return None
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise APIError(f'{name} must be true or false')
+
+def parse_datetime_arg(name, args=None):
+    value = (request.args if args is None else args).get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise APIError(f'{name} must be an ISO 8601 datetime')
+
+def parse_limit_arg(name='limit', default_key='TASKS_DEFAULT_LIMIT', max_key='TASKS_MAX_LIMIT', args=None):
+    default_limit = current_app.config[default_key]
+    max_limit = current_app.config[max_key]
+    try:
+        limit = int((request.args if args is None else args).get(name, default_limit))
+    except ValueError:
+        raise APIError(f'{name} must be an integer')
+    if limit < 1:
+        raise APIError(f'{name} must be positive')
+    return min(limit, max_limit)
+
+def paginate_tasks(fields=None, model=Task):
+    """Load one page of tasks for the request args.
+
+    Returns the page as Row tuples of `fields` and the cursor for the next
+    page (None on the last page).
+    """
+    statement, limit, sort = task_page_statement(request.args, fields, model)
+    return finish_task_page(db.session.execute(statement).all(), limit, sort)
+
+def task_page_statement(args, fields=None, model=Task):
+    """Build the select() for one page of tasks from filter, sort and cursor args.
+
+    Selects the `fields` columns (all of TASK_FIELDS by default) rather than
+    Task entities, followed by the sort column when it is not among them.
+    Returns (statement, limit, sort). The statement fetches one extra row so
+    finish_task_page() can tell whether another page exists. model is Task or
+    ArchivedTask.
+    """
+    sort = args.get('sort', 'created_at')
+    descending = sort.startswith('-')
+    sort_key = sort.lstrip('-')
+    if sort_key not in TASK_SORT_KEYS:
+        raise APIError(f'sort must be one of: {", ".join(TASK_SORT_KEYS)} (prefix with - for descending)')
+    column = getattr(model, sort_key)
+    limit = parse_limit_arg(args=args)
+    fields = fields or TASK_FIELDS
+    columns = model_columns(model, fields)
+    if sort_key not in fields:
+        columns.append(column)
+    query = db.select(*columns)
+    
+    completed = parse_bool_arg('completed', args)
+    if completed is not None:
+        query = query.filter(model.completed == completed)
+    updated_after = parse_datetime_arg('updated_after', args)
+    if updated_after is not None:
+        query = query.filter(model.updated_at > updated_after)
+    updated_before = parse_datetime_arg('updated_before', args)
+    if updated_before is not None:
+        query = query.filter(model.updated_at < updated_before)
+    
+    cursor = args.get('cursor')
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        key = tuple_(column, model.id)
+        query = query.filter(key < (value, row_id) if descending else key > (value, row_id))
+    
+    if descending:
+        query = query.order_by(column.desc(), model.id.desc())
+    else:
+        query = query.order_by(column.asc(), model.id.asc())
+    return query.limit(limit + 1), limit, sort
+
+def finish_task_page(tasks, limit, sort):
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort.lstrip('-')), last.id)
+    return tasks, next_cursor
+
+def comment_page_statement(task_id, args, fields=None, task_model=Task, comment_model=Comment):
+    """Build the select() for one page of a task's comments, oldest first.
+
+    Comments are outer-joined to their task, so the same query tells a missing
+    task (no rows) from one without comments (a single row of NULLs) and no
+    separate existence check is needed. Returns (statement, limit); like
+    task_page_statement() it fetches one extra row. The models are Task and
+    Comment, or ArchivedTask and ArchivedComment.
+    """
+    limit = parse_limit_arg('limit', 'TASK_COMMENTS_DEFAULT_LIMIT', 'TASK_COMMENTS_MAX_LIMIT', args)
+    fields = fields or COMMENT_FIELDS
+    columns = model_columns(comment_model, fields)
+    if 'created_at' not in fields:
+        columns.append(comment_model.created_at)
+    on_clause = comment_model.task_id == task_model.id
+    cursor = args.get('cursor')
+    if cursor:
+        value, row_id = decode_cursor(cursor, 'created_at')
+        on_clause = db.and_(on_clause, tuple_(comment_model.created_at, comment_model.id) > (value, row_id))
+    statement = (
+        db.select(*columns, task_model.id.label('task_ref'))
+        .select_from(task_model)
+        .outerjoin(comment_model, on_clause)
+        .where(task_model.id == task_id)
+        .order_by(comment_model.created_at, comment_model.id)
+        .limit(limit + 1)
+    )
+    return statement, limit
+
+def finish_comment_page(rows, limit, fields):
+    """Serialize rows from comment_page_statement(); returns (comment dicts, next cursor)."""
+    if not rows:
+        raise APIError('Task not found', 404)
+    comments, next_cursor = finish_task_page([row for row in rows if row.id is not None], limit, 'created_at')
+    return row_dicts(comments, fields), next_cursor
+
+# Serialization
+# Fields of Task.to_dict() and Comment.to_dict(), in the order they are selected
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'created_at', 'updated_at', 'comment_count')
+COMMENT_FIELDS = ('id', 'content', 'task_id', 'created_at', 'updated_at')
+# ArchivedTask.to_dict(); archived comments have COMMENT_FIELDS
+ARCHIVED_TASK_FIELDS = TASK_FIELDS + ('archived_at',)
+DATETIME_FIELDS = frozenset({'created_at', 'updated_at', 'archived_at'})
+
+def parse_fields_arg(model_fields, args=None):
+    """Parse a sparse fieldset such as fields=title,completed.
+
+    Returns the requested fields in model order, always including id, or
+    model_fields when the argument is absent.
+    """
+    value = (request.args if args is None else args).get('fields')
+    if value is None:
+        return model_fields
+    requested = {name for name in value.split(',') if name}
+    if not requested or requested.difference(model_fields):
+        raise APIError(f'fields must be a comma-separated list of: {", ".join(model_fields)}')
+    return tuple(name for name in model_fields if name == 'id' or name in requested)
+
+def model_columns(model, fields):
+    return [getattr(model, name) for name in fields]
+
+def row_dicts(rows, fields):
+    """Serialize Row tuples selected with model_columns() the way to_dict() would.
+
+    Skips building ORM instances entirely; columns past len(fields), such as a
+    sort key selected only for the cursor, are ignored.
+    """
+    dicts = [dict(zip(fields, row)) for row in rows]
+    datetime_fields = DATETIME_FIELDS.intersection(fields)
+    if datetime_fields:
+        for item in dicts:
+            for name in datetime_fields:
+                item[name] = item[name].isoformat()
+    return dicts
+
+def project(entity_dict, fields):
+    return {name: entity_dict[name] for name in fields}
+
+# Embedded comments
+TASK_INCLUDES = ('comments',)
+
+def parse_include_arg(args=None):
+    includes = {name for name in (request.args if args is None else args).get('include', '').split(',') if name}
+    unknown = includes.difference(TASK_INCLUDES)
+    if unknown:
+        raise APIError(f'include must be one of: {", ".join(TASK_INCLUDES)}')
+    return includes
+
+def load_task_comments(task_ids, per_task_limit, model=Comment):
+    """Load up to per_task_limit comments for each task in a single query.
+
+    Returns {task_id: (comments, total_comment_count)}. A window function ranks
+    comments within each task and counts them, so the cost does not grow with
+    the number of tasks the way lazy loading task.comments would.
+    """
+    if not task_ids:
+        return {}
+    return group_task_comments(db.session.execute(task_comments_statement(task_ids, per_task_limit, model)).all())
+
+def task_comments_statement(task_ids, per_task_limit, model=Comment):
+    """Select COMMENT_FIELDS columns of Comment or ArchivedComment plus each task's comment total."""
+    ranked = db.select(
+        model.id,
+        db.func.row_number().over(
+            partition_by=model.task_id,
+            order_by=(model.created_at, model.id)
+        ).label('position'),
+        db.func.count().over(partition_by=model.task_id).label('total'),
+    ).where(model.task_id.in_(task_ids)).subquery()
+    return (
+        db.select(*model_columns(model, COMMENT_FIELDS), ranked.c.total)
+        .join(ranked, model.id == ranked.c.id)
+        .where(ranked.c.position <= per_task_limit)
+        .order_by(model.task_id, model.created_at, model.id)
+    )
+
+def group_task_comments(rows):
+    loaded = {}
+    for comment_dict, row in zip(row_dicts(rows, COMMENT_FIELDS), rows):
+        comments, _ = loaded.setdefault(comment_dict['task_id'], ([], row.total))
+        comments.append(comment_dict)
+    return loaded
+
+def serialize_tasks(rows, fields, includes, comment_model=Comment):
+    return attach_comments(row_dicts(rows, fields), includes, comment_model)
+
+def attach_comments(task_dicts, includes, comment_model=Comment):
+    if 'comments' in includes:
+        task_ids = [task_dict['id'] for task_dict in task_dicts]
+        loaded = load_task_comments(task_ids, parse_comments_limit_arg(), comment_model)
+        embed_comments(task_dicts, loaded)
+    return task_dicts
+
+def parse_comments_limit_arg(args=None):
+    return parse_limit_arg('comments_limit', 'TASK_COMMENTS_DEFAULT_LIMIT', 'TASK_COMMENTS_MAX_LIMIT', args)
+
+def embed_comments(task_dicts, loaded):
+    for task_dict in task_dicts:
+        comments, total = loaded.get(task_dict['id'], ([], 0))
+        task_dict['comments'] = comments
+        task_dict['comment_count'] = total
+
+# Conditional requests
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def task_etag(task_dict):
+    # A new comment changes comment_count without touching updated_at
+    return make_etag('task', task_dict['id'], task_dict['updated_at'], task_dict['comment_count'])
+
+def revisions_validators(*table_names):
+    """Build an ETag and Last-Modified for the current request from table revisions."""
+    revisions = get_revisions(*table_names)
+    etag = make_etag(request.full_path, *(revisions[name][0] for name in table_names))
+    stamps = [stamp for _, stamp in revisions.values() if stamp is not None]
+    return etag, max(stamps) if stamps else None
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client's cached copy is still current, otherwise None.
+
+    Called before any ORM objects are loaded so unchanged polls cost one small query.
+    """
+    if not is_fresh(request.if_none_match, request.if_modified_since, etag, last_modified):
+        return None
+    response = Response(status=304)
+    return set_validators(response, etag, last_modified)
+
+def is_fresh(if_none_match, if_modified_since, etag, last_modified):
+    """Whether the client's copy, described by its parsed conditional headers, is current."""
+    if if_none_match:
+        # Weak comparison: compressed responses carry the weak form of the tag
+        return if_none_match.contains_weak(etag)
+    if if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= if_modified_since
+    return False
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
+
+# Compression and caching headers
+# Cache-Control for successful GETs by route; everything else is 'no-store'.
+# 'no-cache' lets clients keep a copy but revalidate it (cheaply, by ETag) on every use.
+CACHE_CONTROL = {
+    '/api/tasks': 'no-cache',
+    '/api/tasks/<int:task_id>': 'no-cache',
+    '/api/tasks/<int:task_id>/comments': 'no-cache',
+    '/api/comments': 'no-cache',
+    '/api/comments/<int:comment_id>': 'no-cache',
+    '/api/events': 'no-cache',
+    '/api/search': 'no-cache',
+    '/api/stats': 'no-cache',
+}
+
+def cache_control(rule, method, status_code):
+    if method in ('GET', 'HEAD') and status_code in (200, 304):
+        return CACHE_CONTROL.get(rule, 'no-store')
+    return 'no-store'
+
+def is_compressible(mimetype):
+    return current_app.config['COMPRESSION_ENABLED'] and mimetype in current_app.config['COMPRESSION_MIMETYPES']
+
+def negotiate_encoding(status_code, mimetype, accept_encoding, size=None):
+    """Content-Encoding to compress a response with, or None to send it as is.
+
+    size is None for streamed bodies, which are compressed whatever their length.
+    """
+    if not is_compressible(mimetype) or status_code < 200 or status_code in (204, 304):
+        return None
+    if size is not None and size < current_app.config['COMPRESSION_MIN_SIZE']:
+        return None
+    return compression.negotiate(accept_encoding)
+
+# Registered after record_request_metrics, so it runs first and the metrics see the encoded size
+@api.after_app_request
+def compress_response(response):
+    if 'Cache-Control' not in response.headers:
+        rule = request.url_rule.rule if request.url_rule else None
+        response.headers['Cache-Control'] = cache_control(rule, request.method, response.status_code)
+    if is_compressible(response.mimetype) or response.status_code == 304:
+        response.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return response
+    
+    size = None if response.is_streamed else response.content_length
+    encoding = negotiate_encoding(response.status_code, response.mimetype, request.headers.get('Accept-Encoding'), size)
+    if encoding is None:
+        return response
+    level = current_app.config['COMPRESSION_LEVELS'][encoding]
+    if response.is_streamed:
+        response.response = compression.compress_chunks(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compression.compress(response.get_data(), encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    # The encoded bytes differ from the identity ones, so a strong tag no longer applies
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Cached reads
+def load_entity_dict(model, entity_id):
+    """Return the serialized row from the cache, loading it on a miss; 404 if it does not exist."""
+    cache = get_cache()
+    key = f'{model.__tablename__}:{entity_id}'
+    entity_dict = cache.get(key)
+    if entity_dict is None:
+        # Taken before the read: a write that commits after it revokes the lease
+        lease = cache.lease(key)
+        entity = db.session.get(model, entity_id)
+        if entity is None:
+            abort(404)
+        entity_dict = entity.to_dict()
+        cache.set_leased(key, entity_dict, lease)
+    return entity_dict
+
+def cached_json_response(etag, last_modified, build):
+    """Serve a response body cached under its ETag, calling build() for the payload on a miss.
+
+    ETags embed the request path and the table revisions, so a write makes the
+    old entries unreachable and they age out of the LRU.
+    """
+    cache = get_cache()
+    key = f'response:{etag}'
+    body = cache.get(key)
+    if body is None:
+        response = jsonify(build())
+        cache.set(key, response.get_data(as_text=True))
+    else:
+        response = current_app.response_class(body, mimetype=current_app.json.mimetype)
+    return set_validators(response, etag, last_modified)
+
+# Bulk helpers
+# Keeps IN (...) lists below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK_SIZE = 500
+
+def chunked(items, size=IN_CLAUSE_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def existing_ids(model, ids):
+    found = set()
+    for chunk in chunked(list(set(ids))):
+        found.update(db.session.scalars(db.select(model.id).where(model.id.in_(chunk))))
+    return found
+
+def delete_comment_rows(session, comments):
+    """Delete (id, task_id) comment rows with set-based DELETE statements.
+
+    Queues the cache invalidations, change events and tombstones a flush would
+    produce; counters and table revisions follow from the statements themselves.
+    """
+    invalidate_on_commit(session, [f'comment:{comment_id}' for comment_id, _ in comments])
+    publish_on_commit(session, [
+        ('comment.deleted', {'id': comment_id, 'task_id': task_id}) for comment_id, task_id in comments
+    ])
+    record_tombstones(session, [('comment', comment_id, task_id) for comment_id, task_id in comments])
+    for chunk in chunked([comment_id for comment_id, _ in comments]):
+        session.execute(delete(Comment).where(Comment.id.in_(chunk)))
+
+def delete_tasks(session, task_ids):
+    """Delete tasks and their comments with DELETE ... WHERE task_id IN (...).
+
+    Nothing is loaded for the ORM cascade; only the comment ids are read, for
+    the side effects delete_comment_rows() describes. Returns the number of
+    comments deleted.
+    """
+    comments = session.execute(
+        db.select(Comment.id, Comment.task_id).where(Comment.task_id.in_(task_ids))
+    ).all()
+    invalidate_on_commit(session, [f'comment:{comment_id}' for comment_id, _ in comments])
+    invalidate_on_commit(session, [f'task:{task_id}' for task_id in task_ids])
+    publish_on_commit(session, [
+        ('comment.deleted', {'id': comment_id, 'task_id': task_id}) for comment_id, task_id in comments
+    ])
+    publish_on_commit(session, [('task.deleted', {'id': task_id}) for task_id in task_ids])
+    record_tombstones(session, [('comment', comment_id, task_id) for comment_id, task_id in comments])
+    record_tombstones(session, [('task', task_id, task_id) for task_id in task_ids])
+    session.execute(delete(Comment).where(Comment.task_id.in_(task_ids)))
+    session.execute(delete(Task).where(Task.id.in_(task_ids)))
+    return len(comments)
+
+def get_bulk_items(key):
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise APIError(f'{key} must be a non-empty list')
+    max_batch_size = current_app.config['BULK_MAX_BATCH_SIZE']
+    if len(items) > max_batch_size:
+        raise APIError(f'Batch size exceeds the maximum of {max_batch_size}', 413)
+    return items
+
+def reject_invalid_batch(errors):
+    """Fail the whole batch, with one result per invalid item, if any item is invalid."""
+    if errors:
+        results = [
+            {'index': index, 'status': status, 'error': message}
+            for index, (status, message) in sorted(errors.items())
+        ]
+        raise APIError('Batch validation failed; nothing was written', 400, {'results': results})
+
+def bulk_response(results, status_code=200):
+    """Send per-item results, an iterable the bulk routes build lazily.
+
+    Streamed, each result is built and sent as its own NDJSON line while the
+    body is written, so neither the results nor their JSON are held at once.
+    """
+    if parse_bool_arg('stream'):
+        # The body is sent after the app context is gone, so bind the encoder now
+        dumps = current_app.json.dumps
+        def generate():
+            for result in results:
+                yield dumps(result) + '\n'
+        return Response(generate(), status=status_code, mimetype='application/x-ndjson')
+    return jsonify({'results': list(results)}), status_code
+
+def insert_returning(model, rows):
+    """Insert rows with batched multi-row INSERT ... RETURNING statements.
+
+    SQLite has no sentinel column SQLAlchemy could use to keep RETURNING in
+    parameter order without falling back to one statement per row. Within the
+    write transaction rowids are handed out in increasing order, so sorting the
+    returned objects by id lines them back up with the input rows. Rows are
+    stamped with the transaction's sync revision.
+    """
+    objects = db.session.scalars(insert(model).returning(model), with_sync_revision(db.session, rows)).all()
+    return sorted(objects, key=lambda obj: obj.id)
+
+def validate_task_fields(item):
+    if 'title' in item and not isinstance(item['title'], str):
+        return 'title must be a string'
+    if 'description' in item and not isinstance(item['description'], (str, type(None))):
+        return 'description must be a string'
+    if 'completed' in item and not isinstance(item['completed'], bool):
+        return 'completed must be a boolean'
+    return None
 
 # Routes
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'API is running'})
 
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    cache_stats = get_cache().stats()
+    for result, key in (('hit', 'hits'), ('miss', 'misses'), ('eviction', 'evictions')):
+        CACHE_OPERATIONS.set(cache_stats[key], result=result)
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(get_cache().stats())
+
 # Task routes
-@app.route('/api/tasks', methods=['GET'])
+@api.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    tasks = Task.query.all()
-    return jsonify([task.to_dict() for task in tasks])
+    task_model, comment_model = parse_archived_arg()
+    includes = parse_include_arg()
+    fields = parse_fields_arg(task_model_fields(task_model))
+    tables = (task_model, comment_model) if 'comments' in includes else (task_model,)
+    etag, last_modified = revisions_validators(*(model.__tablename__ for model in tables))
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
+    def build():
+        rows, next_cursor = paginate_tasks(fields, task_model)
+        return {
+            'tasks': serialize_tasks(rows, fields, includes, comment_model),
+            'next_cursor': next_cursor
+        }
+    return cached_json_response(etag, last_modified, build)
 
-@app.route('/api/tasks', methods=['POST'])
+@api.route('/api/tasks', methods=['POST'])
 def create_task():
     data = request.get_json()
     
@@ -85,19 +1824,147 @@ def create_task():
     
     return jsonify(task.to_dict()), 201
 
-@app.route('/api/tasks/<int:task_id>', methods=['GET'])
+@api.route('/api/tasks/bulk', methods=['POST'])
+def bulk_create_tasks():
+    items = get_bulk_items('tasks')
+    
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or 'title' not in item:
+            errors[index] = (400, 'Title is required')
+            continue
+        message = validate_task_fields(item)
+        if message:
+            errors[index] = (400, message)
+    reject_invalid_batch(errors)
+    
+    now = datetime.utcnow()
+    rows = [{
+        'title': item['title'],
+        'description': item.get('description', ''),
+        'completed': item.get('completed', False),
+        'created_at': now,
+        'updated_at': now,
+    } for item in items]
+    tasks = insert_returning(Task, rows)
+    task_dicts = [task.to_dict() for task in tasks]
+    publish_on_commit(db.session, [('task.created', task_dict) for task_dict in task_dicts])
+    db.session.commit()
+    
+    results = (
+        {'index': index, 'status': 201, 'task': task_dict}
+        for index, task_dict in enumerate(task_dicts)
+    )
+    return bulk_response(results, 201)
+
+@api.route('/api/tasks/bulk', methods=['PATCH'])
+def bulk_update_tasks():
+    items = get_bulk_items('tasks')
+    
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            errors[index] = (400, 'id is required')
+            continue
+        if not {'title', 'description', 'completed'}.intersection(item):
+            errors[index] = (400, 'No data provided')
+            continue
+        message = validate_task_fields(item)
+        if message:
+            errors[index] = (400, message)
+    reject_invalid_batch(errors)
+    
+    found = existing_ids(Task, [item['id'] for item in items])
+    now = datetime.utcnow()
+    rows = []
+    for item in items:
+        if item['id'] not in found:
+            continue
+        row = {key: item[key] for key in ('title', 'description', 'completed') if key in item}
+        row['id'] = item['id']
+        row['updated_at'] = now
+        rows.append(row)
+    
+    if rows:
+        # ORM bulk UPDATE by primary key, executed as executemany
+        db.session.execute(update(Task), with_sync_revision(db.session, rows))
+        invalidate_on_commit(db.session, [f"task:{row['id']}" for row in rows])
+        # Partial payloads: subscribers merge the changed fields into their copy
+        publish_on_commit(db.session, [
+            ('task.updated', dict(row, updated_at=now.isoformat())) for row in rows
+        ])
+        db.session.commit()
+    
+    results = (
+        {'index': index, 'id': item['id'], 'status': 200}
+        if item['id'] in found else
+        {'index': index, 'id': item['id'], 'status': 404, 'error': 'Task not found'}
+        for index, item in enumerate(items)
+    )
+    return bulk_response(results)
+
+@api.route('/api/tasks/bulk', methods=['DELETE'])
+def bulk_delete_tasks():
+    ids = get_bulk_items('ids')
+    
+    errors = {index: (400, 'id must be an integer') for index, task_id in enumerate(ids) if not isinstance(task_id, int)}
+    reject_invalid_batch(errors)
+    
+    found = existing_ids(Task, ids)
+    for chunk in chunked(list(found)):
+        delete_tasks(db.session, chunk)
+    db.session.commit()
+    
+    results = (
+        {'index': index, 'id': task_id, 'status': 200}
+        if task_id in found else
+        {'index': index, 'id': task_id, 'status': 404, 'error': 'Task not found'}
+        for index, task_id in enumerate(ids)
+    )
+    return bulk_response(results)
+
+@api.route('/api/tasks/<int:task_id>', methods=['GET'])
 def get_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    return jsonify(task.to_dict())
+    task_model, comment_model = parse_archived_arg()
+    includes = parse_include_arg()
+    fields = parse_fields_arg(task_model_fields(task_model))
+    # Archived tasks cannot be updated, so nothing is buffered for them
+    pending = pending_task_changes(task_id) if task_model is Task else None
+    task_dict = apply_pending(load_entity_dict(task_model, task_id), pending)
+    etag = task_etag(task_dict)
+    last_modified = datetime.fromisoformat(task_dict['updated_at'])
+    if fields != TASK_FIELDS:
+        # A sparse or archived body is a different representation, so it needs its own tag
+        etag = make_etag(etag, *fields)
+    if 'comments' in includes:
+        comment_table = comment_model.__tablename__
+        comment_revision, comment_stamp = get_revisions(comment_table)[comment_table]
+        etag = make_etag(etag, request.full_path, comment_revision)
+        if comment_stamp is not None:
+            last_modified = max(last_modified, comment_stamp)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
+    # The cached dict is shared, so copy before embedding comments
+    task_dict = attach_comments([project(task_dict, fields)], includes, comment_model)[0]
+    return set_validators(jsonify(task_dict), etag, last_modified)
 
-@app.route('/api/tasks/<int:task_id>', methods=['PUT'])
+@api.route('/api/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
+    if current_app.config['WRITE_BEHIND_ENABLED']:
+        return update_task_write_behind(task_id)
     task = Task.query.get_or_404(task_id)
     data = request.get_json()
     
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
+    # Optimistic concurrency: refuse the write if the client's copy is stale. Tags
+    # name a task version, and are only weak because compression weakens them.
+    if request.if_match and not request.if_match.contains_weak(task_etag(task.to_dict())):
+        return jsonify({'error': 'Task has been modified since it was fetched'}), 412
+    
     if 'title' in data:
         task.title = data['title']
     if 'description' in data:
@@ -108,50 +1975,237 @@ def update_task(task_id):
     task.updated_at = datetime.utcnow()
     db.session.commit()
     
-    return jsonify(task.to_dict())
+    task_dict = task.to_dict()
+    return set_validators(jsonify(task_dict), task_etag(task_dict))
 
-@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+def update_task_write_behind(task_id):
+    pending = pending_task_changes(task_id)
+    task_dict = apply_pending(load_entity_dict(Task, task_id), pending)
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    if request.if_match and not request.if_match.contains_weak(task_etag(task_dict)):
+        return jsonify({'error': 'Task has been modified since it was fetched'}), 412
+    
+    task_dict = buffer_task_update(task_dict, data)
+    return set_validators(jsonify(task_dict), task_etag(task_dict))
+
+# Write-behind task updates
+SINGLE_TASK_RULE = '/api/tasks/<int:task_id>'
+# Routes that never read tasks, so they need not wait for a flush
+WRITE_BEHIND_NO_FLUSH_RULES = ('/api/health', '/api/metrics', '/api/write-behind/stats')
+
+def get_write_buffer():
+    if 'write_buffer' not in current_app.extensions:
+        current_app.extensions['write_buffer'] = WriteBuffer(
+            partial(write_task_updates, current_app._get_current_object()),
+            interval=current_app.config['WRITE_BEHIND_INTERVAL_MS'] / 1000,
+            max_operations=current_app.config['WRITE_BEHIND_MAX_OPERATIONS'],
+        )
+    return current_app.extensions['write_buffer']
+
+def buffer_task_update(task_dict, data):
+    """Queue an update in the write buffer and return the task as it will be once written.
+
+    Values are validated here because a bad one would fail the shared flush.
+    """
+    message = validate_task_fields(data)
+    if message:
+        raise APIError(message)
+    changes = {key: data[key] for key in ('title', 'description', 'completed') if key in data}
+    changes['updated_at'] = datetime.utcnow()
+    buffer = get_write_buffer()
+    if buffer.start():
+        atexit.register(buffer.stop)
+    buffer.put(task_dict['id'], changes)
+    return apply_pending(task_dict, serialize_changes(changes))
+
+def pending_task_changes(task_id):
+    """Buffered changes to the task as they appear in to_dict(), or None.
+
+    Read before the stored row: a flush finishing in between then only
+    re-applies changes the row already has.
+    """
+    buffer = current_app.extensions.get('write_buffer')
+    changes = buffer.pending(task_id) if buffer is not None else None
+    return serialize_changes(changes) if changes else None
+
+def serialize_changes(changes):
+    return dict(changes, updated_at=changes['updated_at'].isoformat())
+
+def apply_pending(task_dict, changes):
+    return dict(task_dict, **changes) if changes else task_dict
+
+def write_task_updates(app, updates):
+    """Commit buffered {task_id: changes} in one transaction; the write buffer's callback.
+
+    Tasks deleted since their update was accepted are skipped.
+    """
+    with app.app_context():
+        found = existing_ids(Task, updates)
+        rows = [dict(changes, id=task_id) for task_id, changes in updates.items() if task_id in found]
+        if rows:
+            db.session.execute(update(Task), with_sync_revision(db.session, rows))
+            invalidate_on_commit(db.session, [f"task:{row['id']}" for row in rows])
+            publish_on_commit(db.session, [('task.updated', serialize_changes(row)) for row in rows])
+            db.session.commit()
+
+def flush_write_buffer(method, rule):
+    """Write buffered updates before any request but single-task reads and updates.
+
+    Those overlay the buffered changes themselves; everything else (lists,
+    search, sync, other writes) then sees this process's writes in order.
+    """
+    buffer = current_app.extensions.get('write_buffer')
+    if buffer is None or rule in WRITE_BEHIND_NO_FLUSH_RULES:
+        return False
+    if rule == SINGLE_TASK_RULE and method in ('GET', 'HEAD', 'PUT'):
+        return False
+    if not buffer.has_pending():
+        return False
+    buffer.flush()
+    return True
+
+@api.before_app_request
+def flush_before_request():
+    flush_write_buffer(request.method, request.url_rule.rule if request.url_rule else None)
+
+@api.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 def delete_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    db.session.delete(task)
+    job = start_task_delete(db.session, task_id, parse_bool_arg('async'))
     db.session.commit()
+    if job is not None:
+        return job_accepted(job)
     
     return jsonify({'message': 'Task deleted successfully'})
 
+def start_task_delete(session, task_id, run_async=None):
+    """Delete a task and its comments now, or queue a job if it has many comments.
+
+    run_async overrides the DELETE_ASYNC_MIN_COMMENTS decision. Returns the
+    job when one was queued, None when the task is already gone.
+    """
+    if session.scalar(db.select(Task.id).where(Task.id == task_id)) is None:
+        raise APIError('Task not found', 404)
+    if run_async is None:
+        comment_count = session.scalar(
+            db.select(db.func.count()).select_from(Comment).where(Comment.task_id == task_id)
+        )
+        run_async = comment_count >= current_app.config['DELETE_ASYNC_MIN_COMMENTS']
+    if run_async:
+        return enqueue_job(session, 'delete_task', {'task_id': task_id}, unique=True)
+    delete_tasks(session, [task_id])
+    return None
+
+@job_handler('delete_task')
+def delete_task_job(payload):
+    """Delete the task's comments in DELETE_BATCH_SIZE transactions, then the task.
+
+    Short transactions keep the write lock free for other requests; clients
+    see the comments disappear batch by batch through the change feed.
+    """
+    task_id = payload['task_id']
+    batch_size = current_app.config['DELETE_BATCH_SIZE']
+    deleted_comments = 0
+    while True:
+        comments = db.session.execute(
+            db.select(Comment.id, Comment.task_id)
+            .where(Comment.task_id == task_id)
+            .order_by(Comment.id)
+            .limit(batch_size)
+        ).all()
+        if len(comments) < batch_size:
+            break
+        delete_comment_rows(db.session, comments)
+        db.session.commit()
+        deleted_comments += len(comments)
+    if existing_ids(Task, [task_id]):
+        # The last comments go in the same transaction as the task, including any added meanwhile
+        deleted_comments += delete_tasks(db.session, [task_id])
+        db.session.commit()
+    return {'task_id': task_id, 'deleted_comments': deleted_comments}
+
 # Comment routes
-@app.route('/api/comments', methods=['GET'])
+@api.route('/api/comments', methods=['GET'])
 def get_comments():
-    comments = Comment.query.all()
-    return jsonify([comment.to_dict() for comment in comments])
+    etag, last_modified = revisions_validators('comment')
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
+    fields = parse_fields_arg(COMMENT_FIELDS)
+    
+    def build():
+        return row_dicts(Comment.query.with_entities(*model_columns(Comment, fields)).all(), fields)
+    return cached_json_response(etag, last_modified, build)
 
-@app.route('/api/comments', methods=['POST'])
+@api.route('/api/comments', methods=['POST'])
 def create_comment():
     data = request.get_json()
     
     if not data or 'content' not in data or 'task_id' not in data:
         return jsonify({'error': 'Content and task_id are required'}), 400
     
-    # Check if task exists
-    task = Task.query.get(data['task_id'])
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
-    
     comment = Comment(
         content=data['content'],
         task_id=data['task_id']
     )
     
+    # The foreign key rejects a missing task, which saves looking it up first
     db.session.add(comment)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if not existing_ids(Task, [data['task_id']]):
+            return jsonify({'error': 'Task not found'}), 404
+        raise
     
     return jsonify(comment.to_dict()), 201
 
-@app.route('/api/comments/<int:comment_id>', methods=['GET'])
+@api.route('/api/comments/bulk', methods=['POST'])
+def bulk_create_comments():
+    items = get_bulk_items('comments')
+    
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or 'content' not in item or 'task_id' not in item:
+            errors[index] = (400, 'Content and task_id are required')
+        elif not isinstance(item['content'], str) or not isinstance(item['task_id'], int):
+            errors[index] = (400, 'content must be a string and task_id an integer')
+    if not errors:
+        found = existing_ids(Task, [item['task_id'] for item in items])
+        for index, item in enumerate(items):
+            if item['task_id'] not in found:
+                errors[index] = (404, 'Task not found')
+    reject_invalid_batch(errors)
+    
+    now = datetime.utcnow()
+    rows = [{
+        'content': item['content'],
+        'task_id': item['task_id'],
+        'created_at': now,
+        'updated_at': now,
+    } for item in items]
+    comments = insert_returning(Comment, rows)
+    comment_dicts = [comment.to_dict() for comment in comments]
+    publish_on_commit(db.session, [('comment.created', comment_dict) for comment_dict in comment_dicts])
+    db.session.commit()
+    
+    results = (
+        {'index': index, 'status': 201, 'comment': comment_dict}
+        for index, comment_dict in enumerate(comment_dicts)
+    )
+    return bulk_response(results, 201)
+
+@api.route('/api/comments/<int:comment_id>', methods=['GET'])
 def get_comment(comment_id):
-    comment = Comment.query.get_or_404(comment_id)
-    return jsonify(comment.to_dict())
+    fields = parse_fields_arg(COMMENT_FIELDS)
+    return jsonify(project(load_entity_dict(Comment, comment_id), fields))
 
-@app.route('/api/comments/<int:comment_id>', methods=['PUT'])
+@api.route('/api/comments/<int:comment_id>', methods=['PUT'])
 def update_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
     data = request.get_json()
@@ -165,7 +2219,7 @@ def update_comment(comment_id):
     
     return jsonify(comment.to_dict())
 
-@app.route('/api/comments/<int:comment_id>', methods=['DELETE'])
+@api.route('/api/comments/<int:comment_id>', methods=['DELETE'])
 def delete_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
     db.session.delete(comment)
@@ -173,12 +2227,586 @@ def delete_comment(comment_id):
     
     return jsonify({'message': 'Comment deleted successfully'})
 
-# Get comments for a specific task
-@app.route('/api/tasks/<int:task_id>/comments', methods=['GET'])
+# Get comments for a specific task, a page at a time
+@api.route('/api/tasks/<int:task_id>/comments', methods=['GET'])
 def get_task_comments(task_id):
-    task = Task.query.get_or_404(task_id)
-    comments = Comment.query.filter_by(task_id=task_id).all()
-    return jsonify([comment.to_dict() for comment in comments])
+    task_model, comment_model = parse_archived_arg()
+    # Task revisions cover deleting the task, which turns the page into a 404
+    etag, last_modified = revisions_validators(task_model.__tablename__, comment_model.__tablename__)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
+    fields = parse_fields_arg(COMMENT_FIELDS)
+    
+    def build():
+        statement, limit = comment_page_statement(task_id, request.args, fields, task_model, comment_model)
+        comments, next_cursor = finish_comment_page(db.session.execute(statement).all(), limit, fields)
+        return {'comments': comments, 'next_cursor': next_cursor}
+    return cached_json_response(etag, last_modified, build)
+
+# Archival
+# Completed tasks nobody has touched for a while are moved, with their comments,
+# to archive tables, keeping the task and comment tables and their indexes small
+# enough to stay in the page cache. Reads opt in with archived=true.
+def parse_archived_arg(args=None):
+    """Return the (task, comment) models a read is served from."""
+    if parse_bool_arg('archived', args):
+        return ArchivedTask, ArchivedComment
+    return Task, Comment
+
+def task_model_fields(model):
+    return ARCHIVED_TASK_FIELDS if model is ArchivedTask else TASK_FIELDS
+
+def archivable_task_ids(session, cutoff, limit):
+    """Ids of completed tasks last updated before cutoff, least recently updated first.
+
+    Ids are never reused since migration 0005, but a database may already hold a
+    task or comment whose id was handed out again after an earlier archive run.
+    Such a task would fail the copy on every run and stop the policy at its
+    batch, so it is left in place.
+    """
+    reused_comment_id = db.exists().where(Comment.task_id == Task.id, Comment.id == ArchivedComment.id)
+    # Served by ix_task_completed_updated_at_id
+    return session.scalars(
+        db.select(Task.id)
+        .where(Task.completed == True, Task.updated_at < cutoff)
+        .where(~db.exists().where(ArchivedTask.id == Task.id), ~reused_comment_id)
+        .order_by(Task.updated_at, Task.id)
+        .limit(limit)
+    ).all()
+
+def archive_tasks(session, task_ids):
+    """Copy tasks and their comments to the archive tables, then delete them.
+
+    The rows are copied with INSERT ... SELECT and removed with delete_tasks(),
+    so to the change feed, /api/sync, /api/stats and search an archived task
+    looks deleted. Returns the number of comments moved.
+    """
+    tasks = Task.__table__
+    comments = Comment.__table__
+    task_columns = [column.name for column in ArchivedTask.__table__.columns if column.name != 'archived_at']
+    session.execute(insert(ArchivedTask.__table__).from_select(
+        task_columns + ['archived_at'],
+        db.select(*(tasks.c[name] for name in task_columns), db.literal(datetime.utcnow(), db.DateTime))
+        .where(tasks.c.id.in_(task_ids)),
+    ))
+    comment_columns = [column.name for column in ArchivedComment.__table__.columns]
+    session.execute(insert(ArchivedComment.__table__).from_select(
+        comment_columns,
+        db.select(*(comments.c[name] for name in comment_columns)).where(comments.c.task_id.in_(task_ids)),
+    ))
+    mark_changed(session, {ArchivedTask.__tablename__, ArchivedComment.__tablename__})
+    return delete_tasks(session, task_ids)
+
+def archive_completed_tasks(days):
+    """Archive completed tasks not updated for `days` days, ARCHIVE_BATCH_SIZE per transaction.
+
+    Each batch commits on its own, so the write lock is never held for long
+    and an interrupted run keeps the batches it finished.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    batch_size = current_app.config['ARCHIVE_BATCH_SIZE']
+    archived_tasks = archived_comments = 0
+    while True:
+        task_ids = archivable_task_ids(db.session, cutoff, batch_size)
+        if not task_ids:
+            break
+        archived_comments += archive_tasks(db.session, task_ids)
+        db.session.commit()
+        archived_tasks += len(task_ids)
+    return {'archived_tasks': archived_tasks, 'archived_comments': archived_comments}
+
+def restore_archived_task(session, task_id):
+    """Move an archived task and its comments back into the hot tables.
+
+    The rows keep their ids, which no new row can have taken since ids are
+    AUTOINCREMENT. Rows archived before that (migration 0005) may clash with a
+    newer row, in which case the restore fails with 409. The task's updated_at
+    becomes the restore time, so the archive policy waits ARCHIVE_AFTER_DAYS
+    again before moving it back. Returns the restored task's dict.
+    """
+    archived = session.get(ArchivedTask, task_id)
+    if archived is None:
+        raise APIError('Archived task not found', 404)
+    archived_comments = session.scalars(
+        db.select(ArchivedComment).where(ArchivedComment.task_id == task_id).order_by(ArchivedComment.id)
+    ).all()
+    if existing_ids(Task, [task_id]) or existing_ids(Comment, [comment.id for comment in archived_comments]):
+        raise APIError('Task or comment id is in use; the task cannot be restored', 409)
+
+    # The insert hooks count the rows, index them for search and recompute comment_count
+    task_row = {name: getattr(archived, name) for name in TASK_FIELDS if name != 'comment_count'}
+    task_row['updated_at'] = datetime.utcnow()
+    task = insert_returning(Task, [task_row])[0]
+    comments = []
+    if archived_comments:
+        comments = insert_returning(Comment, [
+            {name: getattr(comment, name) for name in COMMENT_FIELDS} for comment in archived_comments
+        ])
+    session.execute(delete(ArchivedComment).where(ArchivedComment.task_id == task_id))
+    session.execute(delete(ArchivedTask).where(ArchivedTask.id == task_id))
+    mark_changed(session, {ArchivedTask.__tablename__, ArchivedComment.__tablename__}, [f'archived_task:{task_id}'])
+    session.refresh(task)
+    task_dict = task.to_dict()
+    publish_on_commit(session, [('task.created', task_dict)])
+    publish_on_commit(session, [('comment.created', comment.to_dict()) for comment in comments])
+    return task_dict
+
+@api.route('/api/archive', methods=['POST'])
+def archive_old_tasks():
+    """Queue a run of the archive policy; the body may override {"days": ARCHIVE_AFTER_DAYS}."""
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', current_app.config['ARCHIVE_AFTER_DAYS']) if isinstance(data, dict) else None
+    if not isinstance(days, int) or isinstance(days, bool) or days < 0:
+        raise APIError('days must be a non-negative integer')
+    job = enqueue_job(db.session, 'archive', {'days': days}, unique=True)
+    db.session.commit()
+    return job_accepted(job)
+
+@job_handler('archive')
+def archive_job(payload):
+    return archive_completed_tasks(payload['days'])
+
+@api.cli.command('archive-tasks')
+@click.option('--days', type=int, default=None, help='Archive completed tasks not updated for this many days (default ARCHIVE_AFTER_DAYS).')
+def archive_tasks_command(days):
+    """Move old completed tasks and their comments to the archive tables."""
+    if days is None:
+        days = current_app.config['ARCHIVE_AFTER_DAYS']
+    result = archive_completed_tasks(days)
+    print(f"Archived {result['archived_tasks']} tasks and {result['archived_comments']} comments")
+
+@api.route('/api/tasks/<int:task_id>/restore', methods=['POST'])
+def restore_task(task_id):
+    task_dict = restore_archived_task(db.session, task_id)
+    db.session.commit()
+    return jsonify(task_dict)
+
+# Change feed routes
+def parse_last_event_id(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise APIError('Last-Event-ID must be an integer')
+
+@api.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-sent events for every committed task and comment change.
+
+    Reconnecting clients send Last-Event-ID to receive what they missed; when
+    those events are no longer buffered a 'resync' event tells them to refetch.
+    Streams end after EVENTS_STREAM_TIMEOUT so a bounded number of workers
+    can serve clients that reconnect transparently.
+    """
+    log = get_event_log()
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID', request.args.get('last_event_id')))
+    if not log.connect(current_app.config['EVENTS_MAX_CONNECTIONS']):
+        response = jsonify({'error': 'Too many event stream connections'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(current_app.config['EVENTS_RETRY_MS'] // 1000)
+        return response
+
+    heartbeat = current_app.config['EVENTS_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + current_app.config['EVENTS_STREAM_TIMEOUT']
+    retry_ms = current_app.config['EVENTS_RETRY_MS']
+
+    def generate(last_id):
+        yield f'retry: {retry_ms}\n\n'
+        if last_id is None:
+            last_id = log.last_id
+            yield format_event('ready', {}, last_id)
+        while True:
+            events, complete = log.read_since(last_id)
+            if not complete:
+                last_id = log.last_id
+                yield format_event('resync', {'reason': 'missed events'}, last_id)
+                continue
+            for change in events:
+                yield format_event(change.type, change.data, change.id)
+                last_id = change.id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not log.wait(last_id, min(heartbeat, remaining)):
+                yield ': keep-alive\n\n'
+
+    # The generator needs no request context, so it is not wrapped in stream_with_context
+    response = Response(generate(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(log.disconnect)
+    return response
+
+@api.route('/api/events/stats', methods=['GET'])
+def event_stats():
+    return jsonify(get_event_log().stats())
+
+# Delta sync routes
+@api.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Tasks and comments written, and ids deleted, after revision `since`.
+
+    Without `since` only the current revision is returned, as the starting
+    point for a client about to do a full fetch. Clients should apply the
+    deletions before the upserts, since a task archived and then restored is
+    reported under the same id as both.
+    """
+    connection = db.session.connection()
+    current = read_revision(connection, SYNC_REVISION)
+    if 'since' not in request.args:
+        return jsonify({'revision': current})
+    try:
+        since = int(request.args['since'])
+    except ValueError:
+        raise APIError('since must be an integer revision')
+    if since > current or since < read_revision(connection, SYNC_HORIZON):
+        raise APIError('Changes since this revision are no longer available; refetch everything',
+                       410, {'revision': current})
+
+    max_changes = current_app.config['SYNC_MAX_CHANGES']
+    def changed(model, *columns):
+        # Served from the revision index, so the cost follows the number of changes
+        return db.session.execute(
+            db.select(*columns)
+            .where(model.revision > since, model.revision <= current)
+            .order_by(model.revision, model.id)
+            .limit(max_changes + 1)
+        ).all()
+    tasks = changed(Task, *model_columns(Task, TASK_FIELDS))
+    comments = changed(Comment, *model_columns(Comment, COMMENT_FIELDS))
+    tombstones = changed(Tombstone, Tombstone.kind, Tombstone.ref_id)
+    if len(tasks) + len(comments) + len(tombstones) > max_changes:
+        raise APIError('Too many changes since this revision; refetch everything', 410, {'revision': current})
+
+    return jsonify({
+        'revision': current,
+        'tasks': row_dicts(tasks, TASK_FIELDS),
+        'comments': row_dicts(comments, COMMENT_FIELDS),
+        'deleted': {
+            'tasks': [ref_id for kind, ref_id in tombstones if kind == 'task'],
+            'comments': [ref_id for kind, ref_id in tombstones if kind == 'comment'],
+        },
+    })
+
+# Rate limit routes
+@api.route('/api/ratelimit/stats', methods=['GET'])
+def ratelimit_stats():
+    return jsonify(dict(
+        get_rate_limiter().stats(),
+        enabled=current_app.config['RATELIMIT_ENABLED'],
+        writes=get_write_limiter().stats(),
+    ))
+
+# Read replica routes
+@api.route('/api/replicas/stats', methods=['GET'])
+def replica_stats():
+    return jsonify(dict(get_replica_set().stats(), **get_read_your_writes().stats()))
+
+# Write-behind routes
+@api.route('/api/write-behind/stats', methods=['GET'])
+def write_behind_stats():
+    return jsonify(dict(get_write_buffer().stats(), enabled=current_app.config['WRITE_BEHIND_ENABLED']))
+
+# Job routes
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    return jsonify(Job.query.get_or_404(job_id).to_dict())
+
+@api.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    counts = dict(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all())
+    return jsonify(dict(get_job_queue().stats(), jobs=counts))
+
+# Search routes
+@api.route('/api/search', methods=['GET'])
+def search_tasks():
+    user_query = request.args.get('q', '').strip()
+    if not user_query:
+        raise APIError('q is required')
+    connection = db.session.connection()
+    if not search.is_supported(connection):
+        raise APIError('Full-text search requires SQLite with FTS5', 501)
+    limit = parse_limit_arg('limit', 'SEARCH_DEFAULT_LIMIT', 'SEARCH_MAX_LIMIT')
+    try:
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        raise APIError('offset must be an integer')
+    if offset < 0:
+        raise APIError('offset must not be negative')
+    
+    # bm25 ranking has to score every match anyway, so offset paging costs the same as keyset here
+    rows = search.search(connection, user_query, limit + 1, offset)
+    results = [{
+        'type': row['kind'],
+        'id': row['ref_id'],
+        'task_id': row['task_id'],
+        'score': round(-row['score'], 6),
+        'title': row['title'],
+        'snippet': row['snippet'],
+    } for row in rows[:limit]]
+    return jsonify({
+        'results': results,
+        'next_offset': offset + limit if len(rows) > limit else None
+    })
+
+# Statistics routes
+def created_per_day(column, since):
+    day = db.func.date(column).label('day')
+    rows = db.session.execute(
+        db.select(day, db.func.count()).where(column >= since).group_by(day).order_by(day)
+    ).all()
+    return [{'date': str(row_day), 'count': count} for row_day, count in rows]
+
+@api.route('/api/search/rebuild', methods=['POST'])
+def rebuild_search_index():
+    """Queue a rebuild of the full-text index (see the rebuild-search-index command)."""
+    if not search.is_supported(db.session.connection()):
+        raise APIError('Full-text search requires SQLite with FTS5', 501)
+    job = enqueue_job(db.session, 'rebuild_search_index', {}, unique=True)
+    db.session.commit()
+    return job_accepted(job)
+
+@job_handler('rebuild_search_index')
+def rebuild_search_index_job(payload):
+    with db.engine.begin() as connection:
+        search.rebuild_index(connection)
+    return None
+
+@api.route('/api/stats', methods=['GET'])
+def get_stats():
+    try:
+        days = int(request.args.get('days', current_app.config['STATS_DEFAULT_DAYS']))
+    except ValueError:
+        raise APIError('days must be an integer')
+    if not 1 <= days <= current_app.config['STATS_MAX_DAYS']:
+        raise APIError(f"days must be between 1 and {current_app.config['STATS_MAX_DAYS']}")
+    
+    counters = read_counters(db.session.connection())
+    etag, last_modified = revisions_validators('task', 'comment')
+    # The histogram window moves with the date, and a repair changes counters without a write
+    today = datetime.utcnow().date()
+    etag = make_etag(etag, today, *(counters[name] for name in STAT_COUNTERS))
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
+    def build():
+        tasks_total = counters['tasks_total']
+        tasks_completed = counters['tasks_completed']
+        comments_total = counters['comments_total']
+        per_task = db.select(db.func.count().label('comments')).select_from(Comment).group_by(Comment.task_id).subquery()
+        distribution = dict(db.session.execute(
+            db.select(per_task.c.comments, db.func.count()).group_by(per_task.c.comments)
+        ).all())
+        tasks_with_comments = sum(distribution.values())
+        if tasks_total > tasks_with_comments:
+            distribution[0] = tasks_total - tasks_with_comments
+        since = datetime.combine(today - timedelta(days=days - 1), datetime.min.time())
+        return {
+            'tasks': {
+                'total': tasks_total,
+                'completed': tasks_completed,
+                'open': tasks_total - tasks_completed,
+                'completion_rate': round(tasks_completed / tasks_total, 4) if tasks_total else 0.0,
+            },
+            'comments': {
+                'total': comments_total,
+                'average_per_task': round(comments_total / tasks_total, 4) if tasks_total else 0.0,
+                'per_task_distribution': [
+                    {'comments': comments, 'tasks': tasks}
+                    for comments, tasks in sorted(distribution.items())
+                ],
+            },
+            'created_per_day': {
+                'days': days,
+                'tasks': created_per_day(Task.created_at, since),
+                'comments': created_per_day(Comment.created_at, since),
+            },
+        }
+    return cached_json_response(etag, last_modified, build)
+
+# Export / import routes
+EXPORT_FORMATS = ('ndjson', 'json')
+
+def export_task_batches(include_comments):
+    """Yield lists of task dicts, one server-side batch at a time."""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    result = db.session.execute(
+        db.select(*model_columns(Task, TASK_FIELDS)).order_by(Task.id).execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        task_dicts = row_dicts(rows, TASK_FIELDS)
+        if include_comments:
+            by_task = {task_dict['id']: [] for task_dict in task_dicts}
+            comments = db.session.execute(
+                db.select(*model_columns(Comment, COMMENT_FIELDS))
+                .where(Comment.task_id.in_(list(by_task)))
+                .order_by(Comment.task_id, Comment.created_at, Comment.id)
+            ).all()
+            for comment_dict in row_dicts(comments, COMMENT_FIELDS):
+                by_task[comment_dict['task_id']].append(comment_dict)
+            for task_dict in task_dicts:
+                task_dict['comments'] = by_task[task_dict['id']]
+        yield task_dicts
+
+@api.route('/api/export', methods=['GET'])
+def export_tasks():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise APIError(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    include_comments = 'comments' in parse_include_arg()
+    
+    def generate_ndjson():
+        for task_dicts in export_task_batches(include_comments):
+            yield ''.join(current_app.json.dumps(task_dict) + '\n' for task_dict in task_dicts)
+    
+    def generate_json():
+        yield '['
+        separator = ''
+        for task_dicts in export_task_batches(include_comments):
+            for task_dict in task_dicts:
+                yield separator + current_app.json.dumps(task_dict)
+                separator = ','
+        yield ']'
+    
+    if export_format == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+def parse_import_line(line):
+    """Turn one NDJSON line into (task row, comment rows), raising ValueError if invalid."""
+    item = json.loads(line)
+    if not isinstance(item, dict) or 'title' not in item:
+        raise ValueError('Title is required')
+    message = validate_task_fields(item)
+    if message:
+        raise ValueError(message)
+    now = datetime.utcnow()
+    created_at = datetime.fromisoformat(item['created_at']) if item.get('created_at') else now
+    task_row = {
+        'title': item['title'],
+        'description': item.get('description', ''),
+        'completed': item.get('completed', False),
+        'created_at': created_at,
+        'updated_at': datetime.fromisoformat(item['updated_at']) if item.get('updated_at') else created_at,
+    }
+    comments = item.get('comments', [])
+    if not isinstance(comments, list):
+        raise ValueError('comments must be a list')
+    comment_rows = []
+    for comment in comments:
+        if not isinstance(comment, dict) or not isinstance(comment.get('content'), str):
+            raise ValueError('Every comment needs string content')
+        comment_created_at = datetime.fromisoformat(comment['created_at']) if comment.get('created_at') else now
+        comment_rows.append({
+            'content': comment['content'],
+            'created_at': comment_created_at,
+            'updated_at': datetime.fromisoformat(comment['updated_at']) if comment.get('updated_at') else comment_created_at,
+        })
+    return task_row, comment_rows
+
+@api.route('/api/import', methods=['POST'])
+def import_tasks():
+    """Import NDJSON tasks (optionally with nested comments) read line by line from the body.
+
+    Bodies of IMPORT_ASYNC_MIN_BYTES or more (or any body with ?async=true) are
+    spooled to a file in IMPORT_SPOOL_DIR and imported in the background; the
+    job's result is the same summary.
+    """
+    run_async = parse_bool_arg('async')
+    if run_async is None:
+        run_async = (request.content_length or 0) >= current_app.config['IMPORT_ASYNC_MIN_BYTES']
+    if run_async:
+        path = spool_import(request.stream)
+        try:
+            job = enqueue_job(db.session, 'import', {'path': path})
+            db.session.commit()
+        except Exception:
+            os.remove(path)
+            raise
+        return job_accepted(job)
+    
+    summary = import_ndjson(request.stream)
+    status_code = 400 if summary['failed_lines'] and not summary['imported_tasks'] else 201
+    return jsonify(summary), status_code
+
+def spool_import(stream):
+    """Copy a request body to a new file in IMPORT_SPOOL_DIR a block at a time; returns its path."""
+    spool_dir = current_app.config['IMPORT_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=spool_dir, prefix='import-', suffix='.ndjson', delete=False) as spool:
+        try:
+            shutil.copyfileobj(stream, spool)
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name
+
+@job_handler('import')
+def import_job(payload):
+    # The job table only holds the path, and the spool file goes once the job ends,
+    # whether it succeeded or not; it cannot be retried part way through anyway
+    with open(payload['path'], 'rb') as lines:
+        try:
+            return import_ndjson(lines)
+        finally:
+            os.remove(payload['path'])
+
+def import_ndjson(lines):
+    """Import NDJSON lines, committing every IMPORT_CHUNK_SIZE rows so memory stays flat.
+
+    Invalid lines are skipped and reported; valid ones are imported with new ids.
+    Returns the summary.
+    """
+    chunk_size = current_app.config['IMPORT_CHUNK_SIZE']
+    max_errors = current_app.config['IMPORT_MAX_REPORTED_ERRORS']
+    summary = {'imported_tasks': 0, 'imported_comments': 0, 'failed_lines': 0, 'errors': []}
+    pending = []
+    pending_rows = 0
+    
+    def flush():
+        tasks = insert_returning(Task, [task_row for task_row, _ in pending])
+        comment_rows = [
+            dict(comment_row, task_id=task.id)
+            for task, (_, task_comments) in zip(tasks, pending)
+            for comment_row in task_comments
+        ]
+        if comment_rows:
+            db.session.execute(insert(Comment), with_sync_revision(db.session, comment_rows))
+        # One event per chunk instead of per row: subscribers refetch rather
+        # than replay an import that could overflow the event log
+        publish_on_commit(db.session, [('resync', {'reason': 'import'})])
+        db.session.commit()
+        summary['imported_tasks'] += len(tasks)
+        summary['imported_comments'] += len(comment_rows)
+        pending.clear()
+    
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            task_row, comment_rows = parse_import_line(line)
+        except (ValueError, TypeError) as error:
+            summary['failed_lines'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append({'line': line_number, 'error': str(error)})
+            continue
+        pending.append((task_row, comment_rows))
+        pending_rows += 1 + len(comment_rows)
+        if pending_rows >= chunk_size:
+            flush()
+            pending_rows = 0
+    if pending:
+        flush()
+    return summary
+
+app = create_app()
 
 if __name__ == '__main__':
+    with app.app_context():
+        upgrade_schema()
     app.run(debug=True, port=5000)
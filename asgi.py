@@ -0,0 +1,612 @@
+"""ASGI entry point: async handlers for the task and comment API.
+
+/api/tasks, /api/comments and /api/events are served by coroutines over an
+async SQLAlchemy engine (aiosqlite for SQLite), so a request waiting on the
+database or an idle event stream holds no thread. Every other route, and
+reads of archived tasks, are delegated to the Flask app in app.py through a
+WSGI adapter.
+
+List and search reads go to a read replica when REPLICA_URLS is set, using
+the same replica choice, and the same record of how far each client's writes
+reached, as the Flask routes.
+
+Writes go through the same ORM session events as the Flask routes, so table
+revisions, stat counters, cache invalidation, change events and sync
+tombstones behave identically whichever entry point served the request.
+
+    uvicorn asgi:application        # or: python serve.py
+"""
+import asyncio
+import re
+import time
+from datetime import datetime
+from functools import partial
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import http_date, parse_date, parse_etags
+
+from app import (
+    APIError, COMMENT_FIELDS, Comment, REQUEST_LATENCY, REQUESTS_TOTAL, TASK_FIELDS, Task, WRITE_METHODS, app, cache_control,
+    apply_pending, buffer_task_update, comment_page_statement, check_rate_limit, choose_replica, db, embed_comments, flush_write_buffer, finish_comment_page, finish_task_page, format_event, get_cache,
+    get_event_log, get_job_queue, get_replica_set, get_write_limiter, group_task_comments, is_compressible, is_fresh, loaded_revisions, make_etag,
+    model_columns, needs_write_slot, negotiate_encoding, parse_bool_arg, parse_comments_limit_arg,
+    parse_fields_arg, parse_include_arg, parse_last_event_id, pending_task_changes, project, record_write, replica_sqlite_pragmas, retry_after_header, revisions_statement,
+    row_dicts, start_job_workers, start_task_delete, task_comments_statement, task_etag,
+    task_page_statement, write_shed_rejection,
+)
+import compression
+from database import apply_sqlite_pragmas, async_database_uri, engine_options
+
+with app.app_context():
+    # The URL the sync engine was actually created with, not a later config override
+    database_uri = db.engine.url.render_as_string(hide_password=False)
+engine = create_async_engine(async_database_uri(database_uri), **engine_options(database_uri))
+apply_sqlite_pragmas(engine.sync_engine, app.config['SQLITE_PRAGMAS'])
+# Objects stay loaded after commit: re-fetching expired attributes would need implicit async IO
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+# Queue excess requests here rather than on the connection pool's checkout timeout
+db_slots = asyncio.Semaphore(app.config['ASGI_DB_CONCURRENCY'])
+# Async engines for the read replicas bound in the Flask app, created on first use
+replica_engines = {}
+
+
+def replica_engine(name):
+    if name not in replica_engines:
+        with app.app_context():
+            uri = db.engines[name].url.render_as_string(hide_password=False)
+        replica_engines[name] = create_async_engine(async_database_uri(uri), **engine_options(uri))
+        apply_sqlite_pragmas(replica_engines[name].sync_engine, replica_sqlite_pragmas(app.config))
+    return replica_engines[name]
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.body = body
+
+    @property
+    def api_key(self):
+        return self.headers.get(app.config['RATELIMIT_API_KEY_HEADER'].lower())
+
+    @property
+    def full_path(self):
+        # Matches Flask's request.full_path, which the shared ETags are built from
+        return f'{self.path}?{self.query_string}'
+
+    def get_json(self):
+        try:
+            return app.json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, content_type='application/json', on_close=None):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Content-Type', content_type)
+        self.on_close = on_close
+
+    @property
+    def is_streamed(self):
+        return not isinstance(self.body, bytes)
+
+
+def json_response(payload, status=200, headers=None):
+    return Response((app.json.dumps(payload) + '\n').encode(), status, headers)
+
+
+def error_response(message, status, headers=None):
+    return json_response({'error': message}, status, headers)
+
+
+def set_validators(response, etag, last_modified=None):
+    response.headers['ETag'] = f'"{etag}"'
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    if_none_match = parse_etags(request.headers.get('if-none-match'))
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    if not is_fresh(if_none_match, if_modified_since, etag, last_modified):
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+
+async def get_revisions(session, *table_names):
+    # Not cached, as in app.get_revisions()
+    return loaded_revisions(table_names, (await session.execute(revisions_statement(table_names))).all())
+
+
+async def revisions_validators(session, request, *table_names):
+    revisions = await get_revisions(session, *table_names)
+    etag = make_etag(request.full_path, *(revisions[name][0] for name in table_names))
+    stamps = [stamp for _, stamp in revisions.values() if stamp is not None]
+    return etag, max(stamps) if stamps else None
+
+
+async def cached_json_response(etag, last_modified, build):
+    """Serve a body cached under its ETag; shares entries with app.cached_json_response()."""
+    cache = get_cache()
+    key = f'response:{etag}'
+    body = cache.get(key)
+    if body is None:
+        body = app.json.dumps(await build()) + '\n'
+        cache.set(key, body)
+    return set_validators(Response(body.encode()), etag, last_modified)
+
+
+async def load_entity_dict(session, model, entity_id):
+    cache = get_cache()
+    key = f'{model.__tablename__}:{entity_id}'
+    entity_dict = cache.get(key)
+    if entity_dict is None:
+        # Taken before the read: a write that commits after it revokes the lease
+        lease = cache.lease(key)
+        entity = await session.get(model, entity_id)
+        if entity is None:
+            return None
+        entity_dict = entity.to_dict()
+        cache.set_leased(key, entity_dict, lease)
+    return entity_dict
+
+
+async def load_task_comments(session, task_ids, per_task_limit):
+    if not task_ids:
+        return {}
+    return group_task_comments((await session.execute(task_comments_statement(task_ids, per_task_limit))).all())
+
+
+# Task routes
+async def list_tasks(request, session):
+    includes = parse_include_arg(request.args)
+    fields = parse_fields_arg(TASK_FIELDS, request.args)
+    tables = ('task', 'comment') if 'comments' in includes else ('task',)
+    etag, last_modified = await revisions_validators(session, request, *tables)
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    async def build():
+        statement, limit, sort = task_page_statement(request.args, fields)
+        rows, next_cursor = finish_task_page((await session.execute(statement)).all(), limit, sort)
+        task_dicts = row_dicts(rows, fields)
+        if 'comments' in includes:
+            loaded = await load_task_comments(session, [task_dict['id'] for task_dict in task_dicts],
+                                              parse_comments_limit_arg(request.args))
+            embed_comments(task_dicts, loaded)
+        return {'tasks': task_dicts, 'next_cursor': next_cursor}
+    return await cached_json_response(etag, last_modified, build)
+
+
+async def create_task(request, session):
+    data = request.get_json()
+    if not data or 'title' not in data:
+        return error_response('Title is required', 400)
+    task = Task(
+        title=data['title'],
+        description=data.get('description', ''),
+        completed=data.get('completed', False)
+    )
+    session.add(task)
+    await session.commit()
+    return json_response(task.to_dict(), 201)
+
+
+async def get_task(request, session, task_id):
+    includes = parse_include_arg(request.args)
+    fields = parse_fields_arg(TASK_FIELDS, request.args)
+    pending = pending_task_changes(task_id)
+    task_dict = await load_entity_dict(session, Task, task_id)
+    if task_dict is None:
+        return error_response('Task not found', 404)
+    task_dict = apply_pending(task_dict, pending)
+    etag = task_etag(task_dict)
+    last_modified = datetime.fromisoformat(task_dict['updated_at'])
+    if fields != TASK_FIELDS:
+        etag = make_etag(etag, *fields)
+    if 'comments' in includes:
+        comment_revision, comment_stamp = (await get_revisions(session, 'comment'))['comment']
+        etag = make_etag(etag, request.full_path, comment_revision)
+        if comment_stamp is not None:
+            last_modified = max(last_modified, comment_stamp)
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    task_dict = project(task_dict, fields)
+    if 'comments' in includes:
+        embed_comments([task_dict], await load_task_comments(session, [task_id], parse_comments_limit_arg(request.args)))
+    return set_validators(json_response(task_dict), etag, last_modified)
+
+
+async def update_task(request, session, task_id):
+    if app.config['WRITE_BEHIND_ENABLED']:
+        return await update_task_write_behind(request, session, task_id)
+    task = await session.get(Task, task_id)
+    if task is None:
+        return error_response('Task not found', 404)
+    data = request.get_json()
+    if not data:
+        return error_response('No data provided', 400)
+
+    if_match = parse_etags(request.headers.get('if-match'))
+    if if_match and not if_match.contains_weak(task_etag(task.to_dict())):
+        return error_response('Task has been modified since it was fetched', 412)
+
+    if 'title' in data:
+        task.title = data['title']
+    if 'description' in data:
+        task.description = data['description']
+    if 'completed' in data:
+        task.completed = data['completed']
+    task.updated_at = datetime.utcnow()
+    await session.commit()
+
+    task_dict = task.to_dict()
+    return set_validators(json_response(task_dict), task_etag(task_dict))
+
+
+async def update_task_write_behind(request, session, task_id):
+    pending = pending_task_changes(task_id)
+    task_dict = await load_entity_dict(session, Task, task_id)
+    if task_dict is None:
+        return error_response('Task not found', 404)
+    task_dict = apply_pending(task_dict, pending)
+    data = request.get_json()
+    if not data:
+        return error_response('No data provided', 400)
+
+    if_match = parse_etags(request.headers.get('if-match'))
+    if if_match and not if_match.contains_weak(task_etag(task_dict)):
+        return error_response('Task has been modified since it was fetched', 412)
+
+    task_dict = buffer_task_update(task_dict, data)
+    return set_validators(json_response(task_dict), task_etag(task_dict))
+
+
+async def delete_task(request, session, task_id):
+    # Shared with the Flask route: set-based deletes now, or a background job for large tasks
+    job = await session.run_sync(start_task_delete, task_id, parse_bool_arg('async', request.args))
+    await session.commit()
+    if job is not None:
+        return json_response(job.to_dict(), 202, {'Location': f'/api/jobs/{job.id}'})
+    return json_response({'message': 'Task deleted successfully'})
+
+
+async def list_task_comments(request, session, task_id):
+    etag, last_modified = await revisions_validators(session, request, 'task', 'comment')
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    fields = parse_fields_arg(COMMENT_FIELDS, request.args)
+
+    async def build():
+        statement, limit = comment_page_statement(task_id, request.args, fields)
+        comments, next_cursor = finish_comment_page((await session.execute(statement)).all(), limit, fields)
+        return {'comments': comments, 'next_cursor': next_cursor}
+    return await cached_json_response(etag, last_modified, build)
+
+
+# Comment routes
+async def list_comments(request, session):
+    etag, last_modified = await revisions_validators(session, request, 'comment')
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    fields = parse_fields_arg(COMMENT_FIELDS, request.args)
+
+    async def build():
+        return row_dicts((await session.execute(select(*model_columns(Comment, fields)))).all(), fields)
+    return await cached_json_response(etag, last_modified, build)
+
+
+async def create_comment(request, session):
+    data = request.get_json()
+    if not data or 'content' not in data or 'task_id' not in data:
+        return error_response('Content and task_id are required', 400)
+    comment = Comment(content=data['content'], task_id=data['task_id'])
+    session.add(comment)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        if await session.get(Task, data['task_id']) is None:
+            return error_response('Task not found', 404)
+        raise
+    return json_response(comment.to_dict(), 201)
+
+
+async def get_comment(request, session, comment_id):
+    fields = parse_fields_arg(COMMENT_FIELDS, request.args)
+    comment_dict = await load_entity_dict(session, Comment, comment_id)
+    if comment_dict is None:
+        return error_response('Comment not found', 404)
+    return json_response(project(comment_dict, fields))
+
+
+async def update_comment(request, session, comment_id):
+    comment = await session.get(Comment, comment_id)
+    if comment is None:
+        return error_response('Comment not found', 404)
+    data = request.get_json()
+    if not data or 'content' not in data:
+        return error_response('Content is required', 400)
+    comment.content = data['content']
+    comment.updated_at = datetime.utcnow()
+    await session.commit()
+    return json_response(comment.to_dict())
+
+
+async def delete_comment(request, session, comment_id):
+    comment = await session.get(Comment, comment_id)
+    if comment is None:
+        return error_response('Comment not found', 404)
+    await session.delete(comment)
+    await session.commit()
+    return json_response({'message': 'Comment deleted successfully'})
+
+
+# Change feed
+async def stream_events(request):
+    """Async twin of app.stream_events(): idle streams wait on a future, not a thread."""
+    log = get_event_log()
+    last_id = parse_last_event_id(request.headers.get('last-event-id', request.args.get('last_event_id')))
+    if not log.connect(app.config['EVENTS_MAX_CONNECTIONS']):
+        return error_response('Too many event stream connections', 503,
+                              {'Retry-After': str(app.config['EVENTS_RETRY_MS'] // 1000)})
+
+    heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['EVENTS_STREAM_TIMEOUT']
+    retry_ms = app.config['EVENTS_RETRY_MS']
+
+    async def generate(last_id):
+        yield f'retry: {retry_ms}\n\n'
+        if last_id is None:
+            last_id = log.last_id
+            yield format_event('ready', {}, last_id)
+        while True:
+            events, complete = log.read_since(last_id)
+            if not complete:
+                last_id = log.last_id
+                yield format_event('resync', {'reason': 'missed events'}, last_id)
+                continue
+            for change in events:
+                yield format_event(change.type, change.data, change.id)
+                last_id = change.id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not await log.wait_async(last_id, min(heartbeat, remaining)):
+                yield ': keep-alive\n\n'
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(generate(last_id), headers=headers, content_type='text/event-stream', on_close=log.disconnect)
+
+
+# Flask-style rule, methods and handler; ROUTES handlers also receive a database session
+ROUTES = [
+    ('/api/tasks', ('GET',), list_tasks),
+    ('/api/tasks', ('POST',), create_task),
+    ('/api/tasks/<int:task_id>', ('GET',), get_task),
+    ('/api/tasks/<int:task_id>', ('PUT',), update_task),
+    ('/api/tasks/<int:task_id>', ('DELETE',), delete_task),
+    ('/api/tasks/<int:task_id>/comments', ('GET',), list_task_comments),
+    ('/api/comments', ('GET',), list_comments),
+    ('/api/comments', ('POST',), create_comment),
+    ('/api/comments/<int:comment_id>', ('GET',), get_comment),
+    ('/api/comments/<int:comment_id>', ('PUT',), update_comment),
+    ('/api/comments/<int:comment_id>', ('DELETE',), delete_comment),
+]
+STREAMING_ROUTES = [
+    ('/api/events', ('GET',), stream_events),
+]
+
+
+def compile_rule(rule):
+    return re.compile(re.sub(r'<int:(\w+)>', r'(?P<\1>\\d+)', rule) + '$')
+
+
+COMPILED_ROUTES = [
+    (compile_rule(rule), rule, methods, handler, uses_session)
+    for routes, uses_session in ((ROUTES, True), (STREAMING_ROUTES, False))
+    for rule, methods, handler in routes
+]
+
+
+def match_route(method, path):
+    for pattern, rule, methods, handler, uses_session in COMPILED_ROUTES:
+        match = pattern.match(path)
+        if match and method in methods:
+            return rule, handler, uses_session, {name: int(value) for name, value in match.groupdict().items()}
+    return None
+
+
+def is_archive_read(scope):
+    # Reads of the archive tables (archived=true) are rare; the Flask routes serve them
+    return any(name == 'archived' for name, _ in parse_qsl(scope['query_string'].decode('latin-1')))
+
+
+async def read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def admit(request, rule):
+    """Apply the Flask app's rate limits and write admission control.
+
+    Returns (rejection response or None, whether a write slot was taken).
+    """
+    rejection = check_rate_limit(request.method, rule, request.api_key, request.remote_addr)
+    if rejection is None and needs_write_slot(request.method, rule):
+        limiter = get_write_limiter()
+        # Slots are shared with the delegated Flask routes; only a queued wait needs a thread
+        if limiter.try_acquire() or await asyncio.to_thread(limiter.acquire):
+            return None, True
+        rejection = write_shed_rejection()
+    if rejection is None:
+        return None, False
+    status, message, retry_after = rejection
+    return error_response(message, status, {'Retry-After': retry_after_header(retry_after)}), False
+
+
+async def dispatch(request, handler, uses_session, params, replica=None):
+    try:
+        if not uses_session:
+            return await handler(request, **params)
+        async with db_slots:
+            if replica is None:
+                session_factory = async_session
+            else:
+                session_factory = partial(async_session, bind=replica_engine(replica), info={'replica': replica})
+            async with session_factory() as session:
+                return await handler(request, session, **params)
+    except APIError as error:
+        return json_response(dict(error.payload or {}, error=error.message), error.status_code)
+    except OperationalError as error:
+        if replica is not None:
+            get_replica_set().mark_failed(replica, str(error.orig))
+        raise
+
+
+async def send_response(response, request, rule, send, receive):
+    headers = dict(response.headers)
+    if 'origin' in request.headers:
+        # Same headers Flask-CORS adds to the delegated routes
+        headers['Access-Control-Allow-Origin'] = '*'
+        headers['Access-Control-Expose-Headers'] = 'ETag'
+    # Same caching and compression decisions as app.compress_response()
+    headers.setdefault('Cache-Control', cache_control(rule, request.method, response.status))
+    mimetype = headers['Content-Type'].split(';')[0]
+    if is_compressible(mimetype) or response.status == 304:
+        headers['Vary'] = 'Accept-Encoding'
+    size = None if response.is_streamed else len(response.body)
+    encoding = negotiate_encoding(response.status, mimetype, request.headers.get('accept-encoding'), size)
+    body, compressor = response.body, None
+    if encoding is not None:
+        level = app.config['COMPRESSION_LEVELS'][encoding]
+        headers['Content-Encoding'] = encoding
+        if 'ETag' in headers and not headers['ETag'].startswith('W/'):
+            headers['ETag'] = 'W/' + headers['ETag']
+        if response.is_streamed:
+            compressor = compression.StreamCompressor(encoding, level)
+        else:
+            body = compression.compress(body, encoding, level)
+    if not response.is_streamed:
+        headers['Content-Length'] = str(len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': response.status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    if not response.is_streamed:
+        await send({'type': 'http.response.body', 'body': body})
+        return
+
+    # Stop streaming as soon as the client disconnects instead of at the next message
+    disconnected = asyncio.ensure_future(read_body(receive))
+    chunks = response.body.__aiter__()
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                next_chunk.cancel()
+                break
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                await send({'type': 'http.response.body', 'body': compressor.finish() if compressor else b''})
+                break
+            chunk = chunk.encode()
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        await chunks.aclose()
+        if response.on_close is not None:
+            response.on_close()
+
+
+wsgi_application = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_THREADS'])
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                with app.app_context():
+                    start_job_workers()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                get_job_queue().stop(app.config['JOBS_SHUTDOWN_TIMEOUT'])
+                if 'write_buffer' in app.extensions:
+                    app.extensions['write_buffer'].stop()
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    route = match_route(scope['method'], scope['path']) if scope['type'] == 'http' else None
+    if route is None or is_archive_read(scope):
+        await wsgi_application(scope, receive, send)
+        return
+
+    # The shared helpers read current_app, as they do under Flask
+    with app.app_context():
+        await serve(route, scope, receive, send)
+
+
+async def serve(route, scope, receive, send):
+    started = time.perf_counter()
+    rule, handler, uses_session, params = route
+    body = await read_body(receive)
+    if body is None:
+        return
+    request = Request(scope, body)
+    response, write_slot = await admit(request, rule)
+    try:
+        if response is None:
+            write_buffer = app.extensions.get('write_buffer')
+            if write_buffer is not None and write_buffer.has_pending():
+                # A flush is a blocking transaction: keep it off the event loop
+                await asyncio.to_thread(flush_write_buffer, request.method, rule)
+            replica = None
+            if app.config['REPLICA_URLS']:
+                # A due health check queries the replica and the primary through the sync engines
+                replica = await asyncio.to_thread(
+                    choose_replica, request.method, rule, request.api_key, request.remote_addr,
+                )
+            response = await dispatch(request, handler, uses_session, params, replica)
+        if app.config['REPLICA_URLS'] and request.method in WRITE_METHODS:
+            # Recorded before the client sees the response, so its next read already waits for the write
+            await asyncio.to_thread(record_write, request.method, response.status, request.api_key, request.remote_addr)
+        await send_response(response, request, rule, send, receive)
+    finally:
+        if write_slot:
+            get_write_limiter().release()
+    labels = {'method': request.method, 'endpoint': rule}
+    REQUEST_LATENCY.observe(time.perf_counter() - started, **labels)
+    REQUESTS_TOTAL.inc(status=response.status, **labels)
@@ -0,0 +1,402 @@
+"""Reproducible latency/throughput benchmark for every route in app.py.
+
+Seeds a throwaway SQLite database, then drives each route through the Flask
+test client (in-process, no network) and through a real multi-threaded WSGI
+server, reporting p50/p95/p99 latency and requests per second. Serialization
+(to_dict + JSON encoding) is measured separately from query cost.
+
+    python benchmarks/api_benchmark.py run --tasks 5000 --comments 20000 --output results.json
+    python benchmarks/api_benchmark.py compare baseline.json results.json --threshold 0.15
+
+`compare` exits with status 1 when any route's p95 latency or throughput
+regressed by more than the threshold.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class Scenario:
+    def __init__(self, name, build, requests=None):
+        self.name = name
+        self.build = build
+        self.requests = requests
+
+
+class IdPool:
+    """Thread-safe supply of row ids that destructive scenarios consume once each."""
+
+    def __init__(self, ids):
+        self._ids = list(ids)
+        self._lock = threading.Lock()
+
+    def pop(self, count=1):
+        with self._lock:
+            taken, self._ids = self._ids[:count], self._ids[count:]
+        if len(taken) < count:
+            raise RuntimeError('Id pool exhausted; increase the seed size')
+        return taken
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def seed(app_module, task_count, comment_count, pool_size):
+    """Create the schema and fill the database; returns the ids scenarios may use or consume."""
+    from sqlalchemy import insert
+
+    db, Task, Comment = app_module.db, app_module.Task, app_module.Comment
+    random.seed(42)
+    base = datetime.utcnow() - timedelta(days=90)
+    words = ['report', 'deploy', 'meeting', 'review', 'invoice', 'design', 'bug', 'release', 'customer', 'budget']
+
+    def task_row(i):
+        stamp = base + timedelta(minutes=i)
+        return {
+            'title': f'{random.choice(words).title()} task {i}',
+            'description': ' '.join(random.choices(words, k=12)),
+            'completed': random.random() < 0.4,
+            'created_at': stamp,
+            'updated_at': stamp,
+        }
+
+    with app_module.app.app_context():
+        app_module.upgrade_schema()
+        total_tasks = task_count + 2 * pool_size
+        for start in range(0, total_tasks, 5000):
+            db.session.execute(insert(Task), [task_row(i) for i in range(start, min(start + 5000, total_tasks))])
+            db.session.commit()
+        task_ids = list(db.session.scalars(db.select(Task.id).order_by(Task.id)))
+        kept, deletable = task_ids[:task_count], task_ids[task_count:]
+
+        total_comments = comment_count + 2 * pool_size
+        for start in range(0, total_comments, 5000):
+            rows = [{
+                'content': ' '.join(random.choices(words, k=8)),
+                'task_id': random.choice(kept),
+                'created_at': base,
+                'updated_at': base,
+            } for _ in range(start, min(start + 5000, total_comments))]
+            db.session.execute(insert(Comment), rows)
+            db.session.commit()
+        comment_ids = list(db.session.scalars(db.select(Comment.id).order_by(Comment.id)))
+    return {
+        'task_ids': kept,
+        'comment_ids': comment_ids[:comment_count],
+        'deletable_tasks': IdPool(deletable),
+        'deletable_comments': IdPool(comment_ids[comment_count:]),
+    }
+
+
+def build_scenarios(ids, heavy_requests):
+    task_ids, comment_ids = ids['task_ids'], ids['comment_ids']
+
+    def task_id():
+        return random.choice(task_ids)
+
+    def comment_id():
+        return random.choice(comment_ids)
+
+    import_body = ''.join(json.dumps({'title': f'Imported {i}', 'comments': [{'content': 'x'}]}) + '\n' for i in range(50))
+    return [
+        Scenario('health', lambda: ('GET', '/api/health', None)),
+        Scenario('list_tasks', lambda: ('GET', '/api/tasks?limit=50', None)),
+        Scenario('list_tasks_filtered', lambda: ('GET', '/api/tasks?limit=50&completed=true&sort=-updated_at', None)),
+        Scenario('list_tasks_with_comments', lambda: ('GET', '/api/tasks?limit=50&include=comments', None)),
+        Scenario('get_task', lambda: ('GET', f'/api/tasks/{task_id()}', None)),
+        Scenario('create_task', lambda: ('POST', '/api/tasks', {'title': 'Benchmark task', 'description': 'created'})),
+        Scenario('update_task', lambda: ('PUT', f'/api/tasks/{task_id()}', {'completed': random.random() < 0.5})),
+        Scenario('delete_task', lambda: ('DELETE', f"/api/tasks/{ids['deletable_tasks'].pop()[0]}", None)),
+        Scenario('bulk_create_tasks', lambda: ('POST', '/api/tasks/bulk',
+                                               {'tasks': [{'title': f'Bulk {i}'} for i in range(100)]})),
+        Scenario('bulk_update_tasks', lambda: ('PATCH', '/api/tasks/bulk',
+                                               {'tasks': [{'id': task_id(), 'completed': True} for _ in range(100)]})),
+        Scenario('list_comments', lambda: ('GET', '/api/comments', None), heavy_requests),
+        Scenario('get_comment', lambda: ('GET', f'/api/comments/{comment_id()}', None)),
+        Scenario('create_comment', lambda: ('POST', '/api/comments', {'content': 'Benchmark', 'task_id': task_id()})),
+        Scenario('update_comment', lambda: ('PUT', f'/api/comments/{comment_id()}', {'content': 'Edited'})),
+        Scenario('delete_comment', lambda: ('DELETE', f"/api/comments/{ids['deletable_comments'].pop()[0]}", None)),
+        Scenario('bulk_create_comments', lambda: ('POST', '/api/comments/bulk',
+                                                  {'comments': [{'content': 'x', 'task_id': task_id()} for _ in range(100)]})),
+        Scenario('task_comments', lambda: ('GET', f'/api/tasks/{task_id()}/comments', None)),
+        Scenario('search', lambda: ('GET', f"/api/search?q={random.choice(['report', 'deploy', 'budget'])}", None)),
+        Scenario('stats', lambda: ('GET', '/api/stats', None)),
+        Scenario('export_ndjson', lambda: ('GET', '/api/export?format=ndjson', None), heavy_requests),
+        Scenario('import_ndjson', lambda: ('POST', '/api/import', import_body), heavy_requests),
+        Scenario('metrics', lambda: ('GET', '/api/metrics', None)),
+    ]
+
+
+# Sent with every request, e.g. Accept-Encoding to measure compressed responses
+EXTRA_HEADERS = {}
+
+
+def encode_body(body):
+    if body is None:
+        return None, dict(EXTRA_HEADERS)
+    if isinstance(body, str):
+        return body.encode(), {'Content-Type': 'application/x-ndjson', **EXTRA_HEADERS}
+    return json.dumps(body).encode(), {'Content-Type': 'application/json', **EXTRA_HEADERS}
+
+
+def run_test_client(app, scenario, requests):
+    client = app.test_client()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = scenario.build()
+        data, headers = encode_body(body)
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, data=data, headers=headers)
+        response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code >= 400
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def run_server(port, scenario, requests, concurrency):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            method, path, body = scenario.build()
+            data, headers = encode_body(body)
+            request_started = time.perf_counter()
+            # The development server closes every connection, so each request connects afresh
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except OSError:
+                failed = True
+            finally:
+                connection.close()
+            elapsed = time.perf_counter() - request_started
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def run_serialization(app_module, rows, repeats):
+    """Time loading rows, converting them with to_dict() and JSON-encoding them, separately.
+
+    The projection stage times the column-projection path instead: selecting
+    the columns and building dicts from Row tuples, with no ORM instances.
+    """
+    db, Task, Comment = app_module.db, app_module.Task, app_module.Comment
+    results = {}
+    with app_module.app.app_context():
+        for name, model, fields in (('task', Task, app_module.TASK_FIELDS), ('comment', Comment, app_module.COMMENT_FIELDS)):
+            timings = {'query': [], 'to_dict': [], 'json_encode': [], 'projection': []}
+            for _ in range(repeats):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                objects = db.session.scalars(db.select(model).order_by(model.id).limit(rows)).all()
+                timings['query'].append(time.perf_counter() - started)
+                started = time.perf_counter()
+                dicts = [obj.to_dict() for obj in objects]
+                timings['to_dict'].append(time.perf_counter() - started)
+                started = time.perf_counter()
+                app_module.app.json.dumps(dicts)
+                timings['json_encode'].append(time.perf_counter() - started)
+                started = time.perf_counter()
+                projected = db.session.execute(
+                    db.select(*app_module.model_columns(model, fields)).order_by(model.id).limit(rows)
+                ).all()
+                app_module.row_dicts(projected, fields)
+                timings['projection'].append(time.perf_counter() - started)
+            count = len(objects) or 1
+            results[name] = {
+                'rows': len(objects),
+                **{f'{stage}_us_per_row': round(min(values) / count * 1e6, 3) for stage, values in timings.items()},
+            }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix='task-manager-bench-')
+    # Configure before importing app.py, which reads the environment at import time
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ['CACHE_BACKEND'] = args.cache
+    # One client sending every request would otherwise measure 429s
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    import app as app_module
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    if args.accept_encoding:
+        EXTRA_HEADERS['Accept-Encoding'] = args.accept_encoding
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    modes = [mode for mode in ('test_client', 'server') if mode in args.modes]
+    heavy_requests = max(1, args.requests // 10)
+    pool_size = args.requests * len(modes)
+    print(f'Seeding {args.tasks} tasks and {args.comments} comments...', file=sys.stderr)
+    ids = seed(app_module, args.tasks, args.comments, pool_size)
+    scenarios = build_scenarios(ids, heavy_requests)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.only]
+
+    server = None
+    if 'server' in modes:
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    for scenario in scenarios:
+        requests = scenario.requests or args.requests
+        results[scenario.name] = {}
+        if 'test_client' in modes:
+            results[scenario.name]['test_client'] = run_test_client(app_module.app, scenario, requests)
+        if server is not None:
+            results[scenario.name]['server'] = run_server(server.server_port, scenario, requests, args.concurrency)
+        print(f'  {scenario.name}: done', file=sys.stderr)
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'tasks': args.tasks,
+            'comments': args.comments,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'cache': args.cache,
+            'json_provider': app_module.app.json.name,
+            'accept_encoding': args.accept_encoding,
+        },
+        'routes': results,
+        'serialization': run_serialization(app_module, args.serialization_rows, 5),
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+
+def print_report(report):
+    print(f"{'route':<26}{'mode':<13}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+    for name, modes in report['routes'].items():
+        for mode, result in modes.items():
+            print(f"{name:<26}{mode:<13}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                  f"{result['requests_per_second']:>9}{result['errors']:>8}")
+    print()
+    print(f"{'model':<10}{'rows':>7}{'query us/row':>15}{'to_dict us/row':>17}{'json us/row':>14}"
+          f"{'projection us/row':>20}")
+    for name, result in report['serialization'].items():
+        print(f"{name:<10}{result['rows']:>7}{result['query_us_per_row']:>15}"
+              f"{result['to_dict_us_per_row']:>17}{result['json_encode_us_per_row']:>14}"
+              f"{result.get('projection_us_per_row', '-'):>20}")
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+    regressions = []
+    for name, modes in current['routes'].items():
+        for mode, result in modes.items():
+            before = baseline['routes'].get(name, {}).get(mode)
+            if not before:
+                continue
+            latency_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+            throughput_change = ((before['requests_per_second'] - result['requests_per_second'])
+                                 / before['requests_per_second'] if before['requests_per_second'] else 0.0)
+            flagged = latency_change > args.threshold or throughput_change > args.threshold
+            marker = '  REGRESSION' if flagged else ''
+            print(f"{name:<26}{mode:<13}p95 {before['p95_ms']:>8} -> {result['p95_ms']:>8} ms ({latency_change:+.1%})"
+                  f"  req/s {before['requests_per_second']:>8} -> {result['requests_per_second']:>8}{marker}")
+            if flagged:
+                regressions.append(f'{name} ({mode})')
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f'\nNo regressions over {args.threshold:.0%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subcommands.add_parser('run', help='seed a database and benchmark every route')
+    run_parser.add_argument('--tasks', type=int, default=2000)
+    run_parser.add_argument('--comments', type=int, default=8000)
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per route and mode')
+    run_parser.add_argument('--concurrency', type=int, default=8, help='client threads against the server')
+    run_parser.add_argument('--modes', nargs='+', default=['test_client', 'server'], choices=['test_client', 'server'])
+    run_parser.add_argument('--cache', default='memory', choices=['memory', 'null'])
+    run_parser.add_argument('--only', nargs='+', help='only run these scenarios')
+    run_parser.add_argument('--accept-encoding', help='Accept-Encoding header to send, e.g. "gzip, br"')
+    run_parser.add_argument('--serialization-rows', type=int, default=1000)
+    run_parser.add_argument('--output', help='write JSON results to this file')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subcommands.add_parser('compare', help='compare two JSON result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.15, help='allowed relative slowdown')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
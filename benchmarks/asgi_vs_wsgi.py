@@ -0,0 +1,117 @@
+"""Sync (threaded WSGI) vs. async (ASGI) serving under high concurrency.
+
+Seeds a throwaway database, then starts the Flask app under the threaded
+development server and asgi.py under uvicorn, each as its own process on the
+same file. While a number of idle /api/events streams are held open, many
+client threads drive the read and write routes, reporting p50/p95/p99 latency
+and requests per second per server:
+
+    python benchmarks/asgi_vs_wsgi.py --concurrency 64 --idle-streams 200 --requests 500
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from api_benchmark import ROOT, build_scenarios, run_server, seed
+
+SCENARIOS = ['list_tasks', 'list_tasks_with_comments', 'get_task', 'task_comments', 'create_task', 'update_task']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, env):
+    if kind == 'wsgi':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads']
+    else:
+        command = [sys.executable, 'serve.py', '--port', str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/health')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{kind} server did not start on port {port}')
+
+
+def open_streams(port, count):
+    """Open idle event streams; each one costs the WSGI server a thread."""
+    streams = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port), timeout=30)
+        sock.sendall(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+        # Wait for the response head so the stream is established before measuring
+        if b' 200 ' not in sock.recv(4096):
+            raise RuntimeError('Event stream was refused; raise EVENTS_MAX_CONNECTIONS')
+        streams.append(sock)
+    return streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=8000)
+    parser.add_argument('--requests', type=int, default=500, help='requests per route and server')
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--idle-streams', type=int, default=100, help='event streams held open during the run')
+    parser.add_argument('--servers', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='task-manager-asgi-bench-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+               EVENTS_MAX_CONNECTIONS=str(args.idle_streams + 10),
+               RATELIMIT_ENABLED='0')
+    # Seed in this process through the same configuration the servers will read
+    os.environ.update(env)
+    import app as app_module
+
+    print(f'Seeding {args.tasks} tasks and {args.comments} comments...', file=sys.stderr)
+    ids = seed(app_module, args.tasks, args.comments, args.requests)
+    scenarios = [scenario for scenario in build_scenarios(ids, args.requests) if scenario.name in SCENARIOS]
+
+    results = {}
+    for kind in args.servers:
+        port = free_port()
+        process = start_server(kind, port, env)
+        streams = []
+        try:
+            streams = open_streams(port, args.idle_streams)
+            for scenario in scenarios:
+                results.setdefault(scenario.name, {})[kind] = run_server(port, scenario, args.requests, args.concurrency)
+                print(f'  {kind} {scenario.name}: done', file=sys.stderr)
+        finally:
+            for stream in streams:
+                stream.close()
+            process.terminate()
+            process.wait()
+
+    print(f"{'route':<26}{'server':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+    for name, servers in results.items():
+        for kind, result in servers.items():
+            print(f"{name:<26}{kind:<8}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                  f"{result['requests_per_second']:>9}{result['errors']:>8}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'meta': vars(args), 'routes': results}, output, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Cold start cost of app.py: import time, SQL run at import, time to first response.
+
+Each run is a fresh interpreter against a database already migrated to the
+latest schema and seeded with --tasks rows, which is what a restarted or
+newly scaled-out worker sees:
+
+    python benchmarks/cold_start.py --runs 10 --tasks 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child: counts every statement any engine executes from the first import on
+PROBE = """
+import json, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+import_statements = len(statements)
+response = app.app.test_client().get('/api/tasks')
+first_response = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'import_statements': import_statements,
+    'first_response_ms': (first_response - started) * 1000,
+    'status': response.status_code,
+}))
+"""
+
+
+def prepare(env, tasks):
+    script = (
+        'import app\n'
+        'from sqlalchemy import insert\n'
+        'with app.app.app_context():\n'
+        '    app.upgrade_schema()\n'
+        f'    rows = [{{"title": f"Task {{i}}"}} for i in range({tasks})]\n'
+        '    if rows:\n'
+        '        app.db.session.execute(insert(app.Task), rows)\n'
+        '        app.db.session.commit()\n'
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=10000, help='rows in the seeded database')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='task-manager-cold-start-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+               JOBS_WORKERS='0', RATELIMIT_ENABLED='0')
+    prepare(env, args.tasks)
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    report = {
+        'runs': args.runs,
+        'tasks': args.tasks,
+        'import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+        'import_statements': max(run['import_statements'] for run in runs),
+        'first_response_ms': round(statistics.median(run['first_response_ms'] for run in runs), 1),
+        'errors': sum(run['status'] != 200 for run in runs),
+    }
+    print(f"import (median)          {report['import_ms']:>8} ms")
+    print(f"SQL statements at import {report['import_statements']:>8}")
+    print(f"first response (median)  {report['first_response_ms']:>8} ms")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
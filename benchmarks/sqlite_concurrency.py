@@ -0,0 +1,121 @@
+"""Concurrent read/write throughput on SQLite, default settings vs. the tuned engine.
+
+Runs reader and writer threads against a fresh database file for each
+configuration and reports operations per second and lock errors:
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 4 --duration 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Task, db  # noqa: E402
+from database import DEFAULT_SQLITE_PRAGMAS, apply_sqlite_pragmas, engine_options  # noqa: E402
+
+
+def build_engine(url, tuned):
+    if not tuned:
+        # What app.py used before: a bare URL with the default rollback journal
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    apply_sqlite_pragmas(engine, DEFAULT_SQLITE_PRAGMAS)
+    return engine
+
+
+def seed(engine, count):
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    rows = [{'title': f'Task {i}', 'description': 'seed', 'completed': False,
+             'created_at': now, 'updated_at': now} for i in range(count)]
+    with engine.begin() as connection:
+        connection.execute(insert(Task.__table__), rows)
+
+
+def run(engine, readers, writers, duration, seed_count):
+    table = Task.__table__
+    counts = {'reads': 0, 'writes': 0, 'lock_errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while time.monotonic() < deadline:
+            try:
+                with engine.connect() as connection:
+                    connection.execute(
+                        select(table).order_by(table.c.created_at, table.c.id).limit(50)
+                    ).all()
+                count('reads')
+            except OperationalError:
+                count('lock_errors')
+
+    def writer():
+        while time.monotonic() < deadline:
+            now = datetime.utcnow()
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(table).values(
+                        title='Benchmark', description='', completed=False, created_at=now, updated_at=now))
+                    connection.execute(
+                        update(table).where(table.c.id == random.randint(1, seed_count)).values(
+                            completed=True, updated_at=now))
+                count('writes')
+            except OperationalError:
+                count('lock_errors')
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads_per_second': round(counts['reads'] / duration, 1),
+        'writes_per_second': round(counts['writes'] / duration, 1),
+        'lock_errors': counts['lock_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=10000, help='tasks created before the run')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for label, tuned in (('default', False), ('tuned', True)):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            engine = build_engine(url, tuned)
+            seed(engine, args.seed)
+            results[label] = run(engine, args.readers, args.writers, args.duration, args.seed)
+            engine.dispose()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{args.readers} readers, {args.writers} writers, {args.duration}s per configuration')
+    print(f"{'config':<10}{'reads/s':>12}{'writes/s':>12}{'lock errors':>14}")
+    for label, result in results.items():
+        print(f"{label:<10}{result['reads_per_second']:>12}{result['writes_per_second']:>12}{result['lock_errors']:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Cache backends for the read-through cache in app.py.
+
+Values are JSON-compatible (dicts, lists, strings, numbers) so every backend
+can store them the same way. Callers must treat returned values as read-only.
+
+A reader that fills an entry from the database takes a lease first and stores
+with set_leased(). Deleting the key revokes the lease, so a fill read before a
+write committed cannot overwrite the invalidation that followed it.
+"""
+from collections import OrderedDict
+import json
+import threading
+import time
+import uuid
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryCache:
+    """Bounded in-process LRU cache with a per-entry TTL.
+
+    Only coherent within one process: use a shared backend when several
+    workers serve the same database.
+    """
+    backend = 'memory'
+
+    def __init__(self, max_entries=10000, ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._leases = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self._clock():
+                del self._entries[key]
+                self._stats.evictions += 1
+                entry = None
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl):
+        self._entries[key] = (value, self._clock() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
+
+    def lease(self, key):
+        """Return a token that lets set_leased() fill key until the key is deleted."""
+        token = object()
+        with self._lock:
+            self._leases[key] = token
+            self._leases.move_to_end(key)
+            # Leases abandoned by readers that found no row are dropped oldest first
+            while len(self._leases) > self.max_entries:
+                self._leases.popitem(last=False)
+        return token
+
+    def set_leased(self, key, value, lease, ttl=None):
+        """Store value only if the lease is still current; return whether it was stored."""
+        with self._lock:
+            if self._leases.get(key) is not lease:
+                return False
+            del self._leases[key]
+            self._store(key, value, ttl)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._leases.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._leases.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = self._stats.to_dict()
+            stats.update(backend=self.backend, size=len(self._entries), max_entries=self.max_entries)
+            return stats
+
+
+# Compare-and-set run inside Redis, so a delete cannot land between the check and the store
+SET_LEASED_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class RedisCache:
+    """Cache shared between worker processes through Redis.
+
+    Evictions are managed by Redis itself (TTL and maxmemory policy), so only
+    this process's hits and misses are counted.
+    """
+    backend = 'redis'
+
+    def __init__(self, url, ttl=60, prefix='task-manager:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND "redis" requires the redis package (pip install redis)')
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._set_leased = self._client.register_script(SET_LEASED_SCRIPT)
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl if ttl is None else ttl)
+
+    def lease(self, key):
+        token = uuid.uuid4().hex
+        self._client.set(self.prefix + 'lease:' + key, token, ex=self.ttl)
+        return token
+
+    def set_leased(self, key, value, lease, ttl=None):
+        return bool(self._set_leased(
+            keys=[self.prefix + 'lease:' + key, self.prefix + key],
+            args=[lease, json.dumps(value), self.ttl if ttl is None else ttl],
+        ))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys),
+                                *(self.prefix + 'lease:' + key for key in keys))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        with self._lock:
+            stats = self._stats.to_dict()
+        stats.update(backend=self.backend)
+        return stats
+
+
+class NullCache:
+    """Backend used when caching is switched off; every lookup misses."""
+    backend = 'null'
+
+    def __init__(self):
+        self._stats = CacheStats()
+
+    def get(self, key):
+        self._stats.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def lease(self, key):
+        return None
+
+    def set_leased(self, key, value, lease, ttl=None):
+        return False
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        stats = self._stats.to_dict()
+        stats.update(backend=self.backend)
+        return stats
+
+
+def create_cache(config):
+    """Build the backend selected by CACHE_BACKEND ('memory', 'redis' or 'null')."""
+    backend = config.get('CACHE_BACKEND', 'memory')
+    ttl = config.get('CACHE_TTL', 60)
+    if backend == 'memory':
+        return MemoryCache(max_entries=config.get('CACHE_MAX_ENTRIES', 10000), ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], ttl=ttl)
+    if backend == 'null':
+        return NullCache()
+    raise ValueError(f'Unknown CACHE_BACKEND: {backend!r}')
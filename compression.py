@@ -0,0 +1,79 @@
+"""Negotiated response compression: brotli when it is installed, gzip otherwise.
+
+Whole bodies are compressed in one call. Streamed bodies go through a
+StreamCompressor that is flushed after every chunk, so clients still receive
+each chunk as it is produced instead of when the compressor's window fills.
+"""
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# In order of preference when the client accepts several equally
+ENCODINGS = ('gzip',) if brotli is None else ('br', 'gzip')
+DEFAULT_LEVELS = {'br': 4, 'gzip': 6}
+# zlib window bits selecting the gzip container
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """Pick an encoding for an Accept-Encoding header value; None means send it uncompressed."""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accept[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=None):
+    level = DEFAULT_LEVELS[encoding] if level is None else level
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zlib.compress(data, level, wbits=GZIP_WBITS)
+
+
+class StreamCompressor:
+    """Incremental compressor whose output is complete after each compress() call."""
+
+    def __init__(self, encoding, level=None):
+        level = DEFAULT_LEVELS[encoding] if level is None else level
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_chunks(chunks, encoding, level=None):
+    """Compress an iterable of str or bytes chunks, yielding one flushed piece per chunk."""
+    compressor = StreamCompressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        # Release the wrapped generator (and its app context) when the client goes away
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# asgi.py serves the module-level app in app.py, which takes its database from
+# DATABASE_URL when app.py is first imported. Point it at a throwaway file before
+# any test module imports app.py, so the tests never touch app.db (or whatever
+# database DATABASE_URL names outside the tests).
+test_database_dir = tempfile.TemporaryDirectory(prefix='task-manager-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(test_database_dir.name, 'app.db')
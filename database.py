@@ -0,0 +1,107 @@
+"""Database engine configuration: connection URL, pool sizing and SQLite pragmas.
+
+The URL comes from DATABASE_URL so PostgreSQL (or any SQLAlchemy URL) can be
+swapped in without code changes; SQLite files get connection pragmas tuned
+for concurrent readers and a single writer.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied to every new SQLite connection. WAL lets readers run while a writer
+# commits, NORMAL sync is durable across application crashes in WAL mode, and
+# busy_timeout makes writers wait for the lock instead of failing immediately.
+# foreign_keys turns on the REFERENCES checks SQLite otherwise ignores.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative values are KiB, so 64 MiB
+    'foreign_keys': 'ON',
+}
+
+
+def database_uri(default_sqlite_path, environ=os.environ):
+    return environ.get('DATABASE_URL', f'sqlite:///{default_sqlite_path}')
+
+
+def replica_uris(environ=os.environ):
+    """Read replica URLs from REPLICA_URLS, comma-separated."""
+    return [uri.strip() for uri in environ.get('REPLICA_URLS', '').split(',') if uri.strip()]
+
+
+def is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+# Async drivers used by the ASGI entry point for each sync backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_uri(uri):
+    """Return the URL for the same database with an asyncio driver."""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend!r} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def engine_options(uri, environ=os.environ):
+    """Return create_engine() keyword arguments for the given database URL."""
+    options = {'pool_pre_ping': True}
+    # In-memory SQLite shares one connection through a StaticPool, which has no size to tune
+    if is_memory_sqlite(uri):
+        return options
+    options.update(
+        pool_size=int(environ.get('DB_POOL_SIZE', 10)),
+        max_overflow=int(environ.get('DB_MAX_OVERFLOW', 20)),
+        pool_timeout=int(environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(environ.get('DB_POOL_RECYCLE', 1800)),
+    )
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the given PRAGMAs on every new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def copy_sqlite_database(source_uri, target_uri):
+    """Copy one SQLite database file over another with the online backup API.
+
+    A local stand-in for replication: the copy is a consistent snapshot even
+    while the source is being written, and it is written into the target in
+    one transaction, so the target's readers see either the old contents or
+    the new ones.
+    """
+    paths = []
+    for uri in (source_uri, target_uri):
+        url = make_url(uri)
+        if url.get_backend_name() != 'sqlite' or is_memory_sqlite(uri):
+            raise ValueError(f'{url.render_as_string()} is not a SQLite database file')
+        paths.append(url.database)
+    source = sqlite3.connect(paths[0])
+    target = sqlite3.connect(paths[1])
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,114 @@
+"""Bounded in-memory change log backing the /api/events server-sent-events feed.
+
+Every committed task or comment change is appended with a monotonically
+increasing id. Streams resume from a Last-Event-ID; when that id has already
+been evicted from the log (or predates a restart) the client is told to
+resynchronize instead. Only coherent within one process, like MemoryCache.
+"""
+from collections import deque, namedtuple
+import asyncio
+import json
+import threading
+
+Event = namedtuple('Event', 'id type data')
+
+
+class EventLog:
+    def __init__(self, max_events=1000):
+        self.max_events = max_events
+        self._events = deque(maxlen=max_events)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self._async_waiters = []
+        self._connections = 0
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, events):
+        """Append (type, data) pairs and wake every waiting stream; returns the last id."""
+        with self._condition:
+            for event_type, data in events:
+                self._last_id += 1
+                self._events.append(Event(self._last_id, event_type, data))
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+            last_id = self._last_id
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # the waiter's event loop has already closed
+        return last_id
+
+    def read_since(self, last_id):
+        """Return (events after last_id, complete).
+
+        complete is False when events after last_id were already evicted, or
+        last_id is from another process lifetime, so the caller cannot catch up.
+        """
+        with self._condition:
+            if last_id > self._last_id:
+                return [], False
+            oldest_id = self._events[0].id if self._events else self._last_id + 1
+            if last_id < oldest_id - 1:
+                return [], False
+            return [event for event in self._events if event.id > last_id], True
+
+    def wait(self, last_id, timeout):
+        """Block until an event newer than last_id exists; False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._last_id > last_id, timeout)
+
+    async def wait_async(self, last_id, timeout):
+        """Like wait(), but suspends the calling coroutine instead of a thread."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._condition:
+            if self._last_id > last_id:
+                return True
+            self._async_waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._condition:
+                if (loop, future) in self._async_waiters:
+                    self._async_waiters.remove((loop, future))
+
+    def connect(self, max_connections):
+        with self._condition:
+            if self._connections >= max_connections:
+                return False
+            self._connections += 1
+            return True
+
+    def disconnect(self):
+        with self._condition:
+            self._connections -= 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'last_id': self._last_id,
+                'buffered': len(self._events),
+                'max_events': self.max_events,
+                'connections': self._connections,
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def format_event(event_type, data, event_id=None):
+    """Encode one message in the text/event-stream wire format."""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event_type}')
+    lines.extend(f'data: {line}' for line in json.dumps(data).splitlines())
+    return '\n'.join(lines) + '\n\n'
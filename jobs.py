@@ -0,0 +1,128 @@
+"""Worker threads for background jobs recorded in the database.
+
+The pool holds no jobs itself: workers claim queued rows through the
+claim_next callable, so queued jobs survive restarts and several processes
+can share one table. notify() wakes an idle worker as soon as a job is
+committed; otherwise workers look for work every poll_interval seconds.
+
+While a job runs, the optional heartbeat callable is called with its id every
+heartbeat_interval seconds from a separate thread, so the job's owner can show
+it is still alive however long the job takes.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, claim_next, run, workers=2, poll_interval=1.0, heartbeat=None, heartbeat_interval=10.0):
+        self.claim_next = claim_next
+        self.run = run
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.heartbeat_interval = heartbeat_interval
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._wakeups = 0
+        self._running = 0
+        self._completed = 0
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    def start(self):
+        """Start the worker threads once; a pool with no workers only runs jobs via run_pending()."""
+        with self._condition:
+            if self._threads or self.workers < 1:
+                return False
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Ask workers to exit after their current job and wait up to timeout seconds for them."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def notify(self):
+        with self._condition:
+            self._wakeups += 1
+            self._condition.notify()
+
+    def run_pending(self):
+        """Run queued jobs in the calling thread until none are left; returns how many ran."""
+        count = 0
+        while True:
+            job_id = self.claim_next()
+            if job_id is None:
+                return count
+            self._execute(job_id)
+            count += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': len(self._threads),
+                'running': self._running,
+                'completed': self._completed,
+            }
+
+    def _execute(self, job_id):
+        with self._condition:
+            self._running += 1
+        finished = threading.Event()
+        beat = None
+        if self.heartbeat is not None:
+            beat = threading.Thread(target=self._beat, args=(job_id, finished),
+                                    name=f'job-heartbeat-{job_id}', daemon=True)
+            beat.start()
+        try:
+            self.run(job_id)
+        finally:
+            finished.set()
+            if beat is not None:
+                beat.join()
+            with self._condition:
+                self._running -= 1
+                self._completed += 1
+
+    def _beat(self, job_id, finished):
+        while not finished.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat(job_id)
+            except Exception:
+                # A missed beat is only fatal if they keep failing for the stale timeout
+                logger.exception('Job heartbeat error')
+
+    def _work(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                seen = self._wakeups
+            try:
+                job_id = self.claim_next()
+                if job_id is not None:
+                    self._execute(job_id)
+                    continue
+            except Exception:
+                # run() records job failures itself; this is the database being unavailable
+                logger.exception('Job worker error')
+            with self._condition:
+                if self._stopping:
+                    return
+                if self._wakeups == seen:
+                    self._condition.wait(self.poll_interval)
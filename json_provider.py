@@ -0,0 +1,65 @@
+"""JSON providers for the Flask app: orjson when it is installed, the stdlib otherwise.
+
+JSON_PROVIDER selects one ('auto', 'orjson' or 'stdlib'); 'auto' uses orjson
+if it can be imported. Both encode every value the API returns the same way,
+so clients cannot tell them apart beyond orjson writing non-ASCII characters
+as UTF-8 instead of \\u escapes.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Datetimes are passed through to the stdlib provider's default() so they
+    are still encoded as HTTP dates, and keys are sorted as jsonify sorts them.
+    """
+    name = 'orjson'
+
+    def __init__(self, app):
+        if orjson is None:
+            raise RuntimeError('JSON_PROVIDER "orjson" requires the orjson package (pip install orjson)')
+        super().__init__(app)
+
+    def _options(self, indent=False):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        # Encoded straight to bytes: no intermediate str for the response body
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider, built on the json module."""
+    name = 'stdlib'
+
+
+def create_json_provider(app):
+    """Build the provider selected by JSON_PROVIDER ('auto', 'orjson' or 'stdlib')."""
+    provider = app.config.get('JSON_PROVIDER', 'auto')
+    if provider == 'auto':
+        provider = 'stdlib' if orjson is None else 'orjson'
+    if provider == 'orjson':
+        return OrjsonProvider(app)
+    if provider == 'stdlib':
+        return StdlibJSONProvider(app)
+    raise ValueError(f'Unknown JSON_PROVIDER: {provider!r}')
@@ -0,0 +1,116 @@
+"""Baseline schema
+
+Creates the tables as they stood before migrations were introduced. Databases
+that were set up by the old create_all() at import time already have some or
+all of them, so every step checks what exists first; running this against such
+a database only fills in what is missing and stamps it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table_if_missing(name, *columns):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+
+def upgrade():
+    create_table_if_missing(
+        'task',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('completed', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('revision', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table_if_missing(
+        'comment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('revision', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['task.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table_if_missing(
+        'table_revision',
+        sa.Column('table_name', sa.String(length=50), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name'),
+    )
+    create_table_if_missing(
+        'tombstone',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('ref_id', sa.Integer(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table_if_missing(
+        'stat_counter',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    create_table_if_missing(
+        'job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    bind = op.get_bind()
+    # Databases created before /api/sync get the columns; existing rows start at revision 0
+    for table_name in ('task', 'comment'):
+        columns = {column['name'] for column in sa.inspect(bind).get_columns(table_name)}
+        if 'revision' not in columns:
+            op.add_column(table_name, sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+    if search.is_supported(bind) and not search.index_exists(bind):
+        search.create_index(bind)
+
+    # Databases created before the counters existed start from a full recount
+    if bind.execute(sa.text('SELECT count(*) FROM stat_counter')).scalar() == 0:
+        bind.execute(sa.text("""
+            INSERT INTO stat_counter (name, value)
+            SELECT 'tasks_total', count(*) FROM task
+            UNION ALL SELECT 'tasks_completed', coalesce(sum(CAST(completed AS INTEGER)), 0) FROM task
+            UNION ALL SELECT 'comments_total', count(*) FROM comment
+        """))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if search.is_supported(bind):
+        search.drop_index(bind)
+    for table_name in ('job', 'stat_counter', 'tombstone', 'table_revision', 'comment', 'task'):
+        op.drop_table(table_name)
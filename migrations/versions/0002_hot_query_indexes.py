@@ -0,0 +1,50 @@
+"""Indexes for the hot queries
+
+create_all() only ever created indexes together with a new table, so databases
+whose tables predate an index never got it. This adds whichever are missing:
+the keyset pagination indexes on task, the per-task and per-day comment
+lookups, the /api/sync revision scans and the job claim index.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_task_created_at_id', 'task', ['created_at', 'id']),
+    ('ix_task_updated_at_id', 'task', ['updated_at', 'id']),
+    ('ix_task_completed_created_at_id', 'task', ['completed', 'created_at', 'id']),
+    ('ix_task_completed_updated_at_id', 'task', ['completed', 'updated_at', 'id']),
+    ('ix_task_revision', 'task', ['revision']),
+    ('ix_comment_task_id', 'comment', ['task_id']),
+    ('ix_comment_created_at', 'comment', ['created_at']),
+    ('ix_comment_revision', 'comment', ['revision']),
+    ('ix_tombstone_revision', 'tombstone', ['revision']),
+    ('ix_job_status_id', 'job', ['status', 'id']),
+)
+
+
+def existing_indexes(table_name):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table_name)}
+
+
+def upgrade():
+    for name, table_name, columns in INDEXES:
+        if name not in existing_indexes(table_name):
+            op.create_index(name, table_name, columns)
+
+
+def downgrade():
+    for name, table_name, columns in reversed(INDEXES):
+        if name in existing_indexes(table_name):
+            op.drop_index(name, table_name=table_name)
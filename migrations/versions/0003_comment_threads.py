@@ -0,0 +1,38 @@
+"""Comment thread index and denormalized comment counts
+
+Replaces ix_comment_task_id with (task_id, created_at, id), which serves a
+task's comments in page order and, by its prefix, everything the old index
+did. Adds task.comment_count and fills it from the comment table.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_comment_task_id_created_at_id', 'comment', ['task_id', 'created_at', 'id'])
+    op.drop_index('ix_comment_task_id', table_name='comment')
+    op.add_column('task', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE task SET comment_count = (SELECT count(*) FROM comment WHERE comment.task_id = task.id) '
+        'WHERE EXISTS (SELECT 1 FROM comment WHERE comment.task_id = task.id)'
+    )
+
+
+def downgrade():
+    # A plain DROP COLUMN (SQLite 3.35+): rebuilding the table in batch mode would
+    # drop the search triggers on it
+    op.drop_column('task', 'comment_count')
+    op.create_index('ix_comment_task_id', 'comment', ['task_id'])
+    op.drop_index('ix_comment_task_id_created_at_id', table_name='comment')
@@ -0,0 +1,52 @@
+"""Archive tables for old completed tasks
+
+archived_task and archived_comment hold the tasks the archive policy moves
+out of the task and comment tables, with the ids they had there.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'archived_task',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('completed', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_archived_task_created_at_id', 'archived_task', ['created_at', 'id'])
+    op.create_index('ix_archived_task_updated_at_id', 'archived_task', ['updated_at', 'id'])
+    op.create_table(
+        'archived_comment',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['task_id'], ['archived_task.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_archived_comment_task_id_created_at_id', 'archived_comment', ['task_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_table('archived_comment')
+    op.drop_table('archived_task')
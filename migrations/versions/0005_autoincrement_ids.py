@@ -0,0 +1,75 @@
+"""Never reuse task and comment ids
+
+SQLite gives a new INTEGER PRIMARY KEY row the highest id in use plus one, so
+once the newest rows are archived or deleted their ids are handed out again:
+archiving such a row fails on archived_task's primary key, restores answer 409,
+and /api/sync clients can take a new row for one they saw deleted. AUTOINCREMENT
+keeps ids increasing; each sequence starts past every id already archived or
+tombstoned.
+
+AUTOINCREMENT can only be given in CREATE TABLE, so both tables are rebuilt.
+That needs foreign keys off, which SQLite only allows outside a transaction,
+and drops the search triggers on the tables, which are created again.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Each table with the archive table that holds its archived rows
+TABLES = (('task', 'archived_task'), ('comment', 'archived_comment'))
+
+
+def upgrade():
+    rebuild_tables(autoincrement=True)
+
+
+def downgrade():
+    rebuild_tables(autoincrement=False)
+
+
+def rebuild_tables(autoincrement):
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    with op.get_context().autocommit_block():
+        foreign_keys = bind.execute(sa.text('PRAGMA foreign_keys')).scalar()
+        op.execute('PRAGMA foreign_keys = OFF')
+        try:
+            op.execute('BEGIN')
+            try:
+                for table_name, _ in TABLES:
+                    with op.batch_alter_table(table_name, recreate='always',
+                                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+                        pass
+                for table_name, archive_table in TABLES:
+                    op.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table_name}'")
+                    if autoincrement:
+                        op.execute(
+                            f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table_name}', max("
+                            f"(SELECT coalesce(max(id), 0) FROM {table_name}), "
+                            f"(SELECT coalesce(max(id), 0) FROM {archive_table}), "
+                            f"(SELECT coalesce(max(ref_id), 0) FROM tombstone WHERE kind = '{table_name}'))"
+                        )
+                if search.is_supported(bind) and search.index_exists(bind):
+                    search.create_index(bind, populate=False)
+                if bind.execute(sa.text('PRAGMA foreign_key_check')).first() is not None:
+                    raise RuntimeError('Foreign key violations after rebuilding the task and comment tables')
+                op.execute('COMMIT')
+            except Exception:
+                op.execute('ROLLBACK')
+                raise
+        finally:
+            op.execute(f'PRAGMA foreign_keys = {"ON" if foreign_keys else "OFF"}')
@@ -0,0 +1,29 @@
+"""Job heartbeats
+
+Workers stamp job.heartbeat_at while a job runs, so only jobs whose worker
+has stopped sending heartbeats are failed as stale, not long jobs still
+running in another process.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('job', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job') as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,212 @@
+"""Per-client rate limits and admission control for writes.
+
+Rate limits are token buckets: each client has a bucket per budget ('read'
+and 'write') holding up to `burst` tokens, refilled at `rate` tokens per
+second, and each request takes one. MemoryBucketStore keeps the buckets in
+process memory, so limits apply per worker process; RedisBucketStore shares
+them between processes.
+
+ConcurrencyLimiter bounds how many writes run at once and how many may wait
+for a slot, so a burst of writes is shed instead of piling up behind the
+single SQLite writer.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class MemoryBucketStore:
+    """Token buckets in process memory, least recently used clients evicted first.
+
+    An evicted client simply starts again with a full bucket.
+    """
+    backend = 'memory'
+
+    def __init__(self, max_clients=100000, clock=time.monotonic):
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """Take cost tokens from key's bucket; returns (allowed, tokens left)."""
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.backend, 'clients': len(self._buckets)}
+
+
+# Refill and take in one round trip, timed by the Redis clock so that every
+# process sees the same bucket state. Returns {allowed, tokens left as a string}.
+TAKE_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared between worker processes through Redis.
+
+    Idle buckets expire once they would have refilled, so Redis only holds
+    clients seen recently.
+    """
+    backend = 'redis'
+
+    def __init__(self, url, prefix='task-manager:ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_BACKEND "redis" requires the redis package (pip install redis)')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(allowed), float(tokens)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {'backend': self.backend}
+
+
+class RateLimiter:
+    """Named budgets of (rate per second, burst) applied to client keys."""
+
+    def __init__(self, store, budgets):
+        self.store = store
+        self.budgets = dict(budgets)
+        self._lock = threading.Lock()
+        self._allowed = dict.fromkeys(self.budgets, 0)
+        self._limited = dict.fromkeys(self.budgets, 0)
+
+    def take(self, client, budget):
+        """Take a token for client from budget; returns (allowed, seconds until one is available)."""
+        rate, burst = self.budgets[budget]
+        allowed, tokens = self.store.take(f'{budget}:{client}', rate, burst)
+        with self._lock:
+            if allowed:
+                self._allowed[budget] += 1
+            else:
+                self._limited[budget] += 1
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'budgets': {name: {'rate': rate, 'burst': burst} for name, (rate, burst) in self.budgets.items()},
+                'allowed': dict(self._allowed),
+                'limited': dict(self._limited),
+            }
+        stats.update(self.store.stats())
+        return stats
+
+
+class ConcurrencyLimiter:
+    """Admit max_active callers at once and let up to max_queued more wait.
+
+    A caller arriving with the queue full, or still waiting after timeout
+    seconds, is refused; the caller sheds the request.
+    """
+
+    def __init__(self, max_active, max_queued=0, timeout=5.0):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def try_acquire(self):
+        """Take a slot if one is free right now, without queueing."""
+        with self._condition:
+            if self._active < self.max_active and not self._queued:
+                self._active += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if there is room; False means the caller was refused."""
+        with self._condition:
+            if self._active < self.max_active and not self._queued:
+                self._active += 1
+                return True
+            if self._queued >= self.max_queued:
+                self._rejected += 1
+                return False
+            self._queued += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self._active < self.max_active, self.timeout)
+            finally:
+                self._queued -= 1
+            if not admitted:
+                self._timed_out += 1
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self._active,
+                'queued': self._queued,
+                'max_active': self.max_active,
+                'max_queued': self.max_queued,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+            }
+
+
+def create_rate_limiter(config):
+    """Build the limiter for RATELIMIT_BACKEND ('memory' or 'redis') with the read and write budgets."""
+    backend = config.get('RATELIMIT_BACKEND', 'memory')
+    if backend == 'memory':
+        store = MemoryBucketStore(max_clients=config.get('RATELIMIT_MAX_CLIENTS', 100000))
+    elif backend == 'redis':
+        store = RedisBucketStore(config['RATELIMIT_REDIS_URL'])
+    else:
+        raise ValueError(f'Unknown RATELIMIT_BACKEND: {backend!r}')
+    return RateLimiter(store, {
+        'read': (config['RATELIMIT_READ_RATE'], config['RATELIMIT_READ_BURST']),
+        'write': (config['RATELIMIT_WRITE_RATE'], config['RATELIMIT_WRITE_BURST']),
+    })
@@ -0,0 +1,131 @@
+"""Read replicas: choosing one for each read, and keeping writers on the primary until replicas catch up.
+
+ReplicaSet hands out replica names round robin, skipping those whose last
+health check failed. Each replica is checked again once `check_interval`
+seconds have passed since its previous check, so a replica that recovers
+is used again without a restart. A check also reports the replica's
+position (how far it has replicated), and a read may ask for a replica at
+or past a given position. When no replica qualifies, reads fall back to the
+primary.
+
+ReadYourWrites remembers the position each client's latest write reached.
+Its reads go to a replica that has replicated at least that far, else to
+the primary, so a client never reads from a replica that has not yet
+received its own write, however long replication takes. Like
+MemoryBucketStore in ratelimit.py it lives in process memory, so it covers
+the writes made through the same worker process.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class ReplicaSet:
+    """Round-robin choice among named replicas, with periodic health checks.
+
+    check(name) returns the replica's position when it may serve reads and
+    None when it may not; an exception counts as None.
+    """
+
+    def __init__(self, names, check, check_interval=5.0, clock=time.monotonic):
+        self.names = list(names)
+        self.check_interval = check_interval
+        self._check = check
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+        self._positions = dict.fromkeys(self.names)
+        self._checked_at = {}
+        self._errors = {}
+        self._reads = dict.fromkeys(self.names, 0)
+        self._primary_fallbacks = 0
+        self._writer_fallbacks = 0
+
+    def choose(self, min_position=None):
+        """Return the next healthy replica at or past min_position, or None to read from the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.names) if self.names else 0
+        any_healthy = False
+        for offset in range(len(self.names)):
+            name = self.names[(start + offset) % len(self.names)]
+            if not self.is_healthy(name):
+                continue
+            any_healthy = True
+            if min_position is None or self._positions[name] >= min_position:
+                with self._lock:
+                    self._reads[name] += 1
+                return name
+        with self._lock:
+            if any_healthy:
+                self._writer_fallbacks += 1
+            else:
+                self._primary_fallbacks += 1
+        return None
+
+    def is_healthy(self, name):
+        """Return the replica's health, checking it first if the last check is too old."""
+        now = self._clock()
+        with self._lock:
+            checked_at = self._checked_at.get(name)
+            due = checked_at is None or now - checked_at >= self.check_interval
+            if due:
+                # Claimed under the lock so concurrent requests do not all run the check
+                self._checked_at[name] = now
+        if due:
+            try:
+                position, error = self._check(name), None
+            except Exception as exc:
+                position, error = None, str(exc) or type(exc).__name__
+            with self._lock:
+                self._positions[name] = position
+                self._errors[name] = error
+        return self._positions[name] is not None
+
+    def mark_failed(self, name, error=None):
+        """Take a replica out of rotation until its next health check."""
+        with self._lock:
+            self._positions[name] = None
+            self._checked_at[name] = self._clock()
+            self._errors[name] = error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'replicas': {
+                    name: {
+                        'healthy': self._positions[name] is not None,
+                        'position': self._positions[name],
+                        'reads': self._reads[name],
+                        'error': self._errors.get(name),
+                    }
+                    for name in self.names
+                },
+                'primary_fallbacks': self._primary_fallbacks,
+                'writer_fallbacks': self._writer_fallbacks,
+            }
+
+
+class ReadYourWrites:
+    """The position each client's latest write reached, least recent writers evicted first."""
+
+    def __init__(self, max_clients=100000):
+        self.max_clients = max_clients
+        self._positions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record_write(self, client, position):
+        with self._lock:
+            self._positions[client] = max(position, self._positions.get(client, position))
+            self._positions.move_to_end(client)
+            while len(self._positions) > self.max_clients:
+                self._positions.popitem(last=False)
+
+    def position(self, client):
+        """The position a replica must have reached to serve the client, or None if any will do."""
+        with self._lock:
+            return self._positions.get(client)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked_clients': len(self._positions)}
@@ -0,0 +1,146 @@
+"""SQLite FTS5 full-text index over task titles, descriptions and comments.
+
+Tasks and comments share one FTS5 table. Each document's rowid is derived
+from its source row (2 * id for tasks, 2 * id + 1 for comments) so the
+triggers that keep the index in sync can update and delete by rowid instead
+of scanning the index.
+"""
+import html
+
+from sqlalchemy import text
+
+SEARCH_TABLE = 'search_index'
+
+CREATE_STATEMENTS = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        kind UNINDEXED, ref_id UNINDEXED, task_id UNINDEXED, title, body,
+        tokenize = 'porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON task BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, kind, ref_id, task_id, title, body)
+        VALUES (new.id * 2, 'task', new.id, new.id, new.title, coalesce(new.description, ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF title, description ON task BEGIN
+        UPDATE {SEARCH_TABLE} SET title = new.title, body = coalesce(new.description, '')
+        WHERE rowid = new.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON task BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comment_search_insert AFTER INSERT ON comment BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, kind, ref_id, task_id, title, body)
+        VALUES (new.id * 2 + 1, 'comment', new.id, new.task_id, '', new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comment_search_update AFTER UPDATE OF content ON comment BEGIN
+        UPDATE {SEARCH_TABLE} SET body = new.content WHERE rowid = new.id * 2 + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comment_search_delete AFTER DELETE ON comment BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1;
+    END""",
+)
+
+POPULATE_STATEMENTS = (
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, kind, ref_id, task_id, title, body)
+        SELECT id * 2, 'task', id, id, title, coalesce(description, '') FROM task""",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, kind, ref_id, task_id, title, body)
+        SELECT id * 2 + 1, 'comment', id, task_id, '', content FROM comment""",
+)
+
+# bm25 column weights: kind, ref_id, task_id, title, body
+SEARCH_QUERY = text(f"""
+    SELECT kind, ref_id, task_id,
+           bm25({SEARCH_TABLE}, 0.0, 0.0, 0.0, 10.0, 1.0) AS score,
+           highlight({SEARCH_TABLE}, 3, :open_mark, :close_mark) AS title,
+           snippet({SEARCH_TABLE}, 4, :open_mark, :close_mark, '...', :snippet_tokens) AS snippet
+    FROM {SEARCH_TABLE}
+    WHERE {SEARCH_TABLE} MATCH :query
+    ORDER BY score, rowid
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def is_supported(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def is_index_table(name):
+    """True for the FTS table and the shadow tables SQLite creates for it."""
+    return name == SEARCH_TABLE or name.startswith(SEARCH_TABLE + '_')
+
+
+def index_exists(connection):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': SEARCH_TABLE},
+    ).first() is not None
+
+
+def create_index(connection, populate=True):
+    """Create the FTS table and sync triggers, filling it from existing rows."""
+    for statement in CREATE_STATEMENTS:
+        connection.execute(text(statement))
+    if populate:
+        for statement in POPULATE_STATEMENTS:
+            connection.execute(text(statement))
+
+
+def drop_index(connection):
+    for trigger in ('task_search_insert', 'task_search_update', 'task_search_delete',
+                    'comment_search_insert', 'comment_search_update', 'comment_search_delete'):
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    connection.execute(text(f'DROP TABLE IF EXISTS {SEARCH_TABLE}'))
+
+
+def rebuild_index(connection):
+    drop_index(connection)
+    create_index(connection)
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+
+
+def build_match_query(user_query):
+    """Turn free text into an FTS5 query that cannot raise syntax errors.
+
+    Every whitespace-separated term is quoted (all must match); a trailing
+    '*' on a term keeps prefix matching.
+    """
+    terms = []
+    for term in user_query.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+# FTS5 wraps matches in these control characters, which stand in for the marks
+# until the indexed text around them has been HTML-escaped
+OPEN_SENTINEL = '\x02'
+CLOSE_SENTINEL = '\x03'
+
+
+def mark_matches(marked, open_mark, close_mark):
+    """HTML-escape highlighted text, then turn the sentinels into open_mark and close_mark."""
+    return html.escape(marked).replace(OPEN_SENTINEL, open_mark).replace(CLOSE_SENTINEL, close_mark)
+
+
+def search(connection, user_query, limit, offset, open_mark='<mark>', close_mark='</mark>', snippet_tokens=16):
+    """Ranked matches for user_query, with title and snippet safe to render as HTML.
+
+    Everything but the marks is escaped, since titles and bodies are user text.
+    """
+    query = build_match_query(user_query)
+    if not query:
+        return []
+    rows = connection.execute(SEARCH_QUERY, {
+        'query': query,
+        'limit': limit,
+        'offset': offset,
+        'open_mark': OPEN_SENTINEL,
+        'close_mark': CLOSE_SENTINEL,
+        'snippet_tokens': snippet_tokens,
+    }).mappings().all()
+    return [
+        dict(row, title=mark_matches(row['title'], open_mark, close_mark),
+             snippet=mark_matches(row['snippet'], open_mark, close_mark))
+        for row in rows
+    ]
@@ -0,0 +1,48 @@
+"""Run the API under uvicorn using the ASGI entry point in asgi.py.
+
+    python serve.py --port 5000 --workers 4
+
+Each worker is a separate process with its own connection pool, event log and
+(in-memory) cache; use CACHE_BACKEND=redis when running more than one. The
+database schema is upgraded to the latest migration before the workers start.
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)))
+    parser.add_argument('--limit-concurrency', type=int, default=None,
+                        help='connections per worker before uvicorn answers 503')
+    parser.add_argument('--db-concurrency', type=int, default=None,
+                        help='database calls in flight per worker (ASGI_DB_CONCURRENCY)')
+    parser.add_argument('--wsgi-threads', type=int, default=None,
+                        help='threads for routes delegated to Flask (ASGI_WSGI_THREADS)')
+    parser.add_argument('--reload', action='store_true')
+    parser.add_argument('--no-migrate', dest='migrate', action='store_false',
+                        help='skip upgrading the database schema before the workers start')
+    args = parser.parse_args()
+
+    # Read by app.py at import time, in every worker process
+    if args.db_concurrency is not None:
+        os.environ['ASGI_DB_CONCURRENCY'] = str(args.db_concurrency)
+    if args.wsgi_threads is not None:
+        os.environ['ASGI_WSGI_THREADS'] = str(args.wsgi_threads)
+
+    # Once here rather than in each worker, so workers never race to run DDL
+    if args.migrate:
+        from app import app, upgrade_schema
+        with app.app_context():
+            upgrade_schema()
+
+    uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                limit_concurrency=args.limit_concurrency, reload=args.reload, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
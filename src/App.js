@@ -1,10 +1,68 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import TaskForm from './components/TaskForm';
 import TaskList from './components/TaskList';
 import './App.css';
 
 const API_BASE_URL = 'http://localhost:5000/api';
+const TASKS_PAGE_SIZE = 200;
+// The listing embeds the first comments of each task; the rest load on demand
+const COMMENTS_PAGE_SIZE = 100;
+const CHANGE_EVENTS = [
+  'task.created', 'task.updated', 'task.deleted',
+  'comment.created', 'comment.updated', 'comment.deleted'
+];
+
+// Apply one change from /api/events (or from our own write) to the task list.
+// Every change is idempotent, because our own writes also come back on the stream.
+function applyChange(tasks, type, data) {
+  switch (type) {
+    case 'task.created':
+      if (tasks.some(task => task.id === data.id)) {
+        return applyChange(tasks, 'task.updated', data);
+      }
+      return [...tasks, { comments: [], comment_count: 0, ...data }];
+    case 'task.updated':
+      // Bulk updates carry only the changed fields, so merge rather than replace
+      return tasks.map(task =>
+        task.id === data.id && data.updated_at >= task.updated_at ? { ...task, ...data } : task
+      );
+    case 'task.deleted':
+      return tasks.filter(task => task.id !== data.id);
+    case 'comment.created':
+      return tasks.map(task => {
+        if (task.id !== data.task_id || (task.comments || []).some(comment => comment.id === data.id)) {
+          return task;
+        }
+        const comments = [...(task.comments || []), data];
+        return { ...task, comments, comment_count: (task.comment_count ?? comments.length - 1) + 1 };
+      });
+    case 'comment.updated':
+      return tasks.map(task => task.id !== data.task_id ? task : {
+        ...task,
+        comments: (task.comments || []).map(comment => comment.id === data.id ? data : comment)
+      });
+    case 'comment.deleted':
+      return tasks.map(task => {
+        if (task.id !== data.task_id) {
+          return task;
+        }
+        const comments = (task.comments || []).filter(comment => comment.id !== data.id);
+        return { ...task, comments, comment_count: Math.max((task.comment_count ?? comments.length + 1) - 1, 0) };
+      });
+    default:
+      return tasks;
+  }
+}
+
+// Merge one page of GET /api/tasks/<id>/comments into a task. The page may repeat
+// comments already held (the embedded ones, or ones that arrived on the stream).
+function mergeComments(task, page) {
+  const known = new Set((task.comments || []).map(comment => comment.id));
+  const comments = [...(task.comments || []), ...page.comments.filter(comment => !known.has(comment.id))]
+    .sort((a, b) => a.created_at.localeCompare(b.created_at) || a.id - b.id);
+  return { ...task, comments, comments_cursor: page.next_cursor };
+}
 
 function App() {
   const [tasks, setTasks] = useState([]);
@@ -12,21 +70,70 @@ function App() {
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
   const [isCreating, setIsCreating] = useState(false);
+  // Changes received while a full fetch is in flight are replayed on top of it
+  const pendingChanges = useRef(null);
+  // Comment deletions already applied, so the echo from the stream is ignored
+  const deletedComments = useRef(new Set());
+
+  const applyChanges = (changes) => {
+    const fresh = changes.filter(({ type, data }) => {
+      if (type !== 'comment.deleted') {
+        return true;
+      }
+      if (deletedComments.current.has(data.id)) {
+        return false;
+      }
+      deletedComments.current.add(data.id);
+      return true;
+    });
+    setTasks(current => fresh.reduce((tasks, { type, data }) => applyChange(tasks, type, data), current));
+  };
+
+  const receiveChange = (type, data) => {
+    if (pendingChanges.current) {
+      pendingChanges.current.push({ type, data });
+    } else {
+      applyChanges([{ type, data }]);
+    }
+  };
 
   useEffect(() => {
-    fetchTasks();
+    // The stream sends 'ready' once subscribed, so nothing committed between the
+    // initial fetch and the subscription is missed; 'resync' means events were lost
+    const source = new EventSource(`${API_BASE_URL}/events`);
+    source.addEventListener('ready', () => fetchTasks());
+    source.addEventListener('resync', () => fetchTasks());
+    CHANGE_EVENTS.forEach(type => {
+      source.addEventListener(type, (event) => receiveChange(type, JSON.parse(event.data)));
+    });
+    return () => source.close();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
   const fetchTasks = async () => {
+    pendingChanges.current = pendingChanges.current || [];
     try {
       setLoading(true);
-      const response = await axios.get(`${API_BASE_URL}/tasks`);
-      setTasks(response.data);
+      // Walk the keyset-paginated listing until there is no next page
+      const allTasks = [];
+      let cursor = null;
+      do {
+        const response = await axios.get(`${API_BASE_URL}/tasks`, {
+          params: { limit: TASKS_PAGE_SIZE, cursor, include: 'comments' }
+        });
+        allTasks.push(...response.data.tasks);
+        cursor = response.data.next_cursor;
+      } while (cursor);
+      deletedComments.current.clear();
+      setTasks(allTasks);
       setError(null);
     } catch (err) {
       setError('Failed to fetch tasks');
       console.error('Error fetching tasks:', err);
     } finally {
+      const changes = pendingChanges.current;
+      pendingChanges.current = null;
+      applyChanges(changes);
       setLoading(false);
     }
   };
@@ -35,7 +142,7 @@ function App() {
     try {
       setIsCreating(true);
       const response = await axios.post(`${API_BASE_URL}/tasks`, taskData);
-      setTasks([...tasks, response.data]);
+      applyChanges([{ type: 'task.created', data: response.data }]);
       setSuccess('Task created successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -50,9 +157,7 @@ function App() {
   const handleTaskUpdate = async (taskId, updatedData) => {
     try {
       const response = await axios.put(`${API_BASE_URL}/tasks/${taskId}`, updatedData);
-      setTasks(tasks.map(task => 
-        task.id === taskId ? response.data : task
-      ));
+      applyChanges([{ type: 'task.updated', data: response.data }]);
       setSuccess('Task updated successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -65,7 +170,7 @@ function App() {
   const handleTaskDelete = async (taskId) => {
     try {
       await axios.delete(`${API_BASE_URL}/tasks/${taskId}`);
-      setTasks(tasks.filter(task => task.id !== taskId));
+      applyChanges([{ type: 'task.deleted', data: { id: taskId } }]);
       setSuccess('Task deleted successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -81,8 +186,7 @@ function App() {
         ...commentData,
         task_id: taskId
       });
-      // Refresh tasks to get updated comments
-      fetchTasks();
+      applyChanges([{ type: 'comment.created', data: response.data }]);
       setSuccess('Comment added successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -92,11 +196,26 @@ function App() {
     }
   };
 
+  const handleCommentsLoad = async (taskId) => {
+    // The cursor lives on the task, so after a full fetch replaces the task the
+    // next page starts from the first comment again
+    const task = tasks.find(task => task.id === taskId);
+    try {
+      const response = await axios.get(`${API_BASE_URL}/tasks/${taskId}/comments`, {
+        params: { limit: COMMENTS_PAGE_SIZE, cursor: task && task.comments_cursor }
+      });
+      setTasks(current => current.map(task => task.id === taskId ? mergeComments(task, response.data) : task));
+      setError(null);
+    } catch (err) {
+      setError('Failed to load comments');
+      console.error('Error loading comments:', err);
+    }
+  };
+
   const handleCommentUpdate = async (commentId, updatedData) => {
     try {
-      await axios.put(`${API_BASE_URL}/comments/${commentId}`, updatedData);
-      // Refresh tasks to get updated comments
-      fetchTasks();
+      const response = await axios.put(`${API_BASE_URL}/comments/${commentId}`, updatedData);
+      applyChanges([{ type: 'comment.updated', data: response.data }]);
       setSuccess('Comment updated successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -109,8 +228,10 @@ function App() {
   const handleCommentDelete = async (commentId) => {
     try {
       await axios.delete(`${API_BASE_URL}/comments/${commentId}`);
-      // Refresh tasks to get updated comments
-      fetchTasks();
+      const task = tasks.find(task => (task.comments || []).some(comment => comment.id === commentId));
+      if (task) {
+        applyChanges([{ type: 'comment.deleted', data: { id: commentId, task_id: task.id } }]);
+      }
       setSuccess('Comment deleted successfully!');
       setError(null);
       setTimeout(() => setSuccess(null), 3000);
@@ -150,6 +271,7 @@ function App() {
           onTaskUpdate={handleTaskUpdate}
           onTaskDelete={handleTaskDelete}
           onCommentCreate={handleCommentCreate}
+          onCommentsLoad={handleCommentsLoad}
           onCommentUpdate={handleCommentUpdate}
           onCommentDelete={handleCommentDelete}
           loading={loading}
@@ -1,9 +1,10 @@
 import React, { useState } from 'react';
 import CommentList from './CommentList';
 
-const CommentSection = ({ task, onCommentCreate, onCommentUpdate, onCommentDelete }) => {
+const CommentSection = ({ task, onCommentCreate, onCommentsLoad, onCommentUpdate, onCommentDelete }) => {
   const [newComment, setNewComment] = useState('');
   const [isAddingComment, setIsAddingComment] = useState(false);
+  const [isLoadingComments, setIsLoadingComments] = useState(false);
 
   const handleAddComment = async (e) => {
     e.preventDefault();
@@ -15,14 +16,23 @@ const CommentSection = ({ task, onCommentCreate, onCommentUpdate, onCommentDelet
     }
   };
 
-  // Get comments for this task (assuming comments are stored in task object)
+  const handleLoadMore = async () => {
+    setIsLoadingComments(true);
+    await onCommentsLoad(task.id);
+    setIsLoadingComments(false);
+  };
+
+  // Comments are embedded by GET /api/tasks?include=comments, capped per task;
+  // the rest are paged in from GET /api/tasks/<id>/comments
   const comments = task.comments || [];
+  const commentCount = task.comment_count ?? comments.length;
+  const hiddenCount = commentCount - comments.length;
 
   return (
     <div className="comment-section">
       <div className="comment-header">
         <h3>💬 Comments</h3>
-        <span className="comment-count">{comments.length} comment{comments.length !== 1 ? 's' : ''}</span>
+        <span className="comment-count">{commentCount} comment{commentCount !== 1 ? 's' : ''}</span>
       </div>
       
       <form onSubmit={handleAddComment} className="comment-form">
@@ -49,6 +59,17 @@ const CommentSection = ({ task, onCommentCreate, onCommentUpdate, onCommentDelet
         onCommentUpdate={onCommentUpdate}
         onCommentDelete={onCommentDelete}
       />
+
+      {hiddenCount > 0 && (
+        <button
+          type="button"
+          className="btn btn-secondary btn-small"
+          onClick={handleLoadMore}
+          disabled={isLoadingComments}
+        >
+          {isLoadingComments ? 'Loading...' : `Load ${hiddenCount} more comment${hiddenCount !== 1 ? 's' : ''}`}
+        </button>
+      )}
     </div>
   );
 };
@@ -6,6 +6,7 @@ const TaskCard = ({
   onTaskUpdate, 
   onTaskDelete, 
   onCommentCreate, 
+  onCommentsLoad,
   onCommentUpdate, 
   onCommentDelete 
 }) => {
@@ -136,6 +137,7 @@ const TaskCard = ({
       <CommentSection
         task={task}
         onCommentCreate={onCommentCreate}
+        onCommentsLoad={onCommentsLoad}
         onCommentUpdate={onCommentUpdate}
         onCommentDelete={onCommentDelete}
       />
@@ -6,6 +6,7 @@ const TaskList = ({
   onTaskUpdate, 
   onTaskDelete, 
   onCommentCreate, 
+  onCommentsLoad,
   onCommentUpdate, 
   onCommentDelete,
   loading 
@@ -36,6 +37,7 @@ const TaskList = ({
           onTaskUpdate={onTaskUpdate}
           onTaskDelete={onTaskDelete}
           onCommentCreate={onCommentCreate}
+          onCommentsLoad={onCommentsLoad}
           onCommentUpdate={onCommentUpdate}
           onCommentDelete={onCommentDelete}
         />
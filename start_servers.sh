@@ -17,7 +17,7 @@ trap cleanup EXIT INT TERM
 # Start Flask backend
 echo "📡 Starting Flask backend on http://localhost:5000..."
 source venv/bin/activate
-python app.py &
+python serve.py &
 BACKEND_PID=$!
 
 # Wait a moment for backend to start
@@ -1,16 +1,35 @@
 import pytest
+import contextvars
+import gzip
 import json
-from app import app, db, Task, Comment
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, text
+from app import create_app, db, Task, Comment, Job
+from app import bulk_response, bump_revisions, fail_stale_jobs, record_job_heartbeat, get_cache, get_event_log, get_job_queue, get_write_buffer, get_write_limiter, count_actual, read_counters, compact_tombstones
+from app import REQUESTS_TOTAL, REQUEST_SQL_STATEMENTS, record_request_metrics, start_request_timer
+
+app = create_app({
+    'TESTING': True,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    # Jobs run explicitly through get_job_queue().run_pending()
+    'JOBS_WORKERS': 0,
+    # Exercised by the rate limiting tests only
+    'RATELIMIT_ENABLED': False,
+})
 
 @pytest.fixture
 def client():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    
     with app.test_client() as client:
         with app.app_context():
             db.drop_all()
             db.create_all()
+            get_cache().clear()
+            app.extensions.pop('events', None)
+            app.extensions.pop('jobs', None)
+            app.extensions.pop('ratelimit', None)
+            app.extensions.pop('write_limiter', None)
+            app.extensions.pop('write_buffer', None)
             yield client
 
 class TestTaskAPI:
@@ -18,7 +37,9 @@ class TestTaskAPI:
         """Test getting tasks when none exist"""
         response = client.get('/api/tasks')
         assert response.status_code == 200
-        assert json.loads(response.data) == []
+        response_data = json.loads(response.data)
+        assert response_data['tasks'] == []
+        assert response_data['next_cursor'] is None
     
     def test_create_task_success(self, client):
         """Test creating a task successfully"""
@@ -101,6 +122,1765 @@ class TestTaskAPI:
         response = client.get(f'/api/tasks/{task_id}')
         assert response.status_code == 404
 
+class TestTaskPagination:
+    def create_tasks(self, count, **kwargs):
+        base = datetime(2024, 1, 1)
+        tasks = []
+        for i in range(count):
+            stamp = base + timedelta(minutes=i)
+            tasks.append(Task(title=f'Task {i}', created_at=stamp, updated_at=stamp, **kwargs))
+        db.session.add_all(tasks)
+        db.session.commit()
+        return tasks
+    
+    def collect_pages(self, client, url):
+        titles = []
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            response_data = json.loads(response.data)
+            titles.extend(task['title'] for task in response_data['tasks'])
+            cursor = response_data['next_cursor']
+            url = f"{url.split('&cursor=')[0]}&cursor={cursor}" if cursor else None
+        return titles
+    
+    def test_pages_cover_all_tasks_in_order(self, client):
+        """Test walking every page with the cursor"""
+        self.create_tasks(7)
+        titles = self.collect_pages(client, '/api/tasks?limit=3')
+        assert titles == [f'Task {i}' for i in range(7)]
+    
+    def test_last_page_has_no_cursor(self, client):
+        """Test that an exact final page does not return a cursor"""
+        self.create_tasks(3)
+        response = client.get('/api/tasks?limit=3')
+        response_data = json.loads(response.data)
+        assert len(response_data['tasks']) == 3
+        assert response_data['next_cursor'] is None
+    
+    def test_descending_sort(self, client):
+        """Test paginating newest first"""
+        self.create_tasks(5)
+        titles = self.collect_pages(client, '/api/tasks?limit=2&sort=-created_at')
+        assert titles == [f'Task {i}' for i in reversed(range(5))]
+    
+    def test_ties_on_created_at_are_broken_by_id(self, client):
+        """Test that rows sharing a timestamp are neither skipped nor repeated"""
+        stamp = datetime(2024, 1, 1)
+        db.session.add_all([Task(title=f'Task {i}', created_at=stamp) for i in range(5)])
+        db.session.commit()
+        titles = self.collect_pages(client, '/api/tasks?limit=2')
+        assert titles == [f'Task {i}' for i in range(5)]
+    
+    def test_filter_completed(self, client):
+        """Test filtering on completed"""
+        self.create_tasks(2, completed=True)
+        self.create_tasks(3, completed=False)
+        response = client.get('/api/tasks?completed=true')
+        response_data = json.loads(response.data)
+        assert len(response_data['tasks']) == 2
+        assert all(task['completed'] for task in response_data['tasks'])
+    
+    def test_filter_updated_range(self, client):
+        """Test filtering on an updated_at range"""
+        self.create_tasks(10)
+        response = client.get('/api/tasks?updated_after=2024-01-01T00:02:00&updated_before=2024-01-01T00:06:00')
+        response_data = json.loads(response.data)
+        assert [task['title'] for task in response_data['tasks']] == ['Task 3', 'Task 4', 'Task 5']
+    
+    def test_limit_is_capped(self, client):
+        """Test that limit cannot exceed the configured maximum"""
+        self.create_tasks(4)
+        app.config['TASKS_MAX_LIMIT'] = 2
+        try:
+            response = client.get('/api/tasks?limit=100')
+        finally:
+            app.config['TASKS_MAX_LIMIT'] = 500
+        assert len(json.loads(response.data)['tasks']) == 2
+    
+    def test_invalid_parameters(self, client):
+        """Test that malformed query parameters are rejected"""
+        for query in ('limit=abc', 'limit=0', 'sort=title', 'completed=maybe',
+                      'updated_after=yesterday', 'cursor=not-a-cursor'):
+            response = client.get(f'/api/tasks?{query}')
+            assert response.status_code == 400
+            assert 'error' in json.loads(response.data)
+    
+    def test_cursor_must_match_sort(self, client):
+        """Test that a cursor cannot be reused with a different sort"""
+        self.create_tasks(3)
+        cursor = json.loads(client.get('/api/tasks?limit=1').data)['next_cursor']
+        response = client.get(f'/api/tasks?limit=1&sort=-created_at&cursor={cursor}')
+        assert response.status_code == 400
+
+class TestEmbeddedComments:
+    def create_tasks_with_comments(self, task_count, comments_per_task):
+        tasks = [Task(title=f'Task {i}') for i in range(task_count)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        db.session.add_all([
+            Comment(content=f'Comment {j}', task_id=task.id)
+            for task in tasks for j in range(comments_per_task)
+        ])
+        db.session.commit()
+        return tasks
+    
+    def count_queries(self, client, url):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 200
+        return len(statements)
+    
+    def test_tasks_without_include_omit_comments(self, client):
+        """Test that comments are only embedded on request"""
+        self.create_tasks_with_comments(1, 2)
+        response_data = json.loads(client.get('/api/tasks').data)
+        assert 'comments' not in response_data['tasks'][0]
+    
+    def test_include_comments_on_listing(self, client):
+        """Test embedding comments in the task listing"""
+        self.create_tasks_with_comments(2, 3)
+        db.session.add(Task(title='No comments'))
+        db.session.commit()
+        response = client.get('/api/tasks?include=comments')
+        assert response.status_code == 200
+        tasks = json.loads(response.data)['tasks']
+        assert [task['comment_count'] for task in tasks] == [3, 3, 0]
+        assert [comment['content'] for comment in tasks[0]['comments']] == ['Comment 0', 'Comment 1', 'Comment 2']
+        assert tasks[2]['comments'] == []
+    
+    def test_include_comments_on_single_task(self, client):
+        """Test embedding comments in a single task"""
+        task = self.create_tasks_with_comments(1, 2)[0]
+        response = client.get(f'/api/tasks/{task.id}?include=comments')
+        response_data = json.loads(response.data)
+        assert len(response_data['comments']) == 2
+        assert response_data['comment_count'] == 2
+    
+    def test_comments_are_capped_per_task(self, client):
+        """Test that comments_limit caps embedded comments but not the count"""
+        self.create_tasks_with_comments(2, 5)
+        tasks = json.loads(client.get('/api/tasks?include=comments&comments_limit=2').data)['tasks']
+        for task in tasks:
+            assert [comment['content'] for comment in task['comments']] == ['Comment 0', 'Comment 1']
+            assert task['comment_count'] == 5
+    
+    def test_query_count_is_constant(self, client):
+        """Test that embedding comments does not issue one query per task"""
+        self.create_tasks_with_comments(3, 2)
+        small = self.count_queries(client, '/api/tasks?include=comments')
+        self.create_tasks_with_comments(30, 2)
+        large = self.count_queries(client, '/api/tasks?include=comments')
+        assert small == large
+    
+    def test_unknown_include(self, client):
+        """Test that unknown include values are rejected"""
+        response = client.get('/api/tasks?include=owner')
+        assert response.status_code == 400
+
+class TestSparseFields:
+    def test_task_listing_fields(self, client):
+        """Test that fields= limits each task to the requested fields plus id"""
+        db.session.add_all([Task(title='Task 1', description='Long'), Task(title='Task 2', completed=True)])
+        db.session.commit()
+        response = client.get('/api/tasks?fields=title,completed')
+        assert response.status_code == 200
+        tasks = json.loads(response.data)['tasks']
+        assert [set(task) for task in tasks] == [{'id', 'title', 'completed'}] * 2
+        assert [task['completed'] for task in tasks] == [False, True]
+    
+    def test_fields_with_pagination(self, client):
+        """Test that cursors still work when the sort column is not among the fields"""
+        db.session.add_all([Task(title=f'Task {i}') for i in range(3)])
+        db.session.commit()
+        first_page = json.loads(client.get('/api/tasks?fields=title&limit=2&sort=-updated_at').data)
+        assert 'updated_at' not in first_page['tasks'][0]
+        second_page = json.loads(
+            client.get(f"/api/tasks?fields=title&limit=2&sort=-updated_at&cursor={first_page['next_cursor']}").data
+        )
+        assert [task['title'] for task in second_page['tasks']] == ['Task 0']
+    
+    def test_fields_with_embedded_comments(self, client):
+        """Test combining sparse tasks with embedded comments"""
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        db.session.add(Comment(content='Hi', task_id=task.id))
+        db.session.commit()
+        listed = json.loads(client.get('/api/tasks?fields=title&include=comments').data)['tasks'][0]
+        assert set(listed) == {'id', 'title', 'comments', 'comment_count'}
+        assert listed['comments'][0]['content'] == 'Hi'
+    
+    def test_single_task_fields(self, client):
+        """Test sparse single-task responses and that they get their own ETag"""
+        task = Task(title='Task', description='Long')
+        db.session.add(task)
+        db.session.commit()
+        full = client.get(f'/api/tasks/{task.id}')
+        sparse = client.get(f'/api/tasks/{task.id}?fields=title')
+        assert json.loads(sparse.data) == {'id': task.id, 'title': 'Task'}
+        assert sparse.headers['ETag'] != full.headers['ETag']
+        # The cached full entity is not modified by the projection
+        assert json.loads(client.get(f'/api/tasks/{task.id}').data) == json.loads(full.data)
+    
+    def test_comment_fields(self, client):
+        """Test fields= on the comment listings and single comments"""
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        comment = Comment(content='Hi', task_id=task.id)
+        db.session.add(comment)
+        db.session.commit()
+        expected = {'id': comment.id, 'content': 'Hi'}
+        assert json.loads(client.get('/api/comments?fields=content').data) == [expected]
+        assert json.loads(client.get(f'/api/tasks/{task.id}/comments?fields=content').data)['comments'] == [expected]
+        assert json.loads(client.get(f'/api/comments/{comment.id}?fields=content').data) == expected
+    
+    def test_projection_matches_to_dict(self, client):
+        """Test that serializing from selected columns matches to_dict()"""
+        task = Task(title='Task', description=None, completed=True)
+        db.session.add(task)
+        db.session.commit()
+        assert json.loads(client.get('/api/tasks').data)['tasks'] == [task.to_dict()]
+    
+    def test_unknown_field(self, client):
+        """Test that unknown or empty field lists are rejected"""
+        assert client.get('/api/tasks?fields=title,owner').status_code == 400
+        assert client.get('/api/tasks?fields=').status_code == 400
+        assert client.get('/api/comments?fields=title').status_code == 400
+
+class TestBulkAPI:
+    def send(self, client, method, url, payload):
+        return getattr(client, method)(url, data=json.dumps(payload), content_type='application/json')
+    
+    def test_bulk_create_tasks(self, client):
+        """Test creating many tasks in one request"""
+        payload = {'tasks': [{'title': f'Task {i}', 'completed': i % 2 == 0} for i in range(5)]}
+        response = self.send(client, 'post', '/api/tasks/bulk', payload)
+        assert response.status_code == 201
+        results = json.loads(response.data)['results']
+        assert [result['task']['title'] for result in results] == [f'Task {i}' for i in range(5)]
+        assert all(result['status'] == 201 for result in results)
+        assert Task.query.count() == 5
+    
+    def test_bulk_create_rejects_whole_batch(self, client):
+        """Test that one invalid item prevents every write"""
+        payload = {'tasks': [{'title': 'Good'}, {'description': 'No title'}, {'title': 'Bad', 'completed': 'yes'}]}
+        response = self.send(client, 'post', '/api/tasks/bulk', payload)
+        assert response.status_code == 400
+        response_data = json.loads(response.data)
+        assert [result['index'] for result in response_data['results']] == [1, 2]
+        assert Task.query.count() == 0
+    
+    def test_bulk_create_uses_one_insert(self, client):
+        """Test that the batch is written with a single executemany INSERT"""
+        inserts = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO task '):
+                inserts.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.send(client, 'post', '/api/tasks/bulk', {'tasks': [{'title': f'Task {i}'} for i in range(50)]})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(inserts) == 1
+        assert Task.query.count() == 50
+    
+    def test_batch_size_limit(self, client):
+        """Test that oversized batches are refused"""
+        app.config['BULK_MAX_BATCH_SIZE'] = 2
+        try:
+            response = self.send(client, 'post', '/api/tasks/bulk', {'tasks': [{'title': 'x'}] * 3})
+        finally:
+            app.config['BULK_MAX_BATCH_SIZE'] = 1000
+        assert response.status_code == 413
+    
+    def test_bulk_update_tasks(self, client):
+        """Test updating many tasks, reporting missing ones per item"""
+        tasks = [Task(title='A'), Task(title='B')]
+        db.session.add_all(tasks)
+        db.session.commit()
+        payload = {'tasks': [
+            {'id': tasks[0].id, 'completed': True},
+            {'id': 999, 'title': 'Missing'},
+            {'id': tasks[1].id, 'title': 'B2'},
+        ]}
+        response = self.send(client, 'patch', '/api/tasks/bulk', payload)
+        assert response.status_code == 200
+        results = json.loads(response.data)['results']
+        assert [result['status'] for result in results] == [200, 404, 200]
+        db.session.expire_all()
+        assert db.session.get(Task, tasks[0].id).completed is True
+        assert db.session.get(Task, tasks[1].id).title == 'B2'
+    
+    def test_bulk_update_requires_data(self, client):
+        """Test that items without fields to change are rejected"""
+        response = self.send(client, 'patch', '/api/tasks/bulk', {'tasks': [{'id': 1}]})
+        assert response.status_code == 400
+    
+    def test_bulk_delete_tasks_removes_comments(self, client):
+        """Test deleting many tasks along with their comments"""
+        tasks = [Task(title='A'), Task(title='B'), Task(title='C')]
+        db.session.add_all(tasks)
+        db.session.commit()
+        db.session.add_all([Comment(content='x', task_id=tasks[0].id), Comment(content='y', task_id=tasks[2].id)])
+        db.session.commit()
+        ids = [tasks[0].id, tasks[1].id, 999]
+        response = self.send(client, 'delete', '/api/tasks/bulk', {'ids': ids})
+        assert response.status_code == 200
+        results = json.loads(response.data)['results']
+        assert [result['status'] for result in results] == [200, 200, 404]
+        assert Task.query.count() == 1
+        assert [comment.task_id for comment in Comment.query.all()] == [tasks[2].id]
+    
+    def test_bulk_create_comments(self, client):
+        """Test creating many comments in one request"""
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        payload = {'comments': [{'content': f'Comment {i}', 'task_id': task.id} for i in range(3)]}
+        response = self.send(client, 'post', '/api/comments/bulk', payload)
+        assert response.status_code == 201
+        results = json.loads(response.data)['results']
+        assert [result['comment']['content'] for result in results] == ['Comment 0', 'Comment 1', 'Comment 2']
+        assert Comment.query.count() == 3
+    
+    def test_bulk_create_comments_unknown_task(self, client):
+        """Test that comments for missing tasks fail the batch"""
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        payload = {'comments': [{'content': 'ok', 'task_id': task.id}, {'content': 'bad', 'task_id': 999}]}
+        response = self.send(client, 'post', '/api/comments/bulk', payload)
+        assert response.status_code == 400
+        results = json.loads(response.data)['results']
+        assert results == [{'index': 1, 'status': 404, 'error': 'Task not found'}]
+        assert Comment.query.count() == 0
+    
+    def test_streamed_results(self, client):
+        """Test streaming per-item results as NDJSON"""
+        payload = {'tasks': [{'title': f'Task {i}'} for i in range(3)]}
+        response = self.send(client, 'post', '/api/tasks/bulk?stream=true', payload)
+        assert response.status_code == 201
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [line['index'] for line in lines] == [0, 1, 2]
+    
+    def test_streamed_results_are_chunked(self, client):
+        """Test that each result is sent as its own chunk, and only built when the body is read"""
+        payload = {'tasks': [{'title': f'Task {i}'} for i in range(3)]}
+        response = self.send(client, 'post', '/api/tasks/bulk?stream=true', payload)
+        assert response.is_streamed
+        assert [json.loads(chunk)['index'] for chunk in response.response] == [0, 1, 2]
+    
+        built = []
+        def results():
+            for index in range(3):
+                built.append(index)
+                yield {'index': index}
+        with app.test_request_context('/?stream=true'):
+            response = bulk_response(results())
+        assert built == []
+        chunks = iter(response.response)
+        assert json.loads(next(chunks)) == {'index': 0} and built == [0]
+        assert [json.loads(chunk)['index'] for chunk in chunks] == [1, 2]
+    
+    def test_streamed_results_outside_app_context(self, client):
+        """Test that the streamed body can be sent once the request's contexts are gone, as a server does"""
+        payload = {'tasks': [{'title': 'Task'}]}
+        def post_and_read():
+            response = self.send(app.test_client(), 'post', '/api/tasks/bulk?stream=true', payload)
+            return response.status_code, response.get_data(as_text=True)
+        # A fresh context has no app context pushed, unlike the one this test runs in
+        status_code, body = contextvars.Context().run(post_and_read)
+        assert status_code == 201
+        assert json.loads(body)['task']['title'] == 'Task'
+
+class TestConditionalRequests:
+    def create_task(self, client, title='Task'):
+        response = client.post('/api/tasks', data=json.dumps({'title': title}), content_type='application/json')
+        return json.loads(response.data)
+    
+    def test_list_etag_round_trip(self, client):
+        """Test that an unchanged listing answers If-None-Match with 304"""
+        self.create_task(client)
+        response = client.get('/api/tasks')
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        cached = client.get('/api/tasks', headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.headers['ETag'] == etag
+        assert cached.data == b''
+    
+    def test_list_etag_changes_after_write(self, client):
+        """Test that creating a task invalidates the listing ETag"""
+        etag = client.get('/api/tasks').headers['ETag']
+        self.create_task(client)
+        response = client.get('/api/tasks', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+    
+    def test_list_etag_depends_on_query(self, client):
+        """Test that different pages do not share an ETag"""
+        assert client.get('/api/tasks?limit=1').headers['ETag'] != client.get('/api/tasks?limit=2').headers['ETag']
+    
+    def test_304_skips_loading_rows(self, client):
+        """Test that a 304 is decided from the revision table alone"""
+        self.create_task(client)
+        etag = client.get('/api/tasks').headers['ETag']
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/api/tasks', headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 304
+        assert not any('FROM task' in statement for statement in statements)
+    
+    def test_comment_etags_follow_cascade_delete(self, client):
+        """Test that deleting a task invalidates comment listings"""
+        task = self.create_task(client)
+        client.post('/api/comments', data=json.dumps({'content': 'Hi', 'task_id': task['id']}),
+                    content_type='application/json')
+        etag = client.get('/api/comments').headers['ETag']
+        assert client.get('/api/comments', headers={'If-None-Match': etag}).status_code == 304
+        client.delete(f"/api/tasks/{task['id']}")
+        response = client.get('/api/comments', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data) == []
+    
+    def test_task_comments_etag(self, client):
+        """Test conditional GET on a task's comments"""
+        task = self.create_task(client)
+        etag = client.get(f"/api/tasks/{task['id']}/comments").headers['ETag']
+        response = client.get(f"/api/tasks/{task['id']}/comments", headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert client.get('/api/tasks/999/comments').status_code == 404
+    
+    def test_if_modified_since(self, client):
+        """Test conditional GET with If-Modified-Since"""
+        self.create_task(client)
+        last_modified = client.get('/api/tasks').headers['Last-Modified']
+        response = client.get('/api/tasks', headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+        response = client.get('/api/tasks', headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+        assert response.status_code == 200
+    
+    def test_single_task_etag(self, client):
+        """Test conditional GET on a single task"""
+        task = self.create_task(client)
+        etag = client.get(f"/api/tasks/{task['id']}").headers['ETag']
+        assert client.get(f"/api/tasks/{task['id']}", headers={'If-None-Match': etag}).status_code == 304
+        client.put(f"/api/tasks/{task['id']}", data=json.dumps({'completed': True}), content_type='application/json')
+        assert client.get(f"/api/tasks/{task['id']}", headers={'If-None-Match': etag}).status_code == 200
+    
+    def test_put_if_match(self, client):
+        """Test optimistic concurrency on PUT with If-Match"""
+        task = self.create_task(client)
+        etag = client.get(f"/api/tasks/{task['id']}").headers['ETag']
+        response = client.put(f"/api/tasks/{task['id']}", data=json.dumps({'title': 'First'}),
+                              content_type='application/json', headers={'If-Match': etag})
+        assert response.status_code == 200
+        new_etag = response.headers['ETag']
+        assert new_etag != etag
+        
+        response = client.put(f"/api/tasks/{task['id']}", data=json.dumps({'title': 'Stale'}),
+                              content_type='application/json', headers={'If-Match': etag})
+        assert response.status_code == 412
+        assert json.loads(client.get(f"/api/tasks/{task['id']}").data)['title'] == 'First'
+
+class TestCompression:
+    def create_tasks(self, count):
+        db.session.add_all([Task(title=f'Task {i}', description='Compressible text ' * 5) for i in range(count)])
+        db.session.commit()
+    
+    def test_large_listing_is_gzipped(self, client):
+        """Test that a large listing is compressed when the client accepts gzip"""
+        self.create_tasks(30)
+        plain = client.get('/api/tasks')
+        response = client.get('/api/tasks', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert int(response.headers['Content-Length']) < len(plain.data) / 3
+        assert gzip.decompress(response.data) == plain.data
+    
+    def test_small_or_unaccepted_responses_are_not_compressed(self, client):
+        """Test the minimum size threshold and requests without Accept-Encoding"""
+        self.create_tasks(30)
+        assert 'Content-Encoding' not in client.get('/api/tasks').headers
+        small = client.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+    
+    def test_compressed_etag_revalidates(self, client):
+        """Test that the weak ETag of a compressed listing still yields 304 and If-Match"""
+        self.create_tasks(30)
+        etag = client.get('/api/tasks', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        assert etag.startswith('W/')
+        cached = client.get('/api/tasks', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert cached.status_code == 304
+        assert 'Accept-Encoding' in cached.headers['Vary']
+        task_id = Task.query.first().id
+        response = client.put(f'/api/tasks/{task_id}', data=json.dumps({'completed': True}),
+                              content_type='application/json',
+                              headers={'If-Match': 'W/' + client.get(f'/api/tasks/{task_id}').headers['ETag']})
+        assert response.status_code == 200
+    
+    def test_streamed_export_is_compressed(self, client):
+        """Test that streamed responses are compressed chunk by chunk"""
+        self.create_tasks(5)
+        # Read each stream before the next request: both hold the request context while open
+        plain = client.get('/api/export').data
+        response = client.get('/api/export', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        assert gzip.decompress(response.data) == plain
+    
+    def test_event_stream_is_not_compressed(self, client):
+        """Test that server-sent events are never buffered by a compressor"""
+        app.config['EVENTS_STREAM_TIMEOUT'] = 0
+        try:
+            response = client.get('/api/events', headers={'Accept-Encoding': 'gzip'})
+        finally:
+            app.config['EVENTS_STREAM_TIMEOUT'] = 300
+        assert 'Content-Encoding' not in response.headers
+    
+    def test_cache_control_per_route(self, client):
+        """Test Cache-Control on validated reads, unvalidated reads and writes"""
+        assert client.get('/api/tasks').headers['Cache-Control'] == 'no-cache'
+        assert client.get('/api/health').headers['Cache-Control'] == 'no-store'
+        created = client.post('/api/tasks', data=json.dumps({'title': 'Task'}), content_type='application/json')
+        assert created.headers['Cache-Control'] == 'no-store'
+        assert client.get('/api/tasks/999').headers['Cache-Control'] == 'no-store'
+    
+    def test_preflight_is_cacheable(self, client):
+        """Test that CORS preflight responses carry Access-Control-Max-Age"""
+        response = client.options('/api/tasks/1', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'PUT',
+            'Access-Control-Request-Headers': 'Content-Type, If-Match',
+        })
+        assert response.headers['Access-Control-Max-Age'] == str(app.config['CORS_MAX_AGE'])
+
+class TestReadThroughCache:
+    def count_queries(self, client, url):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return response, len(statements)
+    
+    def create_task_with_comment(self):
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        comment = Comment(content='Comment', task_id=task.id)
+        db.session.add(comment)
+        db.session.commit()
+        return task.id, comment.id
+    
+    def test_repeated_reads_skip_the_database(self, client):
+        """Test that cached tasks and comments are served without SQL, listings with only the revision lookup"""
+        task_id, comment_id = self.create_task_with_comment()
+        for url, expected_queries in ((f'/api/tasks/{task_id}', 0), (f'/api/comments/{comment_id}', 0),
+                                      ('/api/tasks', 1), ('/api/comments', 1), (f'/api/tasks/{task_id}/comments', 1)):
+            first, _ = self.count_queries(client, url)
+            second, queries = self.count_queries(client, url)
+            assert second.status_code == 200
+            assert second.data == first.data
+            assert queries == expected_queries
+    
+    def test_revisions_are_read_from_the_database(self, client):
+        """Test that a listing's ETag follows a write even if no cache key was dropped for it"""
+        self.create_task_with_comment()
+        etag = client.get('/api/tasks').headers['ETag']
+        # As if the write committed between a reader's revision lookup and its cache store
+        with db.engine.begin() as connection:
+            bump_revisions(connection, {'task'})
+        response = client.get('/api/tasks', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+    
+    def test_update_invalidates_task(self, client):
+        """Test that updating a task drops its cached copy and the listings"""
+        task_id, _ = self.create_task_with_comment()
+        client.get(f'/api/tasks/{task_id}')
+        client.get('/api/tasks')
+        client.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'Renamed'}), content_type='application/json')
+        assert json.loads(client.get(f'/api/tasks/{task_id}').data)['title'] == 'Renamed'
+        assert json.loads(client.get('/api/tasks').data)['tasks'][0]['title'] == 'Renamed'
+    
+    def test_comment_writes_invalidate(self, client):
+        """Test that comment updates and deletes drop cached comments and listings"""
+        task_id, comment_id = self.create_task_with_comment()
+        client.get(f'/api/comments/{comment_id}')
+        client.get(f'/api/tasks/{task_id}/comments')
+        client.put(f'/api/comments/{comment_id}', data=json.dumps({'content': 'Edited'}), content_type='application/json')
+        assert json.loads(client.get(f'/api/comments/{comment_id}').data)['content'] == 'Edited'
+        assert json.loads(client.get(f'/api/tasks/{task_id}/comments').data)['comments'][0]['content'] == 'Edited'
+        client.delete(f'/api/comments/{comment_id}')
+        assert client.get(f'/api/comments/{comment_id}').status_code == 404
+        assert json.loads(client.get(f'/api/tasks/{task_id}/comments').data)['comments'] == []
+    
+    def test_cascade_delete_invalidates_comments(self, client):
+        """Test that deleting a task drops its cascaded comments from the cache"""
+        task_id, comment_id = self.create_task_with_comment()
+        client.get(f'/api/comments/{comment_id}')
+        client.get('/api/comments')
+        client.delete(f'/api/tasks/{task_id}')
+        assert client.get(f'/api/comments/{comment_id}').status_code == 404
+        assert client.get(f'/api/tasks/{task_id}').status_code == 404
+        assert json.loads(client.get('/api/comments').data) == []
+    
+    def test_bulk_writes_invalidate(self, client):
+        """Test that bulk updates and deletes drop the affected entries"""
+        task_id, comment_id = self.create_task_with_comment()
+        client.get(f'/api/tasks/{task_id}')
+        client.get(f'/api/comments/{comment_id}')
+        client.patch('/api/tasks/bulk', data=json.dumps({'tasks': [{'id': task_id, 'completed': True}]}),
+                     content_type='application/json')
+        assert json.loads(client.get(f'/api/tasks/{task_id}').data)['completed'] is True
+        client.delete('/api/tasks/bulk', data=json.dumps({'ids': [task_id]}), content_type='application/json')
+        assert client.get(f'/api/tasks/{task_id}').status_code == 404
+        assert client.get(f'/api/comments/{comment_id}').status_code == 404
+    
+    def test_write_during_a_miss_is_not_overwritten(self, client, monkeypatch):
+        """Test that a row read before a write committed is not cached over the write's invalidation"""
+        task_id, _ = self.create_task_with_comment()
+        cache = get_cache()
+        set_leased = cache.set_leased
+        def commit_then_fill(key, value, lease, ttl=None):
+            # The reader has loaded the old row; the write commits before it fills the cache
+            with app.app_context():
+                db.session.get(Task, task_id).title = 'Renamed'
+                db.session.commit()
+            return set_leased(key, value, lease, ttl)
+        monkeypatch.setattr(cache, 'set_leased', commit_then_fill)
+        response = client.get(f'/api/tasks/{task_id}')
+        assert json.loads(response.data)['title'] == 'Task'
+        monkeypatch.undo()
+        
+        response = client.get(f'/api/tasks/{task_id}', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 200
+        assert json.loads(response.data)['title'] == 'Renamed'
+    
+    def test_rolled_back_writes_keep_cache(self, client):
+        """Test that invalidations queued by a rolled back transaction are discarded"""
+        task_id, _ = self.create_task_with_comment()
+        client.get(f'/api/tasks/{task_id}')
+        task = db.session.get(Task, task_id)
+        task.title = 'Never committed'
+        db.session.flush()
+        db.session.rollback()
+        _, queries = self.count_queries(client, f'/api/tasks/{task_id}')
+        assert queries == 0
+    
+    def test_stats_endpoint(self, client):
+        """Test the cache counters endpoint"""
+        task_id, _ = self.create_task_with_comment()
+        client.get(f'/api/tasks/{task_id}')
+        client.get(f'/api/tasks/{task_id}')
+        stats = json.loads(client.get('/api/cache/stats').data)
+        assert stats['backend'] == 'memory'
+        assert stats['hits'] >= 1
+        assert stats['misses'] >= 1
+        assert 'evictions' in stats
+
+class TestExportImport:
+    def create_tasks(self, count, comments_per_task=0):
+        tasks = [Task(title=f'Task {i}') for i in range(count)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        db.session.add_all([
+            Comment(content=f'Comment {j}', task_id=task.id)
+            for task in tasks for j in range(comments_per_task)
+        ])
+        db.session.commit()
+    
+    def test_export_ndjson(self, client):
+        """Test streaming tasks as NDJSON across several server-side batches"""
+        self.create_tasks(5)
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        try:
+            response = client.get('/api/export?format=ndjson')
+            assert response.is_streamed
+            lines = response.get_data(as_text=True).splitlines()
+        finally:
+            app.config['EXPORT_BATCH_SIZE'] = 500
+        assert response.mimetype == 'application/x-ndjson'
+        assert [json.loads(line)['title'] for line in lines] == [f'Task {i}' for i in range(5)]
+    
+    def test_export_json_with_comments(self, client):
+        """Test streaming a JSON array with embedded comments"""
+        self.create_tasks(3, comments_per_task=2)
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        try:
+            response = client.get('/api/export?format=json&include=comments')
+            tasks = json.loads(response.get_data(as_text=True))
+        finally:
+            app.config['EXPORT_BATCH_SIZE'] = 500
+        assert len(tasks) == 3
+        assert all([comment['content'] for comment in task['comments']] == ['Comment 0', 'Comment 1'] for task in tasks)
+    
+    def test_export_empty_json(self, client):
+        """Test that an empty table exports as an empty array"""
+        assert json.loads(client.get('/api/export?format=json').data) == []
+    
+    def test_export_invalid_format(self, client):
+        """Test that unknown formats are rejected"""
+        assert client.get('/api/export?format=csv').status_code == 400
+    
+    def test_round_trip(self, client):
+        """Test that an export can be imported again"""
+        self.create_tasks(3, comments_per_task=2)
+        exported = client.get('/api/export?include=comments').data
+        response = client.post('/api/import', data=exported, content_type='application/x-ndjson')
+        assert response.status_code == 201
+        summary = json.loads(response.data)
+        assert summary['imported_tasks'] == 3
+        assert summary['imported_comments'] == 6
+        assert Task.query.count() == 6
+        assert Comment.query.count() == 12
+    
+    def test_import_commits_in_chunks(self, client):
+        """Test that a large import is committed chunk by chunk"""
+        commits = []
+        def record(session):
+            commits.append(session)
+        event.listen(db.session, 'after_commit', record)
+        body = ''.join(json.dumps({'title': f'Task {i}'}) + '\n' for i in range(10))
+        app.config['IMPORT_CHUNK_SIZE'] = 4
+        try:
+            response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+        finally:
+            app.config['IMPORT_CHUNK_SIZE'] = 1000
+            event.remove(db.session, 'after_commit', record)
+        assert response.status_code == 201
+        assert len(commits) == 3
+        assert [task.title for task in Task.query.order_by(Task.id)] == [f'Task {i}' for i in range(10)]
+    
+    def test_import_reports_bad_lines(self, client):
+        """Test that invalid lines are skipped and reported"""
+        body = '\n'.join([
+            json.dumps({'title': 'Good'}),
+            'not json',
+            json.dumps({'description': 'No title'}),
+            json.dumps({'title': 'Also good', 'comments': [{'content': 'Hi'}]}),
+        ])
+        response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+        assert response.status_code == 201
+        summary = json.loads(response.data)
+        assert summary['imported_tasks'] == 2
+        assert summary['imported_comments'] == 1
+        assert [error['line'] for error in summary['errors']] == [2, 3]
+
+class TestEventStream:
+    def read_events(self, client, last_event_id=None):
+        """Read one stream that ends as soon as the backlog is sent"""
+        headers = {} if last_event_id is None else {'Last-Event-ID': str(last_event_id)}
+        app.config['EVENTS_STREAM_TIMEOUT'] = 0
+        try:
+            response = client.get('/api/events', headers=headers)
+            body = response.get_data(as_text=True)
+            response.close()
+        finally:
+            app.config['EVENTS_STREAM_TIMEOUT'] = 300
+        assert response.mimetype == 'text/event-stream'
+        events = []
+        for message in body.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+    
+    def post_json(self, client, url, data, method='post'):
+        response = getattr(client, method)(url, data=json.dumps(data), content_type='application/json')
+        return json.loads(response.data)
+    
+    def test_new_stream_starts_at_current_position(self, client):
+        """Test that a stream without Last-Event-ID sends only a ready event"""
+        self.post_json(client, '/api/tasks', {'title': 'Before'})
+        assert self.read_events(client) == [(1, 'ready', {})]
+    
+    def test_task_lifecycle_events(self, client):
+        """Test that task creates, updates and deletes are published after commit"""
+        task = self.post_json(client, '/api/tasks', {'title': 'Task'})
+        updated = self.post_json(client, f"/api/tasks/{task['id']}", {'completed': True}, method='put')
+        client.delete(f"/api/tasks/{task['id']}")
+        events = self.read_events(client, last_event_id=0)
+        assert events == [
+            (1, 'task.created', task),
+            (2, 'task.updated', updated),
+            (3, 'task.deleted', {'id': task['id']}),
+        ]
+    
+    def test_comment_events_and_cascade(self, client):
+        """Test comment events, including comments removed with their task"""
+        task = self.post_json(client, '/api/tasks', {'title': 'Task'})
+        comment = self.post_json(client, '/api/comments', {'content': 'Hi', 'task_id': task['id']})
+        self.post_json(client, f"/api/comments/{comment['id']}", {'content': 'Edited'}, method='put')
+        client.delete(f"/api/tasks/{task['id']}")
+        events = self.read_events(client, last_event_id=1)
+        assert [event_type for _, event_type, _ in events[:2]] == ['comment.created', 'comment.updated']
+        assert events[1][2]['content'] == 'Edited'
+        # The cascade deletes both rows in one flush, in no guaranteed order
+        assert sorted((event_type, data) for _, event_type, data in events[2:]) == [
+            ('comment.deleted', {'id': comment['id'], 'task_id': task['id']}),
+            ('task.deleted', {'id': task['id']}),
+        ]
+    
+    def test_resume_from_last_event_id(self, client):
+        """Test that a reconnecting client only receives what it missed"""
+        for title in ('One', 'Two', 'Three'):
+            self.post_json(client, '/api/tasks', {'title': title})
+        events = self.read_events(client, last_event_id=2)
+        assert [(event_id, data['title']) for event_id, _, data in events] == [(3, 'Three')]
+    
+    def test_evicted_events_trigger_resync(self, client):
+        """Test that resuming from an evicted position asks the client to refetch"""
+        app.config['EVENTS_LOG_SIZE'] = 2
+        app.extensions.pop('events', None)
+        try:
+            for title in ('One', 'Two', 'Three'):
+                self.post_json(client, '/api/tasks', {'title': title})
+            assert self.read_events(client, last_event_id=0) == [(3, 'resync', {'reason': 'missed events'})]
+            assert [event_id for event_id, _, _ in self.read_events(client, last_event_id=1)] == [2, 3]
+        finally:
+            app.config['EVENTS_LOG_SIZE'] = 1000
+    
+    def test_last_event_id_from_another_process_lifetime(self, client):
+        """Test that ids ahead of the log (e.g. after a restart) trigger a resync"""
+        assert self.read_events(client, last_event_id=50)[0][1] == 'resync'
+    
+    def test_bulk_and_import_events(self, client):
+        """Test that set-based bulk writes and imports publish events too"""
+        created = self.post_json(client, '/api/tasks/bulk', {'tasks': [{'title': 'A'}, {'title': 'B'}]})
+        ids = [result['task']['id'] for result in created['results']]
+        self.post_json(client, '/api/tasks/bulk', {'tasks': [{'id': ids[0], 'completed': True}]}, method='patch')
+        client.delete('/api/tasks/bulk', data=json.dumps({'ids': [ids[1]]}), content_type='application/json')
+        client.post('/api/import', data=json.dumps({'title': 'Imported'}) + '\n', content_type='application/x-ndjson')
+        events = self.read_events(client, last_event_id=0)
+        assert [event_type for _, event_type, _ in events] == [
+            'task.created', 'task.created', 'task.updated', 'task.deleted', 'resync'
+        ]
+        assert events[2][2]['completed'] is True
+        assert events[3][2] == {'id': ids[1]}
+    
+    def test_rolled_back_changes_are_not_published(self, client):
+        """Test that events are only published for committed transactions"""
+        db.session.add(Task(title='Discarded'))
+        db.session.flush()
+        db.session.rollback()
+        assert get_event_log().last_id == 0
+    
+    def test_connection_limit(self, client):
+        """Test that streams beyond EVENTS_MAX_CONNECTIONS are refused with Retry-After"""
+        app.config['EVENTS_MAX_CONNECTIONS'] = 0
+        try:
+            response = client.get('/api/events')
+        finally:
+            app.config['EVENTS_MAX_CONNECTIONS'] = 100
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '3'
+    
+    def test_closed_streams_release_their_slot(self, client):
+        """Test that the connection count drops when a stream is closed"""
+        self.read_events(client)
+        stats = json.loads(client.get('/api/events/stats').data)
+        assert stats['connections'] == 0
+    
+    def test_invalid_last_event_id(self, client):
+        """Test that a non-numeric Last-Event-ID is rejected"""
+        assert client.get('/api/events', headers={'Last-Event-ID': 'abc'}).status_code == 400
+
+class TestDeltaSync:
+    def post_json(self, client, url, data, method='post'):
+        response = getattr(client, method)(url, data=json.dumps(data), content_type='application/json')
+        return json.loads(response.data)
+    
+    def sync(self, client, since):
+        response = client.get(f'/api/sync?since={since}')
+        assert response.status_code == 200
+        return json.loads(response.data)
+    
+    def test_current_revision(self, client):
+        """Test that sync without since returns the revision to start from"""
+        assert json.loads(client.get('/api/sync').data) == {'revision': 0}
+        self.post_json(client, '/api/tasks', {'title': 'Task'})
+        assert json.loads(client.get('/api/sync').data) == {'revision': 1}
+    
+    def test_returns_only_changes_since_revision(self, client):
+        """Test that rows written after the given revision are returned"""
+        old = self.post_json(client, '/api/tasks', {'title': 'Old'})
+        revision = json.loads(client.get('/api/sync').data)['revision']
+        new = self.post_json(client, '/api/tasks', {'title': 'New'})
+        comment = self.post_json(client, '/api/comments', {'content': 'Hi', 'task_id': old['id']})
+        changes = self.sync(client, revision)
+        assert changes['revision'] == revision + 2
+        # The comment changed the old task's comment_count
+        assert changes['tasks'] == [new, dict(old, comment_count=1)]
+        assert changes['comments'] == [comment]
+        assert changes['deleted'] == {'tasks': [], 'comments': []}
+        assert self.sync(client, changes['revision'])['tasks'] == []
+    
+    def test_updates_move_rows_forward(self, client):
+        """Test that an updated row is reported at its new revision"""
+        task = self.post_json(client, '/api/tasks', {'title': 'Task'})
+        self.post_json(client, f"/api/tasks/{task['id']}", {'completed': True}, method='put')
+        changes = self.sync(client, 1)
+        assert [(row['id'], row['completed']) for row in changes['tasks']] == [(task['id'], True)]
+    
+    def test_deletions_leave_tombstones(self, client):
+        """Test that deleted tasks, their cascaded comments and deleted comments are reported"""
+        task = self.post_json(client, '/api/tasks', {'title': 'Task'})
+        first = self.post_json(client, '/api/comments', {'content': 'One', 'task_id': task['id']})
+        second = self.post_json(client, '/api/comments', {'content': 'Two', 'task_id': task['id']})
+        client.delete(f"/api/comments/{first['id']}")
+        revision = json.loads(client.get('/api/sync').data)['revision']
+        client.delete(f"/api/tasks/{task['id']}")
+        assert self.sync(client, 0)['deleted'] == {'tasks': [task['id']], 'comments': [first['id'], second['id']]}
+        changes = self.sync(client, revision)
+        assert changes['deleted'] == {'tasks': [task['id']], 'comments': [second['id']]}
+        assert changes['tasks'] == [] and changes['comments'] == []
+    
+    def test_bulk_writes_share_one_revision(self, client):
+        """Test that set-based bulk writes are stamped with one revision per transaction"""
+        created = self.post_json(client, '/api/tasks/bulk', {'tasks': [{'title': 'A'}, {'title': 'B'}]})
+        ids = [result['task']['id'] for result in created['results']]
+        assert json.loads(client.get('/api/sync').data)['revision'] == 1
+        self.post_json(client, '/api/tasks/bulk', {'tasks': [{'id': ids[0], 'completed': True}]}, method='patch')
+        self.post_json(client, '/api/comments/bulk', {'comments': [{'content': 'x', 'task_id': ids[0]}]})
+        client.delete('/api/tasks/bulk', data=json.dumps({'ids': [ids[1]]}), content_type='application/json')
+        changes = self.sync(client, 1)
+        assert changes['revision'] == 4
+        assert [(row['id'], row['completed']) for row in changes['tasks']] == [(ids[0], True)]
+        assert [row['content'] for row in changes['comments']] == ['x']
+        assert changes['deleted']['tasks'] == [ids[1]]
+    
+    def test_import_is_stamped(self, client):
+        """Test that imported tasks and comments are picked up by sync"""
+        body = json.dumps({'title': 'Imported', 'comments': [{'content': 'Hi'}]}) + '\n'
+        client.post('/api/import', data=body, content_type='application/x-ndjson')
+        changes = self.sync(client, 0)
+        assert [row['title'] for row in changes['tasks']] == ['Imported']
+        assert [row['content'] for row in changes['comments']] == ['Hi']
+    
+    def test_unknown_or_invalid_revision(self, client):
+        """Test that revisions ahead of the server get 410 and non-integers 400"""
+        response = client.get('/api/sync?since=5')
+        assert response.status_code == 410
+        assert json.loads(response.data)['revision'] == 0
+        assert client.get('/api/sync?since=abc').status_code == 400
+    
+    def test_too_many_changes(self, client):
+        """Test that a delta larger than SYNC_MAX_CHANGES asks for a full refetch"""
+        self.post_json(client, '/api/tasks/bulk', {'tasks': [{'title': str(i)} for i in range(3)]})
+        app.config['SYNC_MAX_CHANGES'] = 2
+        try:
+            response = client.get('/api/sync?since=0')
+        finally:
+            app.config['SYNC_MAX_CHANGES'] = 5000
+        assert response.status_code == 410
+        assert json.loads(response.data)['revision'] == 1
+    
+    def test_compaction_moves_the_horizon(self, client):
+        """Test that compacted tombstones make older positions unavailable"""
+        first = self.post_json(client, '/api/tasks', {'title': 'First'})
+        second = self.post_json(client, '/api/tasks', {'title': 'Second'})
+        client.delete(f"/api/tasks/{first['id']}")
+        with db.engine.begin() as connection:
+            assert compact_tombstones(connection, datetime.utcnow() + timedelta(seconds=1)) == 1
+        assert client.get('/api/sync?since=2').status_code == 410
+        client.delete(f"/api/tasks/{second['id']}")
+        assert self.sync(client, 3)['deleted']['tasks'] == [second['id']]
+    
+    def test_changes_are_read_from_the_revision_index(self, client):
+        """Test that the sync range scan uses the revision index"""
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT * FROM task WHERE revision > 1 AND revision <= 5 ORDER BY revision, id'
+        )).all()
+        details = ' '.join(row[-1] for row in plan)
+        assert 'ix_task_revision' in details
+        assert 'TEMP B-TREE' not in details
+
+class TestSearch:
+    def create_task(self, title, description='', comments=()):
+        task = Task(title=title, description=description)
+        db.session.add(task)
+        db.session.commit()
+        db.session.add_all([Comment(content=content, task_id=task.id) for content in comments])
+        db.session.commit()
+        return task
+    
+    def search(self, client, query):
+        response = client.get(f'/api/search?{query}')
+        assert response.status_code == 200
+        return json.loads(response.data)
+    
+    def test_matches_titles_descriptions_and_comments(self, client):
+        """Test that every indexed field is searchable"""
+        first = self.create_task('Buy groceries', 'Milk and bread')
+        second = self.create_task('Plan trip', 'Book hotels', comments=['Remember to buy sunscreen'])
+        results = self.search(client, 'q=buy')['results']
+        assert {(result['type'], result['task_id']) for result in results} == {('task', first.id), ('comment', second.id)}
+        assert self.search(client, 'q=hotels')['results'][0]['id'] == second.id
+    
+    def test_title_matches_rank_first(self, client):
+        """Test bm25 ranking with titles weighted above bodies"""
+        self.create_task('Something else', 'mentions the report once')
+        report = self.create_task('Quarterly report')
+        results = self.search(client, 'q=report')['results']
+        assert results[0]['id'] == report.id
+        assert results[0]['score'] >= results[1]['score']
+    
+    def test_highlights(self, client):
+        """Test highlighted titles and snippets"""
+        self.create_task('Fix login bug', 'The login page crashes on submit')
+        result = self.search(client, 'q=login')['results'][0]
+        assert result['title'] == 'Fix <mark>login</mark> bug'
+        assert '<mark>login</mark>' in result['snippet']
+    
+    def test_highlights_are_escaped(self, client):
+        """Test that markup in titles and bodies comes back escaped around the marks"""
+        self.create_task('<img src=x onerror=alert(1)> login', 'a "login" & <script>')
+        result = self.search(client, 'q=login')['results'][0]
+        assert result['title'] == '&lt;img src=x onerror=alert(1)&gt; <mark>login</mark>'
+        assert result['snippet'] == 'a &quot;<mark>login</mark>&quot; &amp; &lt;script&gt;'
+    
+    def test_prefix_and_stemming(self, client):
+        """Test prefix queries and porter stemming"""
+        self.create_task('Deploying the service')
+        assert len(self.search(client, 'q=deploy')['results']) == 1
+        assert len(self.search(client, 'q=serv*')['results']) == 1
+    
+    def test_pagination(self, client):
+        """Test paging through results with offset"""
+        for i in range(5):
+            self.create_task(f'Meeting {i}')
+        first_page = self.search(client, 'q=meeting&limit=3')
+        assert len(first_page['results']) == 3
+        second_page = self.search(client, f"q=meeting&limit=3&offset={first_page['next_offset']}")
+        assert len(second_page['results']) == 2
+        assert second_page['next_offset'] is None
+        ids = [result['id'] for result in first_page['results'] + second_page['results']]
+        assert len(set(ids)) == 5
+    
+    def test_index_follows_writes(self, client):
+        """Test that updates, deletes and cascades keep the index in sync"""
+        task = self.create_task('Alpha', comments=['Gamma note'])
+        client.put(f'/api/tasks/{task.id}', data=json.dumps({'title': 'Beta'}), content_type='application/json')
+        assert self.search(client, 'q=alpha')['results'] == []
+        assert len(self.search(client, 'q=beta')['results']) == 1
+        client.delete(f'/api/tasks/{task.id}')
+        assert self.search(client, 'q=beta')['results'] == []
+        assert self.search(client, 'q=gamma')['results'] == []
+    
+    def test_bulk_writes_are_indexed(self, client):
+        """Test that set-based bulk statements fire the index triggers"""
+        client.post('/api/tasks/bulk', data=json.dumps({'tasks': [{'title': 'Bulk one'}, {'title': 'Bulk two'}]}),
+                    content_type='application/json')
+        results = self.search(client, 'q=bulk')['results']
+        assert len(results) == 2
+        client.delete('/api/tasks/bulk', data=json.dumps({'ids': [result['id'] for result in results]}),
+                      content_type='application/json')
+        assert self.search(client, 'q=bulk')['results'] == []
+    
+    def test_query_syntax_is_escaped(self, client):
+        """Test that FTS5 operators in user input cannot cause errors"""
+        self.create_task('Quotes "and" parens (here)')
+        for query in ('q=%22unbalanced', 'q=AND', 'q=(here', 'q=title:here', 'q=*'):
+            response = client.get(f'/api/search?{query}')
+            assert response.status_code == 200
+    
+    def test_missing_query(self, client):
+        """Test that q is required"""
+        assert client.get('/api/search').status_code == 400
+    
+    def test_rebuild_command(self, client):
+        """Test rebuilding the index from existing rows"""
+        self.create_task('Rebuild me', comments=['And me'])
+        db.session.execute(text('DELETE FROM search_index'))
+        db.session.commit()
+        assert self.search(client, 'q=rebuild')['results'] == []
+        result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+        assert 'rebuilt' in result.output
+        assert len(self.search(client, 'q=me')['results']) == 2
+
+class TestStats:
+    def send(self, client, method, url, payload):
+        return getattr(client, method)(url, data=json.dumps(payload), content_type='application/json')
+    
+    def assert_counters_consistent(self):
+        connection = db.session.connection()
+        assert read_counters(connection) == count_actual(connection)
+    
+    def test_counters_follow_single_writes(self, client):
+        """Test counters through the single-row routes, including cascades"""
+        task = json.loads(self.send(client, 'post', '/api/tasks', {'title': 'A', 'completed': True}).data)
+        other = json.loads(self.send(client, 'post', '/api/tasks', {'title': 'B'}).data)
+        self.send(client, 'put', f"/api/tasks/{other['id']}", {'completed': True})
+        self.send(client, 'put', f"/api/tasks/{task['id']}", {'completed': False})
+        self.send(client, 'put', f"/api/tasks/{task['id']}", {'title': 'A2'})
+        comment = json.loads(self.send(client, 'post', '/api/comments', {'content': 'x', 'task_id': task['id']}).data)
+        self.send(client, 'post', '/api/comments', {'content': 'y', 'task_id': task['id']})
+        self.send(client, 'post', '/api/comments', {'content': 'z', 'task_id': other['id']})
+        self.assert_counters_consistent()
+        client.delete(f"/api/comments/{comment['id']}")
+        client.delete(f"/api/tasks/{other['id']}")
+        self.assert_counters_consistent()
+        assert read_counters(db.session.connection()) == {'tasks_total': 1, 'tasks_completed': 0, 'comments_total': 1}
+    
+    def test_counters_follow_bulk_writes(self, client):
+        """Test counters through bulk endpoints and imports"""
+        results = json.loads(self.send(client, 'post', '/api/tasks/bulk', {'tasks': [
+            {'title': 'A', 'completed': True}, {'title': 'B'}, {'title': 'C'}
+        ]}).data)['results']
+        ids = [result['task']['id'] for result in results]
+        self.send(client, 'post', '/api/comments/bulk', {'comments': [
+            {'content': 'x', 'task_id': ids[0]}, {'content': 'y', 'task_id': ids[1]}
+        ]})
+        self.send(client, 'patch', '/api/tasks/bulk', {'tasks': [
+            {'id': ids[0], 'completed': True}, {'id': ids[1], 'completed': True}, {'id': ids[2], 'title': 'C2'}
+        ]})
+        self.assert_counters_consistent()
+        self.send(client, 'delete', '/api/tasks/bulk', {'ids': [ids[0], ids[2]]})
+        self.assert_counters_consistent()
+        client.post('/api/import', data=json.dumps({'title': 'D', 'completed': True, 'comments': [{'content': 'z'}]}),
+                    content_type='application/x-ndjson')
+        self.assert_counters_consistent()
+    
+    def test_stats_response(self, client):
+        """Test totals, the per-task comment distribution and daily histograms"""
+        now = datetime.utcnow()
+        tasks = [Task(title=f'Task {i}', completed=i < 2, created_at=now - timedelta(days=i % 2)) for i in range(4)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        db.session.add_all([Comment(content='c', task_id=tasks[0].id) for _ in range(2)] +
+                           [Comment(content='c', task_id=tasks[1].id)])
+        db.session.commit()
+        
+        response = client.get('/api/stats?days=7')
+        assert response.status_code == 200
+        stats = json.loads(response.data)
+        assert stats['tasks'] == {'total': 4, 'completed': 2, 'open': 2, 'completion_rate': 0.5}
+        assert stats['comments']['total'] == 3
+        assert stats['comments']['per_task_distribution'] == [
+            {'comments': 0, 'tasks': 2}, {'comments': 1, 'tasks': 1}, {'comments': 2, 'tasks': 1}
+        ]
+        days = stats['created_per_day']['tasks']
+        assert [day['count'] for day in days] == [2, 2]
+        assert days[-1]['date'] == now.date().isoformat()
+    
+    def test_stats_etag(self, client):
+        """Test that stats support conditional GET and change after writes"""
+        etag = client.get('/api/stats').headers['ETag']
+        assert client.get('/api/stats', headers={'If-None-Match': etag}).status_code == 304
+        self.send(client, 'post', '/api/tasks', {'title': 'A'})
+        response = client.get('/api/stats', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['tasks']['total'] == 1
+    
+    def test_invalid_days(self, client):
+        """Test that the histogram window is validated"""
+        assert client.get('/api/stats?days=0').status_code == 400
+        assert client.get('/api/stats?days=abc').status_code == 400
+    
+    def test_check_and_repair_command(self, client):
+        """Test detecting and repairing drifted counters"""
+        self.send(client, 'post', '/api/tasks', {'title': 'A'})
+        db.session.execute(text("UPDATE stat_counter SET value = 42 WHERE name = 'tasks_total'"))
+        db.session.commit()
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['check-stats'])
+        assert result.exit_code == 1
+        assert 'tasks_total: stored 42, actual 1' in result.output
+        result = runner.invoke(args=['check-stats', '--repair'])
+        assert 'repaired' in result.output
+        assert runner.invoke(args=['check-stats']).exit_code == 0
+        assert json.loads(client.get('/api/stats').data)['tasks']['total'] == 1
+
+class TestInstrumentation:
+    def test_metrics_endpoint(self, client):
+        """Test that request, size and SQL metrics are exposed in Prometheus format"""
+        client.post('/api/tasks', data=json.dumps({'title': 'Task'}), content_type='application/json')
+        client.get('/api/tasks/1')
+        response = client.get('/api/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        body = response.get_data(as_text=True)
+        assert 'http_request_duration_seconds_count{method="POST",endpoint="/api/tasks"}' in body
+        assert 'http_requests_total{method="GET",endpoint="/api/tasks/<int:task_id>",status="200"}' in body
+        assert 'http_response_size_bytes_count{method="POST",endpoint="/api/tasks"}' in body
+        assert 'db_statements_per_request_bucket' in body
+        assert 'db_statement_duration_seconds_count' in body
+        assert 'cache_operations{result="hit"}' in body
+    
+    def test_status_codes_and_sql_counts(self, client):
+        """Test per-status counters and per-request SQL statement counts"""
+        labels = {'method': 'GET', 'endpoint': '/api/tasks/<int:task_id>'}
+        before = REQUESTS_TOTAL.value(status=404, **labels)
+        statements = REQUEST_SQL_STATEMENTS.snapshot(**labels) or {'sum': 0, 'count': 0}
+        client.get('/api/tasks/999')
+        assert REQUESTS_TOTAL.value(status=404, **labels) == before + 1
+        after = REQUEST_SQL_STATEMENTS.snapshot(**labels)
+        assert after['count'] == statements['count'] + 1
+        assert after['sum'] > statements['sum']
+    
+    def test_slow_request_log_shows_repeated_sql(self, client, caplog):
+        """Test that the slow-request log groups repeated statements"""
+        tasks = [Task(title=f'Task {i}') for i in range(3)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        
+        app.config['SLOW_REQUEST_LOG_ENABLED'] = True
+        app.config['SLOW_REQUEST_THRESHOLD_MS'] = 0
+        try:
+            with caplog.at_level('WARNING'), app.test_request_context('/api/tasks'):
+                start_request_timer()
+                # Lazy-loading task.comments issues one query per task
+                [len(task.comments) for task in Task.query.all()]
+                record_request_metrics(app.response_class('{}'))
+        finally:
+            app.config['SLOW_REQUEST_LOG_ENABLED'] = False
+            app.config['SLOW_REQUEST_THRESHOLD_MS'] = 500
+        message = caplog.records[-1].getMessage()
+        assert 'Slow request: GET /api/tasks' in message
+        assert '3x' in message
+        assert 'FROM comment' in message
+        assert '<-- repeated' in message
+
+class TestWriteBehind:
+    def enable(self, monkeypatch):
+        monkeypatch.setitem(app.config, 'WRITE_BEHIND_ENABLED', True)
+        # Flushed by the requests below, never by the background thread
+        monkeypatch.setitem(app.config, 'WRITE_BEHIND_INTERVAL_MS', 3600 * 1000)
+    
+    def create_task(self, client):
+        response = client.post('/api/tasks', data=json.dumps({'title': 'Task'}), content_type='application/json')
+        return json.loads(response.data)
+    
+    def put(self, client, task_id, data, headers=None):
+        return client.put(f'/api/tasks/{task_id}', data=json.dumps(data), content_type='application/json', headers=headers)
+    
+    def stored(self, task_id):
+        return db.session.execute(db.select(Task.title, Task.completed).where(Task.id == task_id)).one()
+    
+    def test_updates_are_merged_and_read_back(self, client, monkeypatch):
+        """Test that buffered updates are visible to single-task reads before they are written"""
+        self.enable(monkeypatch)
+        task = self.create_task(client)
+        assert self.put(client, task['id'], {'completed': True}).status_code == 200
+        response = self.put(client, task['id'], {'title': 'Renamed'})
+        updated = json.loads(response.data)
+        assert (updated['title'], updated['completed']) == ('Renamed', True)
+        assert tuple(self.stored(task['id'])) == ('Task', False)
+        read = client.get(f"/api/tasks/{task['id']}")
+        assert json.loads(read.data) == updated
+        assert read.headers['ETag'] == response.headers['ETag']
+        stats = json.loads(client.get('/api/write-behind/stats').data)
+        assert (stats['pending'], stats['updates'], stats['coalesced']) == (1, 2, 1)
+    
+    def test_other_requests_flush_first(self, client, monkeypatch):
+        """Test that a list read commits the merged update once, with one event and consistent counters"""
+        self.enable(monkeypatch)
+        task = self.create_task(client)
+        for completed in (True, False, True):
+            self.put(client, task['id'], {'completed': completed})
+        tasks = json.loads(client.get('/api/tasks').data)['tasks']
+        assert tasks[0]['completed'] is True
+        assert tuple(self.stored(task['id'])) == ('Task', True)
+        events = get_event_log().read_since(0)[0]
+        assert [event.type for event in events] == ['task.created', 'task.updated']
+        assert events[1].data['completed'] is True
+        connection = db.session.connection()
+        assert read_counters(connection) == count_actual(connection)
+        assert json.loads(client.get('/api/write-behind/stats').data)['flushes'] == 1
+    
+    def test_preconditions_and_validation(self, client, monkeypatch):
+        """Test If-Match against the buffered version, invalid values and missing tasks"""
+        self.enable(monkeypatch)
+        task = self.create_task(client)
+        first = self.put(client, task['id'], {'completed': True})
+        current = client.get(f"/api/tasks/{task['id']}").headers['ETag']
+        assert self.put(client, task['id'], {'title': 'Renamed'}, headers={'If-Match': current}).status_code == 200
+        assert self.put(client, task['id'], {'title': 'Again'}, headers={'If-Match': first.headers['ETag']}).status_code == 412
+        assert self.put(client, task['id'], {'completed': 'yes'}).status_code == 400
+        assert self.put(client, task['id'], {}).status_code == 400
+        assert self.put(client, 999, {'completed': True}).status_code == 404
+    
+    def test_deleted_tasks_are_skipped(self, client, monkeypatch):
+        """Test that an update buffered for a task deleted elsewhere is dropped"""
+        self.enable(monkeypatch)
+        task = self.create_task(client)
+        self.put(client, task['id'], {'completed': True})
+        db.session.execute(delete(Task).where(Task.id == task['id']))
+        db.session.commit()
+        assert get_write_buffer().flush() == 1
+        assert Task.query.count() == 0
+
+class TestRateLimiting:
+    def limit(self, monkeypatch, **config):
+        monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+        for name, value in config.items():
+            monkeypatch.setitem(app.config, name, value)
+        app.extensions.pop('ratelimit', None)
+        app.extensions.pop('write_limiter', None)
+    
+    def create(self, client, **kwargs):
+        return client.post('/api/tasks', data=json.dumps({'title': 'Task'}), content_type='application/json', **kwargs)
+    
+    def test_write_budget(self, client, monkeypatch):
+        """Test that writes beyond the burst get 429 with Retry-After while reads go on"""
+        self.limit(monkeypatch, RATELIMIT_WRITE_RATE=0.25, RATELIMIT_WRITE_BURST=2)
+        assert [self.create(client).status_code for _ in range(3)] == [201, 201, 429]
+        response = self.create(client)
+        assert response.headers['Retry-After'] == '4'
+        assert 'write' in json.loads(response.data)['error']
+        assert client.get('/api/tasks').status_code == 200
+        assert Task.query.count() == 2
+    
+    def test_read_budget(self, client, monkeypatch):
+        """Test that reads have their own budget and exempt routes are never limited"""
+        self.limit(monkeypatch, RATELIMIT_READ_RATE=1, RATELIMIT_READ_BURST=1)
+        assert [client.get('/api/tasks').status_code for _ in range(2)] == [200, 429]
+        assert client.get('/api/health').status_code == 200
+        assert self.create(client).status_code == 201
+    
+    def test_clients_are_limited_separately(self, client, monkeypatch):
+        """Test buckets per address and per configured API key"""
+        self.limit(monkeypatch, RATELIMIT_WRITE_BURST=1, RATELIMIT_API_KEYS=frozenset({'alpha', 'beta'}))
+        assert self.create(client).status_code == 201
+        assert self.create(client).status_code == 429
+        assert self.create(client, environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 201
+        assert self.create(client, headers={'X-API-Key': 'alpha'}).status_code == 201
+        assert self.create(client, headers={'X-API-Key': 'alpha'}).status_code == 429
+        assert self.create(client, headers={'X-API-Key': 'beta'}).status_code == 201
+    
+    def test_unknown_api_keys_share_the_address_bucket(self, client, monkeypatch):
+        """Test that keys outside RATELIMIT_API_KEYS cannot be used to get fresh buckets"""
+        self.limit(monkeypatch, RATELIMIT_WRITE_BURST=1, RATELIMIT_API_KEYS=frozenset({'alpha'}))
+        assert self.create(client, headers={'X-API-Key': 'made-up-1'}).status_code == 201
+        assert self.create(client, headers={'X-API-Key': 'made-up-2'}).status_code == 429
+        assert self.create(client, headers={'X-API-Key': 'alpha'}).status_code == 201
+        # With no keys configured, every key is unknown
+        self.limit(monkeypatch, RATELIMIT_WRITE_BURST=1, RATELIMIT_API_KEYS=frozenset())
+        assert self.create(client, headers={'X-API-Key': 'made-up-3'}).status_code == 201
+        assert self.create(client, headers={'X-API-Key': 'made-up-4'}).status_code == 429
+    
+    def test_writes_are_shed_when_the_queue_is_full(self, client, monkeypatch):
+        """Test that writes beyond the concurrency limit and queue get 503 with Retry-After"""
+        self.limit(monkeypatch, WRITE_CONCURRENCY=1, WRITE_QUEUE=0)
+        limiter = get_write_limiter()
+        assert limiter.acquire()
+        try:
+            response = self.create(client)
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '1'
+            assert client.get('/api/tasks').status_code == 200
+        finally:
+            limiter.release()
+        assert self.create(client).status_code == 201
+        assert self.create(client).status_code == 201
+        assert limiter.stats()['rejected'] == 1
+    
+    def test_stats(self, client, monkeypatch):
+        """Test the limiter status endpoint"""
+        self.limit(monkeypatch, RATELIMIT_WRITE_BURST=1)
+        self.create(client)
+        self.create(client)
+        stats = json.loads(client.get('/api/ratelimit/stats').data)
+        assert stats['enabled'] is True
+        assert stats['backend'] == 'memory'
+        assert stats['allowed']['write'] == 1 and stats['limited']['write'] == 1
+        assert stats['writes']['active'] == 0
+        assert stats['writes']['max_active'] == app.config['WRITE_CONCURRENCY']
+
+class TestJobs:
+    def create_task(self, comments=0):
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        db.session.add_all([Comment(content=f'Comment {i}', task_id=task.id) for i in range(comments)])
+        db.session.commit()
+        return task.id
+    
+    def get_job(self, client, job_id):
+        response = client.get(f'/api/jobs/{job_id}')
+        assert response.status_code == 200
+        return json.loads(response.data)
+    
+    def test_large_delete_runs_as_job(self, client):
+        """Test that deleting a task with many comments is queued and finished by a worker"""
+        task_id = self.create_task(comments=7)
+        app.config['DELETE_ASYNC_MIN_COMMENTS'] = 5
+        app.config['DELETE_BATCH_SIZE'] = 3
+        try:
+            response = client.delete(f'/api/tasks/{task_id}')
+            assert response.status_code == 202
+            job = json.loads(response.data)
+            assert response.headers['Location'] == f"/api/jobs/{job['id']}"
+            assert (job['kind'], job['status']) == ('delete_task', 'queued')
+            assert Comment.query.count() == 7
+            assert get_job_queue().run_pending() == 1
+        finally:
+            app.config['DELETE_ASYNC_MIN_COMMENTS'] = 1000
+            app.config['DELETE_BATCH_SIZE'] = 500
+        job = self.get_job(client, job['id'])
+        assert job['status'] == 'succeeded'
+        assert job['result'] == {'task_id': task_id, 'deleted_comments': 7}
+        assert job['started_at'] is not None and job['finished_at'] is not None
+        assert client.get(f'/api/tasks/{task_id}').status_code == 404
+        connection = db.session.connection()
+        assert read_counters(connection) == count_actual(connection)
+        deleted = json.loads(client.get('/api/sync?since=0').data)['deleted']
+        assert deleted['tasks'] == [task_id]
+        assert len(deleted['comments']) == 7
+    
+    def test_small_delete_is_immediate(self, client):
+        """Test that a task with few comments is deleted in the request, without a job"""
+        task_id = self.create_task(comments=2)
+        response = client.delete(f'/api/tasks/{task_id}')
+        assert response.status_code == 200
+        assert Task.query.count() == 0 and Comment.query.count() == 0
+        assert get_job_queue().run_pending() == 0
+    
+    def test_async_flag_overrides_threshold(self, client):
+        """Test forcing a job with ?async=true and rejecting invalid values"""
+        task_id = self.create_task()
+        assert client.delete(f'/api/tasks/{task_id}?async=maybe').status_code == 400
+        first = client.delete(f'/api/tasks/{task_id}?async=true')
+        second = client.delete(f'/api/tasks/{task_id}?async=true')
+        assert first.status_code == second.status_code == 202
+        # A delete already queued for the task is reused rather than queued twice
+        assert json.loads(first.data)['id'] == json.loads(second.data)['id']
+        assert get_job_queue().run_pending() == 1
+        assert Task.query.count() == 0
+        assert client.delete(f'/api/tasks/{task_id}?async=true').status_code == 404
+    
+    def test_async_import(self, client, tmp_path, monkeypatch):
+        """Test that large imports are spooled to a file, queued, and report the usual summary as the result"""
+        monkeypatch.setitem(app.config, 'IMPORT_SPOOL_DIR', str(tmp_path))
+        monkeypatch.setitem(app.config, 'IMPORT_ASYNC_MIN_BYTES', 10)
+        body = ''.join(json.dumps({'title': f'Task {i}', 'comments': [{'content': 'Hi'}]}) + '\n' for i in range(3))
+        response = client.post('/api/import', data=body + 'not json\n', content_type='application/x-ndjson')
+        assert response.status_code == 202
+        assert Task.query.count() == 0
+        # Only a reference to the spooled body is stored on the job
+        payload = json.loads(db.session.scalar(db.select(Job.payload).where(Job.id == json.loads(response.data)['id'])))
+        assert list(payload) == ['path']
+        assert open(payload['path']).read() == body + 'not json\n'
+        get_job_queue().run_pending()
+        result = self.get_job(client, json.loads(response.data)['id'])['result']
+        assert (result['imported_tasks'], result['imported_comments']) == (3, 3)
+        assert [error['line'] for error in result['errors']] == [4]
+        assert Task.query.count() == 3
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_only_jobs_without_heartbeats_are_stale(self, client):
+        """Test that a long job with a fresh heartbeat is left running while a silent one is failed"""
+        now = datetime.utcnow()
+        long_ago = now - timedelta(hours=2)
+        jobs = [
+            Job(kind='archive', payload='{}', status='running', started_at=long_ago, heartbeat_at=now),
+            Job(kind='archive', payload='{}', status='running', started_at=long_ago, heartbeat_at=long_ago),
+            Job(kind='archive', payload='{}', status='running', started_at=long_ago),
+        ]
+        db.session.add_all(jobs)
+        db.session.commit()
+        job_ids = [job.id for job in jobs]
+        with db.engine.begin() as connection:
+            assert fail_stale_jobs(connection, now - timedelta(seconds=app.config['JOBS_STALE_SECONDS'])) == 2
+        db.session.expire_all()
+        assert [self.get_job(client, job_id)['status'] for job_id in job_ids] == ['running', 'failed', 'failed']
+    
+    def test_heartbeat(self, client):
+        """Test that a heartbeat stamps only a job that is still running"""
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        running = Job(kind='archive', payload='{}', status='running', started_at=long_ago, heartbeat_at=long_ago)
+        finished = Job(kind='archive', payload='{}', status='succeeded', started_at=long_ago, heartbeat_at=long_ago)
+        db.session.add_all([running, finished])
+        db.session.commit()
+        job_ids = [running.id, finished.id]
+        for job_id in job_ids:
+            record_job_heartbeat(app, job_id)
+        db.session.expire_all()
+        heartbeats = [self.get_job(client, job_id)['heartbeat_at'] for job_id in job_ids]
+        assert heartbeats[0] > long_ago.isoformat() and heartbeats[1] == long_ago.isoformat()
+    
+    def test_failed_job(self, client):
+        """Test a delete job whose task is already gone, and a handler error failing its job"""
+        task_id = self.create_task()
+        response = client.delete(f'/api/tasks/{task_id}?async=true')
+        db.session.delete(db.session.get(Task, task_id))
+        db.session.commit()
+        # The task vanished before the job ran: the job still succeeds, deleting nothing
+        get_job_queue().run_pending()
+        assert self.get_job(client, json.loads(response.data)['id'])['result']['deleted_comments'] == 0
+        
+        response = client.post('/api/import?async=true', data='{"title": "Task"}', content_type='application/x-ndjson')
+        job_id = json.loads(response.data)['id']
+        os.remove(json.loads(db.session.scalar(db.select(Job.payload).where(Job.id == job_id)))['path'])
+        assert get_job_queue().run_pending() == 1
+        job = self.get_job(client, job_id)
+        assert job['status'] == 'failed'
+        assert 'No such file or directory' in job['error']
+    
+    def test_search_rebuild(self, client):
+        """Test that rebuilding the search index is queued as a job"""
+        self.create_task()
+        response = client.post('/api/search/rebuild')
+        if response.status_code == 501:
+            pytest.skip('SQLite without FTS5')
+        assert response.status_code == 202
+        get_job_queue().run_pending()
+        assert self.get_job(client, json.loads(response.data)['id'])['status'] == 'succeeded'
+        assert json.loads(client.get('/api/search?q=task').data)['results'][0]['task_id'] == Task.query.one().id
+    
+    def test_job_stats_and_missing_job(self, client):
+        """Test queue statistics and 404 for unknown jobs"""
+        client.delete(f'/api/tasks/{self.create_task()}?async=true')
+        stats = json.loads(client.get('/api/jobs/stats').data)
+        assert stats['jobs'] == {'queued': 1}
+        assert stats['workers'] == 0
+        assert client.get('/api/jobs/999').status_code == 404
+
+class TestArchival:
+    def create_task(self, completed=True, age_days=100, comments=0):
+        stamp = datetime.utcnow() - timedelta(days=age_days)
+        task = Task(title='Task', completed=completed, created_at=stamp, updated_at=stamp)
+        db.session.add(task)
+        db.session.commit()
+        db.session.add_all([
+            Comment(content=f'Comment {i}', task_id=task.id, created_at=stamp + timedelta(minutes=i))
+            for i in range(comments)
+        ])
+        db.session.commit()
+        return task.id
+    
+    def archive(self, client, **body):
+        response = client.post('/api/archive', data=json.dumps(body), content_type='application/json')
+        assert response.status_code == 202
+        get_job_queue().run_pending()
+        return json.loads(client.get(response.headers['Location']).data)['result']
+    
+    def test_policy_moves_old_completed_tasks(self, client):
+        """Test that only completed tasks older than the cutoff move, in batches, with their comments"""
+        old_ids = [self.create_task(comments=2) for _ in range(3)]
+        open_id = self.create_task(completed=False)
+        recent_id = self.create_task(age_days=1)
+        app.config['ARCHIVE_BATCH_SIZE'] = 2
+        try:
+            result = self.archive(client, days=30)
+        finally:
+            app.config['ARCHIVE_BATCH_SIZE'] = 500
+        assert result == {'archived_tasks': 3, 'archived_comments': 6}
+        assert sorted(task.id for task in Task.query.all()) == [open_id, recent_id]
+        assert Comment.query.count() == 0
+        connection = db.session.connection()
+        assert read_counters(connection) == count_actual(connection)
+        deleted = json.loads(client.get('/api/sync?since=0').data)['deleted']
+        assert sorted(deleted['tasks']) == old_ids
+    
+        response_data = json.loads(client.get('/api/tasks?archived=true').data)
+        assert [task['id'] for task in response_data['tasks']] == old_ids
+        assert all(task['comment_count'] == 2 and task['archived_at'] for task in response_data['tasks'])
+    
+    def test_archived_reads(self, client):
+        """Test reading an archived task and its comments, and that hot reads no longer see them"""
+        task_id = self.create_task(comments=3)
+        self.archive(client)
+        assert client.get(f'/api/tasks/{task_id}').status_code == 404
+    
+        response = client.get(f'/api/tasks/{task_id}?archived=true&include=comments')
+        assert response.status_code == 200
+        task = json.loads(response.data)
+        assert task['comment_count'] == 3 and 'archived_at' in task
+        assert [comment['content'] for comment in task['comments']] == ['Comment 0', 'Comment 1', 'Comment 2']
+        assert client.get(f'/api/tasks/{task_id}?archived=true', headers={'If-None-Match': response.headers['ETag']}).status_code == 200
+    
+        response_data = json.loads(client.get(f'/api/tasks/{task_id}/comments?archived=true&limit=2').data)
+        assert len(response_data['comments']) == 2 and response_data['next_cursor'] is not None
+        assert client.get(f'/api/tasks/{task_id}/comments').status_code == 404
+        assert client.get('/api/tasks?archived=maybe').status_code == 400
+    
+    def test_restore(self, client):
+        """Test that a restored task comes back with its ids, comments and counters"""
+        task_id = self.create_task(comments=2)
+        self.archive(client)
+        assert client.get(f'/api/tasks/{task_id}?archived=true').status_code == 200
+    
+        response = client.post(f'/api/tasks/{task_id}/restore')
+        assert response.status_code == 200
+        assert json.loads(response.data)['comment_count'] == 2
+        assert client.get(f'/api/tasks/{task_id}?archived=true').status_code == 404
+        assert json.loads(client.get(f'/api/tasks/{task_id}/comments').data)['comments'][1]['content'] == 'Comment 1'
+        assert json.loads(client.get('/api/tasks?archived=true').data)['tasks'] == []
+        connection = db.session.connection()
+        assert read_counters(connection) == count_actual(connection)
+        sync = json.loads(client.get('/api/sync?since=0').data)
+        assert [task['id'] for task in sync['tasks']] == [task_id]
+        assert client.post(f'/api/tasks/{task_id}/restore').status_code == 404
+    
+    def test_restored_task_is_not_archived_again(self, client):
+        """Test that a restore counts as an update, so the next archive run leaves the task alone"""
+        task_id = self.create_task(comments=1)
+        self.archive(client)
+        response = client.post(f'/api/tasks/{task_id}/restore')
+        assert json.loads(response.data)['updated_at'] > (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+        assert self.archive(client) == {'archived_tasks': 0, 'archived_comments': 0}
+        assert client.get(f'/api/tasks/{task_id}').status_code == 200
+    
+    def test_ids_are_not_reused_after_archiving(self, client):
+        """Test that a task created after the newest tasks were archived gets a fresh id and archives too"""
+        archived_ids = [self.create_task() for _ in range(3)]
+        assert self.archive(client) == {'archived_tasks': 3, 'archived_comments': 0}
+        task_id = self.create_task(comments=1)
+        assert task_id > max(archived_ids)
+        assert self.archive(client) == {'archived_tasks': 1, 'archived_comments': 1}
+        response_data = json.loads(client.get('/api/tasks?archived=true').data)
+        assert [task['id'] for task in response_data['tasks']] == archived_ids + [task_id]
+    
+    def test_reused_ids_do_not_stall_the_policy(self, client):
+        """Test that a task holding an archived id, as before ids were AUTOINCREMENT, is skipped"""
+        task_id = self.create_task()
+        self.archive(client)
+        db.session.add(Task(id=task_id, title='Reused id', completed=True, updated_at=datetime.utcnow() - timedelta(days=100)))
+        db.session.commit()
+        other_id = self.create_task()
+        assert self.archive(client) == {'archived_tasks': 1, 'archived_comments': 0}
+        assert [task.id for task in Task.query.all()] == [task_id]
+        assert client.get(f'/api/tasks/{other_id}?archived=true').status_code == 200
+    
+    def test_restore_conflicts_with_reused_id(self, client):
+        """Test that a restore is refused when a row written with an explicit id took the archived task's id"""
+        task_id = self.create_task()
+        self.archive(client)
+        db.session.add(Task(id=task_id, title='Newer task'))
+        db.session.commit()
+        assert client.post(f'/api/tasks/{task_id}/restore').status_code == 409
+        assert client.get(f'/api/tasks/{task_id}?archived=true').status_code == 200
+    
+    def test_invalid_days(self, client):
+        """Test validation of the archive request body"""
+        for body in ({'days': -1}, {'days': 'ten'}, {'days': True}):
+            response = client.post('/api/archive', data=json.dumps(body), content_type='application/json')
+            assert response.status_code == 400
+
+class TestCommentThreads:
+    def create_task_with_comments(self, count, stamp=None):
+        task = Task(title='Task')
+        db.session.add(task)
+        db.session.commit()
+        base = datetime(2024, 1, 1)
+        db.session.add_all([
+            Comment(content=f'Comment {i}', task_id=task.id, created_at=stamp or base + timedelta(minutes=i))
+            for i in range(count)
+        ])
+        db.session.commit()
+        return task.id
+    
+    def collect_pages(self, client, url):
+        contents = []
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            response_data = json.loads(response.data)
+            contents.extend(comment['content'] for comment in response_data['comments'])
+            cursor = response_data['next_cursor']
+            url = f"{url.split('&cursor=')[0]}&cursor={cursor}" if cursor else None
+        return contents
+    
+    def comment_count(self, client, task_id):
+        return json.loads(client.get(f'/api/tasks/{task_id}').data)['comment_count']
+    
+    def test_pages_cover_all_comments_in_order(self, client):
+        """Test walking a task's comments oldest first with the cursor"""
+        task_id = self.create_task_with_comments(7)
+        contents = self.collect_pages(client, f'/api/tasks/{task_id}/comments?limit=3')
+        assert contents == [f'Comment {i}' for i in range(7)]
+    
+    def test_ties_on_created_at_are_broken_by_id(self, client):
+        """Test that comments sharing a timestamp are neither skipped nor repeated"""
+        task_id = self.create_task_with_comments(5, stamp=datetime(2024, 1, 1))
+        contents = self.collect_pages(client, f'/api/tasks/{task_id}/comments?limit=2')
+        assert contents == [f'Comment {i}' for i in range(5)]
+    
+    def test_page_size_is_capped(self, client):
+        """Test the default and maximum page sizes"""
+        task_id = self.create_task_with_comments(3)
+        app.config['TASK_COMMENTS_MAX_LIMIT'] = 2
+        try:
+            response_data = json.loads(client.get(f'/api/tasks/{task_id}/comments?limit=50').data)
+        finally:
+            app.config['TASK_COMMENTS_MAX_LIMIT'] = 100
+        assert len(response_data['comments']) == 2
+        assert response_data['next_cursor'] is not None
+    
+    def test_missing_task_and_task_without_comments(self, client):
+        """Test that one query tells a missing task from an empty thread"""
+        task_id = self.create_task_with_comments(0)
+        response = client.get(f'/api/tasks/{task_id}/comments')
+        assert json.loads(response.data) == {'comments': [], 'next_cursor': None}
+        assert client.get(f'/api/tasks/{task_id + 1}/comments').status_code == 404
+        assert client.get(f'/api/tasks/{task_id}/comments?cursor=bogus').status_code == 400
+    
+    def test_deleted_task_is_not_served_from_cache(self, client):
+        """Test that a task's empty thread turns into a 404 once the task is deleted"""
+        task_id = self.create_task_with_comments(0)
+        etag = client.get(f'/api/tasks/{task_id}/comments').headers['ETag']
+        client.delete(f'/api/tasks/{task_id}')
+        assert client.get(f'/api/tasks/{task_id}/comments', headers={'If-None-Match': etag}).status_code == 404
+    
+    def test_comment_count_follows_comment_writes(self, client):
+        """Test that comment_count tracks single, bulk and cascading comment writes"""
+        task_id = self.create_task_with_comments(2)
+        other_id = self.create_task_with_comments(1)
+        assert self.comment_count(client, task_id) == 2
+        comment = json.loads(client.post('/api/comments', data=json.dumps({'content': 'New', 'task_id': task_id}),
+                                         content_type='application/json').data)
+        assert self.comment_count(client, task_id) == 3
+        client.post('/api/comments/bulk', data=json.dumps({'comments': [
+            {'content': 'a', 'task_id': task_id}, {'content': 'b', 'task_id': other_id},
+        ]}), content_type='application/json')
+        assert self.comment_count(client, task_id) == 4
+        assert self.comment_count(client, other_id) == 2
+        client.delete(f"/api/comments/{comment['id']}")
+        assert self.comment_count(client, task_id) == 3
+        listed = json.loads(client.get('/api/tasks').data)['tasks']
+        assert [task['comment_count'] for task in listed] == [3, 2]
+        actual = db.session.execute(
+            db.select(Comment.task_id, db.func.count()).group_by(Comment.task_id).order_by(Comment.task_id)
+        ).all()
+        assert [tuple(row) for row in actual] == [(task_id, 3), (other_id, 2)]
+    
+    def test_comment_count_for_imported_tasks(self, client):
+        """Test that comments inserted by an import are counted on their tasks"""
+        body = json.dumps({'title': 'Imported', 'comments': [{'content': 'x'}, {'content': 'y'}]}) + '\n'
+        client.post('/api/import', data=body, content_type='application/x-ndjson')
+        assert json.loads(client.get('/api/tasks').data)['tasks'][0]['comment_count'] == 2
+    
+    def test_new_comment_changes_task_etag(self, client):
+        """Test that a task's ETag changes with its comment_count, not just its updated_at"""
+        task_id = self.create_task_with_comments(0)
+        response = client.get(f'/api/tasks/{task_id}')
+        etag, updated_at = response.headers['ETag'], json.loads(response.data)['updated_at']
+        client.post('/api/comments', data=json.dumps({'content': 'New', 'task_id': task_id}),
+                    content_type='application/json')
+        response = client.get(f'/api/tasks/{task_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['updated_at'] == updated_at
+
 class TestCommentAPI:
     def test_get_comments_empty(self, client):
         """Test getting comments when none exist"""
@@ -0,0 +1,284 @@
+import asyncio
+import gzip
+import json
+import pytest
+from flask import has_app_context
+from app import app, db, Task, Comment
+from app import get_cache, get_event_log, get_job_queue, get_write_limiter, count_actual, read_counters
+import asgi
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    # Jobs run explicitly through get_job_queue().run_pending()
+    app.config['JOBS_WORKERS'] = 0
+    # Exercised by the rate limiting tests only
+    app.config['RATELIMIT_ENABLED'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            get_cache().clear()
+            app.extensions.pop('events', None)
+            app.extensions.pop('jobs', None)
+            app.extensions.pop('ratelimit', None)
+            app.extensions.pop('write_limiter', None)
+            app.extensions.pop('write_buffer', None)
+            yield client
+
+def asgi_request(method, path, data=None, headers=None):
+    """Send one request through the ASGI application and return (status, headers, body)"""
+    path, _, query_string = path.partition('?')
+    body = json.dumps(data).encode() if data is not None else b''
+    header_list = [(b'content-type', b'application/json')] + [
+        (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+    ]
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query_string.encode(),
+        'headers': header_list, 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def run():
+        request_messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if request_messages:
+                return request_messages.pop()
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            messages.append(message)
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            # Pooled aiosqlite connections belong to this event loop
+            await asgi.engine.dispose()
+    asyncio.run(run())
+
+    start = messages[0]
+    response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+    content = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], response_headers, content
+
+def asgi_json(method, path, data=None, headers=None):
+    status, _, content = asgi_request(method, path, data, headers)
+    return status, json.loads(content) if content else None
+
+class TestApplicationContext:
+    @pytest.fixture
+    def database(self):
+        app.config['TESTING'] = True
+        app.config['JOBS_WORKERS'] = 0
+        app.config['RATELIMIT_ENABLED'] = False
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            get_cache().clear()
+
+    def test_async_handlers_push_an_app_context(self, database):
+        """Test the async routes with no app context pushed beforehand, as under uvicorn"""
+        assert not has_app_context()
+        status, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        assert status == 201
+        assert asgi_json('GET', f"/api/tasks/{task['id']}")[1] == task
+        assert asgi_json('GET', '/api/tasks')[1]['tasks'] == [task]
+
+class TestASGITasks:
+    def test_create_and_get_task(self, client):
+        """Test creating a task and reading it back through the async handlers"""
+        status, task = asgi_json('POST', '/api/tasks', {'title': 'Async task', 'description': 'via ASGI'})
+        assert status == 201
+        assert task['title'] == 'Async task'
+        assert task['completed'] is False
+        status, fetched = asgi_json('GET', f"/api/tasks/{task['id']}")
+        assert status == 200
+        assert fetched == task
+
+    def test_create_task_missing_title(self, client):
+        """Test that the same validation error is returned"""
+        assert asgi_json('POST', '/api/tasks', {'description': 'x'}) == (400, {'error': 'Title is required'})
+
+    def test_listing_matches_flask(self, client):
+        """Test that pagination, filters and embedded comments match the Flask routes"""
+        tasks = [Task(title=f'Task {i}', completed=i % 2 == 0) for i in range(5)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        db.session.add(Comment(content='Hi', task_id=tasks[0].id))
+        db.session.commit()
+        for query in ('limit=2', 'limit=2&sort=-created_at&completed=true', 'include=comments&limit=3',
+                      'fields=title&limit=2&sort=-updated_at'):
+            status, listing = asgi_json('GET', f'/api/tasks?{query}')
+            assert status == 200
+            assert listing == json.loads(client.get(f'/api/tasks?{query}').data)
+        _, first_page = asgi_json('GET', '/api/tasks?limit=2')
+        _, second_page = asgi_json('GET', f"/api/tasks?limit=2&cursor={first_page['next_cursor']}")
+        assert [task['title'] for task in second_page['tasks']] == ['Task 2', 'Task 3']
+
+    def test_invalid_arguments(self, client):
+        """Test that shared argument parsing errors become 400 responses"""
+        status, body = asgi_json('GET', '/api/tasks?cursor=bogus')
+        assert status == 400
+        assert body == {'error': 'Invalid cursor'}
+
+    def test_conditional_requests(self, client):
+        """Test that ETags are shared with the Flask routes and answered with 304"""
+        asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        status, headers, _ = asgi_request('GET', '/api/tasks')
+        assert status == 200
+        assert headers['etag'] == client.get('/api/tasks').headers['ETag']
+        status, _, content = asgi_request('GET', '/api/tasks', headers={'If-None-Match': headers['etag']})
+        assert status == 304
+        assert content == b''
+
+    def test_update_with_if_match(self, client):
+        """Test optimistic concurrency on PUT"""
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        status, headers, _ = asgi_request('GET', f"/api/tasks/{task['id']}")
+        status, updated = asgi_json('PUT', f"/api/tasks/{task['id']}", {'completed': True},
+                                    headers={'If-Match': headers['etag']})
+        assert status == 200
+        assert updated['completed'] is True
+        status, _ = asgi_json('PUT', f"/api/tasks/{task['id']}", {'title': 'Stale'},
+                              headers={'If-Match': headers['etag']})
+        assert status == 412
+        # The write invalidated the cached task for the Flask routes too
+        assert json.loads(client.get(f"/api/tasks/{task['id']}").data)['completed'] is True
+
+    def test_delete_task_cascades(self, client):
+        """Test that deleting a task removes its comments and keeps counters in sync"""
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        asgi_json('POST', '/api/comments', {'content': 'Hi', 'task_id': task['id']})
+        assert asgi_json('DELETE', f"/api/tasks/{task['id']}")[0] == 200
+        assert asgi_json('GET', f"/api/tasks/{task['id']}")[0] == 404
+        assert Comment.query.count() == 0
+        with db.engine.connect() as connection:
+            assert read_counters(connection) == count_actual(connection)
+
+    def test_delete_task_as_job(self, client):
+        """Test that ?async=true queues the delete and answers 202 with the job's URL"""
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        status, headers, body = asgi_request('DELETE', f"/api/tasks/{task['id']}?async=true")
+        job = json.loads(body)
+        assert status == 202
+        assert headers['location'] == f"/api/jobs/{job['id']}"
+        assert get_job_queue().run_pending() == 1
+        assert asgi_json('GET', f"/api/tasks/{task['id']}")[0] == 404
+        assert asgi_json('DELETE', f"/api/tasks/{task['id']}")[0] == 404
+
+    def test_writes_publish_events_and_sync_revisions(self, client):
+        """Test that async writes run the same session hooks as the Flask routes"""
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        asgi_json('PUT', f"/api/tasks/{task['id']}", {'title': 'Renamed'})
+        assert [event.type for event in get_event_log().read_since(0)[0]] == ['task.created', 'task.updated']
+        changes = json.loads(client.get('/api/sync?since=0').data)
+        assert [row['title'] for row in changes['tasks']] == ['Renamed']
+
+class TestASGIComments:
+    def test_comment_crud(self, client):
+        """Test the comment routes through the async handlers"""
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        status, comment = asgi_json('POST', '/api/comments', {'content': 'Hi', 'task_id': task['id']})
+        assert status == 201
+        status, updated = asgi_json('PUT', f"/api/comments/{comment['id']}", {'content': 'Edited'})
+        assert status == 200
+        assert updated['content'] == 'Edited'
+        assert asgi_json('GET', f"/api/comments/{comment['id']}") == (200, updated)
+        assert asgi_json('GET', f"/api/tasks/{task['id']}/comments") == (200, {'comments': [updated], 'next_cursor': None})
+        assert asgi_json('GET', '/api/comments') == (200, [updated])
+        assert asgi_json('DELETE', f"/api/comments/{comment['id']}")[0] == 200
+        assert asgi_json('GET', f"/api/comments/{comment['id']}")[0] == 404
+
+    def test_comment_for_missing_task(self, client):
+        """Test that comments on unknown tasks are rejected"""
+        assert asgi_json('POST', '/api/comments', {'content': 'Hi', 'task_id': 999}) == (404, {'error': 'Task not found'})
+
+class TestASGIRouting:
+    def test_other_routes_are_served_by_flask(self, client):
+        """Test that routes without an async handler fall through to the Flask app"""
+        status, body = asgi_json('GET', '/api/health')
+        assert status == 200
+        assert body['status'] == 'healthy'
+
+    def test_archived_reads_are_served_by_flask(self, client):
+        """Test that archived=true reads reach the archive tables through the Flask routes"""
+        asgi_json('POST', '/api/tasks', {'title': 'Old task', 'completed': True})
+        assert client.post('/api/archive', json={'days': 0}).status_code == 202
+        get_job_queue().run_pending()
+        assert asgi_json('GET', '/api/tasks')[1]['tasks'] == []
+        status, body = asgi_json('GET', '/api/tasks?archived=true')
+        assert status == 200
+        assert [task['title'] for task in body['tasks']] == ['Old task']
+        assert asgi_json('GET', f"/api/tasks/{body['tasks'][0]['id']}/comments?archived=true")[1]['comments'] == []
+
+    def test_list_reads_use_the_chosen_replica(self, client, monkeypatch):
+        """Test that list reads run on the replica engine without caching its revisions"""
+        monkeypatch.setattr(asgi, 'choose_replica', lambda *args: 'replica_1')
+        monkeypatch.setattr(asgi, 'replica_engine', lambda name: asgi.engine)
+        db.session.add(Task(title='Task'))
+        db.session.commit()
+        get_cache().clear()
+        status, body = asgi_json('GET', '/api/tasks')
+        assert status == 200
+        assert [task['title'] for task in body['tasks']] == ['Task']
+        assert get_cache().get('revision:task') is None
+
+    def test_cors_headers(self, client):
+        """Test that cross-origin requests get the same CORS headers as Flask routes"""
+        _, headers, _ = asgi_request('GET', '/api/tasks', headers={'Origin': 'http://localhost:3000'})
+        assert headers['access-control-allow-origin'] == '*'
+        assert headers['access-control-expose-headers'] == 'ETag'
+
+    def test_compression_and_cache_headers(self, client):
+        """Test that async responses are compressed and labelled like the Flask ones"""
+        db.session.add_all([Task(title=f'Task {i}', description='Compressible text ' * 5) for i in range(30)])
+        db.session.commit()
+        _, _, plain = asgi_request('GET', '/api/tasks')
+        status, headers, content = asgi_request('GET', '/api/tasks', headers={'Accept-Encoding': 'gzip'})
+        assert status == 200
+        assert headers['content-encoding'] == 'gzip'
+        assert headers['vary'] == 'Accept-Encoding'
+        assert headers['cache-control'] == 'no-cache'
+        assert headers['etag'].startswith('W/')
+        assert gzip.decompress(content) == plain
+        status, headers, _ = asgi_request('GET', '/api/tasks', headers={'If-None-Match': headers['etag']})
+        assert status == 304
+        assert asgi_request('POST', '/api/tasks', {'title': 'Task'})[1]['cache-control'] == 'no-store'
+
+    def test_event_stream(self, client):
+        """Test that the async event stream replays missed events and releases its slot"""
+        asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        app.config['EVENTS_STREAM_TIMEOUT'] = 0
+        try:
+            status, headers, content = asgi_request('GET', '/api/events', headers={'Last-Event-ID': '0'})
+        finally:
+            app.config['EVENTS_STREAM_TIMEOUT'] = 300
+        assert status == 200
+        assert headers['content-type'] == 'text/event-stream'
+        assert 'id: 1\nevent: task.created\n' in content.decode()
+        assert get_event_log().stats()['connections'] == 0
+
+    def test_rate_limits_and_write_slots(self, client, monkeypatch):
+        """Test that async routes share the Flask app's budgets and release write slots"""
+        monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+        monkeypatch.setitem(app.config, 'RATELIMIT_WRITE_BURST', 2)
+        statuses = [asgi_request('POST', '/api/tasks', {'title': 'Task'})[0] for _ in range(3)]
+        assert statuses == [201, 201, 429]
+        status, headers, _ = asgi_request('POST', '/api/tasks', {'title': 'Task'})
+        assert int(headers['retry-after']) >= 1
+        assert get_write_limiter().stats()['active'] == 0
+        assert asgi_request('GET', '/api/tasks')[0] == 200
+
+    def test_write_behind(self, client, monkeypatch):
+        """Test that async updates are buffered, read back, and flushed before list reads"""
+        monkeypatch.setitem(app.config, 'WRITE_BEHIND_ENABLED', True)
+        monkeypatch.setitem(app.config, 'WRITE_BEHIND_INTERVAL_MS', 3600 * 1000)
+        _, task = asgi_json('POST', '/api/tasks', {'title': 'Task'})
+        status, updated = asgi_json('PUT', f"/api/tasks/{task['id']}", {'completed': True})
+        assert status == 200 and updated['completed'] is True
+        assert asgi_json('GET', f"/api/tasks/{task['id']}")[1] == updated
+        assert db.session.execute(db.select(Task.completed).where(Task.id == task['id'])).scalar() is False
+        assert asgi_json('GET', '/api/tasks')[1]['tasks'][0]['completed'] is True
+        assert db.session.execute(db.select(Task.completed).where(Task.id == task['id'])).scalar() is True
@@ -0,0 +1,88 @@
+import pytest
+from cache import MemoryCache, NullCache, create_cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+class TestMemoryCache:
+    def test_get_and_set(self):
+        """Test storing and reading back a value"""
+        cache = MemoryCache()
+        cache.set('key', {'a': 1})
+        assert cache.get('key') == {'a': 1}
+        assert cache.get('missing') is None
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+    
+    def test_least_recently_used_is_evicted(self):
+        """Test that the cache stays within max_entries"""
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.stats()['evictions'] == 1
+        assert cache.stats()['size'] == 2
+    
+    def test_entries_expire(self):
+        """Test that entries are dropped after their TTL"""
+        clock = FakeClock()
+        cache = MemoryCache(ttl=10, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=30)
+        clock.now = 11
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert cache.stats()['evictions'] == 1
+    
+    def test_delete_and_clear(self):
+        """Test explicit invalidation"""
+        cache = MemoryCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        cache.delete('a', 'b', 'missing')
+        assert cache.get('a') is None
+        assert cache.get('c') == 3
+        cache.clear()
+        assert cache.get('c') is None
+
+    def test_delete_revokes_lease(self):
+        """Test that a fill leased before an invalidation is dropped"""
+        cache = MemoryCache()
+        lease = cache.lease('a')
+        cache.delete('a')
+        assert cache.set_leased('a', 'stale', lease) is False
+        assert cache.get('a') is None
+        lease = cache.lease('a')
+        assert cache.set_leased('a', 'fresh', lease) is True
+        assert cache.get('a') == 'fresh'
+        assert cache.set_leased('a', 'again', lease) is False
+    
+    def test_newer_lease_wins(self):
+        """Test that only the latest reader's lease can fill the key"""
+        cache = MemoryCache()
+        first = cache.lease('a')
+        second = cache.lease('a')
+        assert cache.set_leased('a', 1, first) is False
+        assert cache.set_leased('a', 2, second) is True
+        assert cache.get('a') == 2
+
+class TestCreateCache:
+    def test_backends(self):
+        """Test selecting a backend from configuration"""
+        assert isinstance(create_cache({'CACHE_BACKEND': 'memory', 'CACHE_MAX_ENTRIES': 5}), MemoryCache)
+        assert isinstance(create_cache({'CACHE_BACKEND': 'null'}), NullCache)
+    
+    def test_unknown_backend(self):
+        """Test that a misspelled backend fails loudly"""
+        with pytest.raises(ValueError):
+            create_cache({'CACHE_BACKEND': 'memcache'})
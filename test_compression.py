@@ -0,0 +1,61 @@
+import gzip
+import zlib
+import pytest
+from compression import StreamCompressor, compress, compress_chunks, negotiate
+
+brotli = pytest.importorskip('brotli')
+
+DATA = b'{"tasks": [' + b','.join(b'{"id": %d, "title": "Task"}' % i for i in range(200)) + b']}'
+
+class TestNegotiate:
+    def test_prefers_brotli(self):
+        """Test that brotli wins when the client accepts both equally"""
+        assert negotiate('gzip, deflate, br') == 'br'
+
+    def test_quality_values(self):
+        """Test that client q-values and q=0 refusals are honoured"""
+        assert negotiate('br;q=0.5, gzip') == 'gzip'
+        assert negotiate('br;q=0, gzip;q=0') is None
+        assert negotiate('*') == 'br'
+
+    def test_no_acceptable_encoding(self):
+        """Test that identity is used without a usable Accept-Encoding"""
+        assert negotiate(None) is None
+        assert negotiate('') is None
+        assert negotiate('deflate') is None
+        assert negotiate('br, gzip', encodings=('gzip',)) == 'gzip'
+
+class TestCompress:
+    def test_round_trip(self):
+        """Test that both encodings decode back to the input and shrink it"""
+        assert gzip.decompress(compress(DATA, 'gzip')) == DATA
+        assert brotli.decompress(compress(DATA, 'br')) == DATA
+        assert len(compress(DATA, 'gzip')) < len(DATA) / 5
+
+    def test_stream_chunks_are_decodable_immediately(self):
+        """Test that each flushed piece can be decoded before the stream ends"""
+        for encoding, decoder in (('gzip', zlib.decompressobj(16 + zlib.MAX_WBITS)), ('br', brotli.Decompressor())):
+            compressor = StreamCompressor(encoding)
+            decode = decoder.decompress if encoding == 'gzip' else decoder.process
+            assert decode(compressor.compress(b'first line\n')) == b'first line\n'
+            assert decode(compressor.compress(b'second line\n')) == b'second line\n'
+            decode(compressor.finish())
+
+    def test_compress_chunks(self):
+        """Test compressing a stream of str and bytes chunks"""
+        pieces = list(compress_chunks(['a' * 100, b'', b'b' * 100], 'gzip'))
+        assert gzip.decompress(b''.join(pieces)) == b'a' * 100 + b'b' * 100
+
+    def test_compress_chunks_closes_source(self):
+        """Test that abandoning the compressed stream closes the wrapped generator"""
+        closed = []
+        def source():
+            try:
+                yield 'chunk'
+                yield 'chunk'
+            finally:
+                closed.append(True)
+        stream = compress_chunks(source(), 'gzip')
+        next(stream)
+        stream.close()
+        assert closed == [True]
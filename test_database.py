@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import create_engine, text
+from database import apply_sqlite_pragmas, async_database_uri, copy_sqlite_database, database_uri, engine_options, is_memory_sqlite, replica_uris
+
+class TestDatabaseConfig:
+    def test_database_url_from_environment(self):
+        """Test that DATABASE_URL overrides the SQLite default"""
+        assert database_uri('/tmp/app.db', environ={}) == 'sqlite:////tmp/app.db'
+        environ = {'DATABASE_URL': 'postgresql://localhost/tasks'}
+        assert database_uri('/tmp/app.db', environ=environ) == 'postgresql://localhost/tasks'
+    
+    def test_pool_options(self):
+        """Test pool sizing for file databases and none for in-memory SQLite"""
+        options = engine_options('sqlite:////tmp/app.db', environ={'DB_POOL_SIZE': '3'})
+        assert options['pool_size'] == 3
+        assert options['pool_pre_ping'] is True
+        assert is_memory_sqlite('sqlite://')
+        assert 'pool_size' not in engine_options('sqlite:///:memory:', environ={})
+    
+    def test_replica_urls_from_environment(self):
+        """Test that REPLICA_URLS lists the replicas, none by default"""
+        assert replica_uris(environ={}) == []
+        environ = {'REPLICA_URLS': 'sqlite:////tmp/a.db, sqlite:////tmp/b.db,'}
+        assert replica_uris(environ=environ) == ['sqlite:////tmp/a.db', 'sqlite:////tmp/b.db']
+    
+    def test_async_database_uri(self):
+        """Test that sync URLs are mapped to their asyncio drivers"""
+        assert async_database_uri('sqlite:////tmp/app.db') == 'sqlite+aiosqlite:////tmp/app.db'
+        assert async_database_uri('postgresql+psycopg://u:p@host/db') == 'postgresql+asyncpg://u:p@host/db'
+        with pytest.raises(ValueError):
+            async_database_uri('mysql://host/db')
+    
+    def test_pragmas_applied_to_new_connections(self, tmp_path):
+        """Test that every connection gets the configured pragmas"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+        apply_sqlite_pragmas(engine, {'journal_mode': 'WAL', 'busy_timeout': 1234})
+        with engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+        engine.dispose()
+    
+    def test_copy_sqlite_database(self, tmp_path):
+        """Test that a copy replaces the target's contents, even while the source is in WAL mode"""
+        source_uri = f"sqlite:///{tmp_path / 'primary.db'}"
+        target_uri = f"sqlite:///{tmp_path / 'replica.db'}"
+        source = create_engine(source_uri)
+        apply_sqlite_pragmas(source, {'journal_mode': 'WAL'})
+        with source.begin() as connection:
+            connection.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY)'))
+            connection.execute(text('INSERT INTO item VALUES (1), (2)'))
+        copy_sqlite_database(source_uri, target_uri)
+        with source.begin() as connection:
+            connection.execute(text('INSERT INTO item VALUES (3)'))
+        target = create_engine(target_uri)
+        with target.connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM item')).scalar() == 2
+        copy_sqlite_database(source_uri, target_uri)
+        with target.connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM item')).scalar() == 3
+        with pytest.raises(ValueError):
+            copy_sqlite_database(source_uri, 'sqlite://')
+        source.dispose()
+        target.dispose()
@@ -0,0 +1,58 @@
+import threading
+from events import EventLog, format_event
+
+class TestEventLog:
+    def test_publish_assigns_increasing_ids(self):
+        """Test that events get consecutive ids across publish calls"""
+        log = EventLog()
+        assert log.publish([('a', {}), ('b', {})]) == 2
+        assert log.publish([('c', {})]) == 3
+        events, complete = log.read_since(1)
+        assert complete
+        assert [(event.id, event.type) for event in events] == [(2, 'b'), (3, 'c')]
+
+    def test_read_since_detects_evicted_events(self):
+        """Test that a position older than the buffer is reported as incomplete"""
+        log = EventLog(max_events=2)
+        log.publish([('a', {}), ('b', {}), ('c', {})])
+        assert log.read_since(0) == ([], False)
+        events, complete = log.read_since(1)
+        assert complete
+        assert [event.id for event in events] == [2, 3]
+
+    def test_read_since_empty_log(self):
+        """Test reading from the start of a log with no events"""
+        assert EventLog().read_since(0) == ([], True)
+        assert EventLog().read_since(5) == ([], False)
+
+    def test_wait_times_out(self):
+        """Test that wait returns False when nothing is published"""
+        assert EventLog().wait(0, timeout=0.01) is False
+
+    def test_wait_wakes_on_publish(self):
+        """Test that a waiting reader is woken by a publish from another thread"""
+        log = EventLog()
+        timer = threading.Timer(0.01, log.publish, [[('a', {})]])
+        timer.start()
+        try:
+            assert log.wait(0, timeout=5) is True
+        finally:
+            timer.join()
+
+    def test_connection_limit(self):
+        """Test that connect refuses slots beyond the limit until one is released"""
+        log = EventLog()
+        assert log.connect(1)
+        assert not log.connect(1)
+        log.disconnect()
+        assert log.connect(1)
+        assert log.stats()['connections'] == 1
+
+class TestFormatEvent:
+    def test_format_event(self):
+        """Test the text/event-stream encoding of one message"""
+        assert format_event('task.created', {'id': 1}, 7) == 'id: 7\nevent: task.created\ndata: {"id": 1}\n\n'
+
+    def test_format_event_without_id(self):
+        """Test that the id line is optional"""
+        assert format_event('ping', {}) == 'event: ping\ndata: {}\n\n'
@@ -34,7 +34,7 @@ def test_api_integration():
     print("\n3. Getting all tasks...")
     response = requests.get(f"{BASE_URL}/api/tasks")
     assert response.status_code == 200
-    tasks = response.json()
+    tasks = response.json()['tasks']
     assert len(tasks) >= 1
     print(f"✅ Found {len(tasks)} task(s)")
     
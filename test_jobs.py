@@ -0,0 +1,87 @@
+import threading
+import time
+from jobs import JobQueue
+
+class FakeJobs:
+    """In-memory stand-in for the job table: claim pops the oldest id, run records it."""
+    def __init__(self, ids=()):
+        self.queued = list(ids)
+        self.ran = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def claim(self):
+        with self.lock:
+            return self.queued.pop(0) if self.queued else None
+
+    def run(self, job_id):
+        self.ran.append(job_id)
+        self.done.set()
+
+class TestJobQueue:
+    def test_run_pending(self):
+        """Test running every queued job in the calling thread"""
+        jobs = FakeJobs([1, 2, 3])
+        queue = JobQueue(jobs.claim, jobs.run, workers=0)
+        assert queue.run_pending() == 3
+        assert jobs.ran == [1, 2, 3]
+        assert queue.run_pending() == 0
+        assert queue.stats() == {'workers': 0, 'running': 0, 'completed': 3}
+
+    def test_no_workers_never_starts(self):
+        """Test that a pool configured without workers stays stopped"""
+        queue = JobQueue(FakeJobs().claim, FakeJobs().run, workers=0)
+        assert queue.start() is False
+        assert queue.started is False
+
+    def test_notify_wakes_idle_worker(self):
+        """Test that a job queued after start runs on notify, well before the next poll"""
+        jobs = FakeJobs()
+        queue = JobQueue(jobs.claim, jobs.run, workers=1, poll_interval=60)
+        assert queue.start() is True
+        assert queue.start() is False
+        try:
+            with jobs.lock:
+                jobs.queued.append(7)
+            queue.notify()
+            assert jobs.done.wait(5)
+            assert jobs.ran == [7]
+        finally:
+            queue.stop(timeout=5)
+        assert queue.started is False
+
+    def test_worker_survives_errors(self):
+        """Test that an exception from claim or run is logged and the worker keeps going"""
+        jobs = FakeJobs([1, 2])
+        calls = []
+        def run(job_id):
+            calls.append(job_id)
+            if job_id == 1:
+                raise RuntimeError('boom')
+            jobs.run(job_id)
+        queue = JobQueue(jobs.claim, run, workers=1, poll_interval=0.01)
+        queue.start()
+        try:
+            assert jobs.done.wait(5)
+        finally:
+            queue.stop(timeout=5)
+        assert calls == [1, 2]
+        assert queue.stats()['completed'] == 2
+
+    def test_heartbeat_while_running(self):
+        """Test that a running job's heartbeat is sent from another thread, survives errors and stops with the job"""
+        beats = []
+        def heartbeat(job_id):
+            beats.append(job_id)
+            if job_id == 2:
+                raise RuntimeError('database is locked')
+        def run(job_id):
+            deadline = time.monotonic() + 5
+            while beats.count(job_id) < 2 and time.monotonic() < deadline:
+                time.sleep(0.005)
+        queue = JobQueue(FakeJobs([1, 2]).claim, run, workers=0, heartbeat=heartbeat, heartbeat_interval=0.01)
+        queue.run_pending()
+        assert beats.count(1) >= 2 and beats.count(2) >= 2
+        count = len(beats)
+        time.sleep(0.05)
+        assert len(beats) == count
@@ -0,0 +1,66 @@
+import json
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from flask import Flask
+from json_provider import OrjsonProvider, StdlibJSONProvider, create_json_provider
+
+orjson = pytest.importorskip('orjson')
+
+PAYLOAD = {
+    'tasks': [{'id': 1, 'title': 'Café', 'completed': False, 'description': None}],
+    'next_cursor': None,
+    'total': Decimal('1.5'),
+}
+
+def make_app(provider):
+    app = Flask(__name__)
+    app.config['JSON_PROVIDER'] = provider
+    app.json = create_json_provider(app)
+    return app
+
+class TestOrjsonProvider:
+    def test_matches_stdlib_provider(self):
+        """Test that both providers produce the same document"""
+        fast, stdlib = make_app('orjson'), make_app('stdlib')
+        assert json.loads(fast.json.dumps(PAYLOAD)) == json.loads(stdlib.json.dumps(PAYLOAD))
+        with fast.app_context(), stdlib.app_context():
+            assert json.loads(fast.json.response(PAYLOAD).data) == json.loads(stdlib.json.response(PAYLOAD).data)
+
+    def test_datetimes_use_the_stdlib_encoding(self):
+        """Test that datetimes are still encoded as HTTP dates"""
+        value = {'at': datetime(2024, 1, 2, 3, 4, 5)}
+        assert json.loads(make_app('orjson').json.dumps(value)) == {'at': 'Tue, 02 Jan 2024 03:04:05 GMT'}
+        assert json.loads(make_app('stdlib').json.dumps(value)) == {'at': 'Tue, 02 Jan 2024 03:04:05 GMT'}
+
+    def test_response(self):
+        """Test that responses are compact, sorted and newline-terminated like jsonify"""
+        app = make_app('orjson')
+        with app.app_context():
+            response = app.json.response(b=1, a=[1, 2])
+        assert response.mimetype == 'application/json'
+        assert response.get_data(as_text=True) == '{"a":[1,2],"b":1}\n'
+
+    def test_loads(self):
+        """Test decoding, and that malformed input raises ValueError as json.loads does"""
+        app = make_app('orjson')
+        assert app.json.loads(b'{"a": [1, "x"]}') == {'a': [1, 'x']}
+        with pytest.raises(ValueError):
+            app.json.loads('{"a":')
+
+    def test_unsupported_type(self):
+        """Test that values neither encoder knows are rejected"""
+        with pytest.raises(TypeError):
+            make_app('orjson').json.dumps({'a': object()})
+
+class TestCreateJsonProvider:
+    def test_selects_provider(self):
+        """Test provider selection by JSON_PROVIDER"""
+        assert isinstance(make_app('auto').json, OrjsonProvider)
+        assert isinstance(make_app('orjson').json, OrjsonProvider)
+        assert isinstance(make_app('stdlib').json, StdlibJSONProvider)
+
+    def test_unknown_provider(self):
+        """Test that an unknown provider name is rejected"""
+        with pytest.raises(ValueError):
+            make_app('simplejson')
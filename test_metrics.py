@@ -0,0 +1,45 @@
+import pytest
+from metrics import MetricsRegistry
+
+class TestMetricsRegistry:
+    def test_counter_rendering(self):
+        """Test labelled counters in the Prometheus text format"""
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Requests handled.', ('method', 'status'))
+        requests.inc(method='GET', status=200)
+        requests.inc(2, method='GET', status=200)
+        requests.inc(method='POST', status=201)
+        output = registry.render()
+        assert '# HELP requests_total Requests handled.' in output
+        assert '# TYPE requests_total counter' in output
+        assert 'requests_total{method="GET",status="200"} 3' in output
+        assert 'requests_total{method="POST",status="201"} 1' in output
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count"""
+        registry = MetricsRegistry()
+        latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value)
+        lines = registry.render().splitlines()
+        assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+        assert 'latency_seconds_bucket{le="1"} 3' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum 3.65' in lines
+        assert 'latency_seconds_count 4' in lines
+    
+    def test_label_values_are_escaped(self):
+        """Test escaping of quotes, backslashes and newlines in label values"""
+        registry = MetricsRegistry()
+        gauge = registry.gauge('paths', 'Paths.', ('path',))
+        gauge.set(1, path='a"b\\c\nd')
+        assert 'paths{path="a\\"b\\\\c\\nd"} 1' in registry.render()
+    
+    def test_labels_must_match(self):
+        """Test that missing or unexpected labels are rejected"""
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Requests.', ('method',))
+        with pytest.raises(ValueError):
+            requests.inc(status=200)
+        with pytest.raises(ValueError):
+            registry.counter('requests_total', 'Duplicate.')
@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect, text
+from app import create_app, db, include_schema_object, init_migrations, upgrade_schema
+
+# Tables as they were before the sync revision columns and most indexes existed
+LEGACY_SCHEMA = (
+    """CREATE TABLE task (id INTEGER NOT NULL PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT,
+       completed BOOLEAN, created_at DATETIME, updated_at DATETIME)""",
+    """CREATE TABLE comment (id INTEGER NOT NULL PRIMARY KEY, content TEXT NOT NULL,
+       task_id INTEGER NOT NULL REFERENCES task (id), created_at DATETIME, updated_at DATETIME)""",
+    "INSERT INTO task VALUES (1, 'Write report', NULL, 1, '2024-01-01 09:00:00', '2024-01-01 09:00:00'),"
+    " (2, 'Review budget', NULL, 0, '2024-01-02 09:00:00', '2024-01-02 09:00:00')",
+    "INSERT INTO comment VALUES (1, 'Draft attached', 1, '2024-01-01 10:00:00', '2024-01-01 10:00:00')",
+)
+
+@pytest.fixture
+def migration_app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'migrations.db'}",
+        'JOBS_WORKERS': 0,
+    })
+    with app.app_context():
+        yield app
+        db.engine.dispose()
+
+def schema_differences():
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'include_object': include_schema_object})
+        return compare_metadata(context, db.metadata)
+
+class TestMigrations:
+    def test_upgrade_empty_database_matches_models(self, migration_app):
+        """Test that the migrations build exactly the schema the models describe"""
+        upgrade_schema()
+        assert schema_differences() == []
+        with db.engine.connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM search_index')).scalar() == 0
+            assert connection.execute(text('SELECT count(*) FROM stat_counter')).scalar() == 3
+
+    def test_upgrade_legacy_database(self, migration_app):
+        """Test that a database created before migrations keeps its rows and gets what it lacks"""
+        with db.engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+        upgrade_schema()
+        assert schema_differences() == []
+        with db.engine.connect() as connection:
+            assert connection.execute(text('SELECT revision FROM task ORDER BY id')).scalars().all() == [0, 0]
+            assert connection.execute(text('SELECT comment_count FROM task ORDER BY id')).scalars().all() == [1, 0]
+            counters = dict(connection.execute(text('SELECT name, value FROM stat_counter')).all())
+            assert counters == {'tasks_total': 2, 'tasks_completed': 1, 'comments_total': 1}
+            matches = connection.execute(text("SELECT ref_id FROM search_index WHERE search_index MATCH 'draft'"))
+            assert matches.scalars().all() == [1]
+        client = migration_app.test_client()
+        assert client.get('/api/tasks/1').get_json()['title'] == 'Write report'
+
+    def test_upgrade_stops_id_reuse(self, migration_app):
+        """Test that task and comment ids continue past archived and deleted ones after the rebuild"""
+        init_migrations(migration_app)
+        upgrade(revision='0004')
+        with db.engine.begin() as connection:
+            for statement in (
+                "INSERT INTO task (id, title, revision, comment_count) VALUES (1, 'Live', 0, 1)",
+                "INSERT INTO comment (id, content, task_id, revision) VALUES (1, 'Draft attached', 1, 0)",
+                "INSERT INTO archived_task (id, title, comment_count, archived_at) VALUES (7, 'Old', 0, '2026-01-01')",
+                "INSERT INTO tombstone (kind, ref_id, revision, deleted_at) VALUES ('comment', 4, 1, '2026-01-01')",
+            ):
+                connection.execute(text(statement))
+        upgrade_schema()
+        assert schema_differences() == []
+        with db.engine.begin() as connection:
+            assert connection.execute(text('PRAGMA foreign_keys')).scalar() == 1
+            assert connection.execute(text('PRAGMA foreign_key_check')).all() == []
+            sequences = dict(connection.execute(text('SELECT name, seq FROM sqlite_sequence')).all())
+            assert sequences == {'task': 7, 'comment': 4}
+            connection.execute(text("INSERT INTO task (title, revision, comment_count) VALUES ('New report', 0, 0)"))
+            assert connection.execute(text('SELECT max(id) FROM task')).scalar() == 8
+            # The search triggers dropped with the old tables are back
+            matches = connection.execute(text("SELECT ref_id FROM search_index WHERE search_index MATCH 'report'"))
+            assert matches.scalars().all() == [8]
+        downgrade(revision='0004')
+        assert db.session.execute(text('SELECT title FROM task ORDER BY id')).scalars().all() == ['Live', 'New report']
+
+    def test_upgrade_twice_is_a_no_op(self, migration_app):
+        """Test that running the upgrade again changes nothing"""
+        upgrade_schema()
+        upgrade_schema()
+        assert schema_differences() == []
+
+    def test_downgrade_removes_schema(self, migration_app):
+        """Test that downgrading to base drops every table, including the search index"""
+        upgrade_schema()
+        downgrade(revision='base')
+        assert inspect(db.engine).get_table_names() == ['alembic_version']
+
+    def test_import_does_not_touch_database(self, tmp_path):
+        """Test that importing app.py runs no SQL, does not import alembic and never opens the database"""
+        probe = (
+            'from sqlalchemy import event\n'
+            'from sqlalchemy.engine import Engine\n'
+            'statements = []\n'
+            "event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))\n"
+            'import app, sys\n'
+            "print(len(statements), 'alembic' in sys.modules)\n"
+        )
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'untouched.db'}", JOBS_WORKERS='0')
+        output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, capture_output=True, text=True, check=True).stdout
+        assert output.split() == ['0', 'False']
+        assert not (tmp_path / 'untouched.db').exists()
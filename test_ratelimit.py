@@ -0,0 +1,94 @@
+import threading
+import pytest
+from ratelimit import ConcurrencyLimiter, MemoryBucketStore, RateLimiter, create_rate_limiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestMemoryBucketStore:
+    def test_burst_then_refill(self):
+        """Test that a bucket allows burst requests, then refills at rate"""
+        clock = FakeClock()
+        store = MemoryBucketStore(clock=clock)
+        assert [store.take('a', 2, 3)[0] for _ in range(4)] == [True, True, True, False]
+        clock.now = 0.5
+        assert store.take('a', 2, 3) == (True, 0)
+        assert store.take('a', 2, 3)[0] is False
+        clock.now = 100
+        assert store.take('a', 2, 3) == (True, 2)
+
+    def test_clients_are_independent(self):
+        """Test that one client's usage does not affect another's"""
+        store = MemoryBucketStore(clock=FakeClock())
+        assert store.take('a', 1, 1)[0] is True
+        assert store.take('a', 1, 1)[0] is False
+        assert store.take('b', 1, 1)[0] is True
+
+    def test_least_recently_used_clients_are_evicted(self):
+        """Test that the store keeps at most max_clients buckets"""
+        store = MemoryBucketStore(max_clients=2, clock=FakeClock())
+        for key in ('a', 'b', 'c'):
+            store.take(key, 1, 1)
+        assert store.stats() == {'backend': 'memory', 'clients': 2}
+        # 'a' was evicted, so it starts again with a full bucket
+        assert store.take('a', 1, 1)[0] is True
+
+class TestRateLimiter:
+    def test_budgets_and_retry_after(self):
+        """Test separate budgets, the wait until the next token, and the counters"""
+        clock = FakeClock()
+        limiter = RateLimiter(MemoryBucketStore(clock=clock), {'read': (10, 2), 'write': (0.5, 1)})
+        assert limiter.take('client', 'write') == (True, 0.0)
+        assert limiter.take('client', 'write') == (False, 2.0)
+        assert limiter.take('client', 'read')[0] is True
+        stats = limiter.stats()
+        assert stats['allowed'] == {'read': 1, 'write': 1}
+        assert stats['limited'] == {'read': 0, 'write': 1}
+        assert stats['budgets']['write'] == {'rate': 0.5, 'burst': 1}
+
+    def test_create_rate_limiter(self):
+        """Test building the limiter from configuration"""
+        config = {'RATELIMIT_READ_RATE': 5, 'RATELIMIT_READ_BURST': 10,
+                  'RATELIMIT_WRITE_RATE': 1, 'RATELIMIT_WRITE_BURST': 2}
+        assert create_rate_limiter(config).stats()['backend'] == 'memory'
+        with pytest.raises(ValueError):
+            create_rate_limiter(dict(config, RATELIMIT_BACKEND='memcached'))
+
+class TestConcurrencyLimiter:
+    def test_rejects_beyond_queue(self):
+        """Test that callers beyond the active slots and the queue are refused at once"""
+        limiter = ConcurrencyLimiter(max_active=1, max_queued=0)
+        assert limiter.acquire() is True
+        assert limiter.try_acquire() is False
+        assert limiter.acquire() is False
+        limiter.release()
+        assert limiter.try_acquire() is True
+        assert limiter.stats()['rejected'] == 1
+
+    def test_queued_caller_gets_released_slot(self):
+        """Test that a waiting caller is admitted when a slot frees up"""
+        limiter = ConcurrencyLimiter(max_active=1, max_queued=1, timeout=5)
+        limiter.acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        while limiter.stats()['queued'] == 0:
+            pass
+        # The queue is full, and a free slot would go to the waiter first
+        assert limiter.acquire() is False
+        limiter.release()
+        waiter.join(5)
+        assert results == [True]
+        assert limiter.stats()['active'] == 1
+
+    def test_queue_timeout(self):
+        """Test that a caller waiting longer than timeout is refused"""
+        limiter = ConcurrencyLimiter(max_active=1, max_queued=1, timeout=0.01)
+        limiter.acquire()
+        assert limiter.acquire() is False
+        assert limiter.stats()['timed_out'] == 1
+        assert limiter.stats()['queued'] == 0
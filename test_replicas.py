@@ -0,0 +1,172 @@
+import json
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import Task, create_app, db, get_cache, get_read_your_writes, get_replica_set
+from database import copy_sqlite_database
+from replicas import ReadYourWrites, ReplicaSet
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestReplicaSet:
+    def test_round_robin(self):
+        """Test that healthy replicas take turns"""
+        replicas = ReplicaSet(['a', 'b', 'c'], lambda name: 0, clock=FakeClock())
+        assert [replicas.choose() for _ in range(5)] == ['a', 'b', 'c', 'a', 'b']
+        assert {name: stats['reads'] for name, stats in replicas.stats()['replicas'].items()} == {'a': 2, 'b': 2, 'c': 1}
+
+    def test_unhealthy_replicas_are_skipped_until_rechecked(self):
+        """Test that a failed check takes a replica out of rotation until check_interval passes"""
+        clock = FakeClock()
+        positions = {'a': 3, 'b': None}
+        checks = []
+        def check(name):
+            checks.append(name)
+            return positions[name]
+        replicas = ReplicaSet(['a', 'b'], check, check_interval=5, clock=clock)
+        assert [replicas.choose() for _ in range(3)] == ['a', 'a', 'a']
+        assert checks == ['a', 'b']
+        positions['b'] = 3
+        clock.now = 4
+        assert replicas.choose() == 'a'
+        clock.now = 5
+        assert [replicas.choose() for _ in range(2)] == ['a', 'b']
+
+    def test_no_healthy_replica_falls_back_to_primary(self):
+        """Test that None is returned, and counted, when every replica is down"""
+        def check(name):
+            raise OperationalError('SELECT 1', {}, Exception('no such table: table_revision'))
+        replicas = ReplicaSet(['a'], check, clock=FakeClock())
+        assert replicas.choose() is None
+        stats = replicas.stats()
+        assert stats['primary_fallbacks'] == 1
+        assert stats['replicas']['a']['healthy'] is False
+        assert 'no such table' in stats['replicas']['a']['error']
+
+    def test_mark_failed(self):
+        """Test taking a replica out of rotation after a failed read"""
+        clock = FakeClock()
+        replicas = ReplicaSet(['a', 'b'], lambda name: 0, check_interval=5, clock=clock)
+        replicas.choose()
+        replicas.mark_failed('b', 'disk I/O error')
+        assert [replicas.choose() for _ in range(2)] == ['a', 'a']
+        clock.now = 5
+        assert replicas.choose() == 'b'
+
+    def test_min_position(self):
+        """Test that only replicas at or past min_position serve the read, and the rest is counted"""
+        replicas = ReplicaSet(['a', 'b'], {'a': 4, 'b': 7}.get, clock=FakeClock())
+        assert [replicas.choose(min_position=5) for _ in range(2)] == ['b', 'b']
+        assert replicas.choose(min_position=8) is None
+        stats = replicas.stats()
+        assert stats['writer_fallbacks'] == 1 and stats['primary_fallbacks'] == 0
+        assert stats['replicas']['a']['position'] == 4
+
+class TestReadYourWrites:
+    def test_latest_write_position(self):
+        """Test that a client's position only moves forward and other clients need none"""
+        writes = ReadYourWrites()
+        writes.record_write('ip:1', 5)
+        writes.record_write('ip:1', 3)
+        assert writes.position('ip:1') == 5 and writes.position('ip:2') is None
+        assert writes.stats() == {'tracked_clients': 1}
+
+    def test_least_recent_writers_are_evicted(self):
+        """Test that at most max_clients writers are remembered"""
+        writes = ReadYourWrites(max_clients=2)
+        for client in ('a', 'b', 'c'):
+            writes.record_write(client, 1)
+        assert [writes.position(client) for client in ('a', 'b', 'c')] == [None, 1, 1]
+
+@pytest.fixture
+def replica_app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'REPLICA_URLS': [f"sqlite:///{tmp_path / 'replica.db'}"],
+        'JOBS_WORKERS': 0,
+        'RATELIMIT_ENABLED': False,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Task(title='Replicated'))
+        db.session.commit()
+        copy_replica()
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+def copy_replica():
+    copy_sqlite_database(db.engine.url, db.engines['replica_1'].url)
+
+def titles(client, address='10.0.0.2', **kwargs):
+    response = client.get('/api/tasks', environ_base={'REMOTE_ADDR': address}, **kwargs)
+    assert response.status_code == 200
+    return [task['title'] for task in json.loads(response.data)['tasks']]
+
+class TestReadReplicas:
+    def test_list_reads_go_to_the_replica(self, replica_app):
+        """Test that listings are served by the replica until the next copy reaches it"""
+        db.session.add(Task(title='Fresh'))
+        db.session.commit()
+        client = replica_app.test_client()
+        assert titles(client) == ['Replicated']
+        # Single-task reads stay on the primary
+        assert client.get('/api/tasks/2').status_code == 200
+        copy_replica()
+        assert titles(client) == ['Replicated', 'Fresh']
+        stats = json.loads(client.get('/api/replicas/stats').data)
+        assert stats['replicas']['replica_1']['reads'] == 2
+
+    def test_writer_reads_its_own_writes(self, replica_app):
+        """Test that a client reads from the primary until a replica has its write, however long that takes"""
+        client = replica_app.test_client()
+        get_replica_set().check_interval = 0
+        response = client.post('/api/tasks', json={'title': 'Mine'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        assert response.status_code == 201
+        assert titles(client, '10.0.0.1') == ['Replicated', 'Mine']
+        assert titles(client, '10.0.0.2') == ['Replicated']
+        stats = json.loads(client.get('/api/replicas/stats').data)
+        assert stats['tracked_clients'] == 1 and stats['writer_fallbacks'] == 1
+        # The replica counts as healthy (within REPLICA_MAX_LAG_SECONDS) but lacks the write
+        assert stats['replicas']['replica_1']['healthy'] is True
+
+        copy_replica()
+        assert titles(client, '10.0.0.1') == ['Replicated', 'Mine']
+        stats = json.loads(client.get('/api/replicas/stats').data)
+        assert stats['replicas']['replica_1']['reads'] == 2
+
+    def test_lagging_replica_is_skipped(self, replica_app):
+        """Test that a replica further behind than REPLICA_MAX_LAG_SECONDS is not read from"""
+        replica_app.config['REPLICA_MAX_LAG_SECONDS'] = 0
+        db.session.add(Task(title='Fresh'))
+        db.session.commit()
+        client = replica_app.test_client()
+        assert titles(client) == ['Replicated', 'Fresh']
+        stats = json.loads(client.get('/api/replicas/stats').data)
+        assert stats['replicas']['replica_1']['healthy'] is False
+        assert stats['primary_fallbacks'] == 1
+
+    def test_replica_revisions_are_not_cached(self, replica_app):
+        """Test that ETags from a replica follow the replica and do not leak into the primary's"""
+        db.session.add(Task(title='Fresh'))
+        db.session.commit()
+        get_cache().clear()
+        client = replica_app.test_client()
+        replica_etag = client.get('/api/tasks', environ_base={'REMOTE_ADDR': '10.0.0.2'}).headers['ETag']
+        assert get_cache().get('revision:task') is None
+        get_read_your_writes().record_write('ip:10.0.0.3', 10 ** 9)
+        assert titles(client, '10.0.0.3') == ['Replicated', 'Fresh']
+        assert client.get('/api/tasks', environ_base={'REMOTE_ADDR': '10.0.0.3'}).headers['ETag'] != replica_etag
+
+    def test_replica_is_read_only(self, replica_app):
+        """Test that replica connections refuse writes"""
+        with pytest.raises(OperationalError):
+            with db.engines['replica_1'].begin() as connection:
+                connection.execute(text('DELETE FROM task'))
@@ -0,0 +1,78 @@
+import threading
+import pytest
+from writebehind import WriteBuffer
+
+class FakeStore:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.written = threading.Event()
+
+    def write(self, batch):
+        if self.fail:
+            raise RuntimeError('database is locked')
+        self.batches.append(batch)
+        self.written.set()
+
+class TestWriteBuffer:
+    def test_updates_to_one_key_are_merged(self):
+        """Test that successive changes to a key are written once, newest values winning"""
+        store = FakeStore()
+        buffer = WriteBuffer(store.write)
+        buffer.put(1, {'completed': True})
+        buffer.put(1, {'completed': False, 'title': 'A'})
+        buffer.put(2, {'title': 'B'})
+        assert buffer.pending(1) == {'completed': False, 'title': 'A'}
+        assert buffer.flush() == 2
+        assert store.batches == [{1: {'completed': False, 'title': 'A'}, 2: {'title': 'B'}}]
+        assert buffer.pending(1) is None
+        assert buffer.flush() == 0
+        stats = buffer.stats()
+        assert (stats['updates'], stats['coalesced'], stats['flushes'], stats['flushed_rows']) == (3, 1, 1, 2)
+
+    def test_failed_flush_keeps_changes(self):
+        """Test that changes survive a failed write, under any newer ones"""
+        store = FakeStore(fail=True)
+        buffer = WriteBuffer(store.write)
+        buffer.put(1, {'completed': True, 'title': 'A'})
+        with pytest.raises(RuntimeError):
+            buffer.flush()
+        buffer.put(1, {'title': 'B'})
+        assert buffer.pending(1) == {'completed': True, 'title': 'B'}
+        assert buffer.stats()['failed_flushes'] == 1
+        store.fail = False
+        buffer.flush()
+        assert store.batches == [{1: {'completed': True, 'title': 'B'}}]
+
+    def test_changes_stay_visible_while_flushing(self):
+        """Test that a reader sees changes being written until the write has finished"""
+        seen = []
+        buffer = WriteBuffer(lambda batch: seen.append((buffer.pending(1), buffer.has_pending())))
+        buffer.put(1, {'title': 'A'})
+        buffer.flush()
+        assert seen == [({'title': 'A'}, True)]
+        assert buffer.has_pending() is False
+
+    def test_max_operations_wakes_the_flusher(self):
+        """Test that the background thread flushes once max_operations updates are buffered"""
+        store = FakeStore()
+        buffer = WriteBuffer(store.write, interval=60, max_operations=2)
+        assert buffer.start() is True
+        assert buffer.start() is False
+        try:
+            buffer.put(1, {'title': 'A'})
+            buffer.put(2, {'title': 'B'})
+            assert store.written.wait(5)
+        finally:
+            buffer.stop(timeout=5)
+        assert store.batches == [{1: {'title': 'A'}, 2: {'title': 'B'}}]
+
+    def test_stop_flushes(self):
+        """Test that stopping writes whatever is still pending"""
+        store = FakeStore()
+        buffer = WriteBuffer(store.write, interval=60)
+        buffer.start()
+        buffer.put(1, {'title': 'A'})
+        buffer.stop(timeout=5)
+        assert buffer.started is False
+        assert store.batches == [{1: {'title': 'A'}}]
@@ -0,0 +1,137 @@
+"""Write-behind buffer: merges updates per key in memory and writes them in batches.
+
+put() records changes for a key, merging them into any changes still pending
+for it, so repeated updates to one row cost one write. A background thread
+hands everything pending to the write callback every `interval` seconds, or
+as soon as `max_operations` updates have been buffered; flush() does the
+same synchronously. Changes stay visible through pending() until the flush
+that writes them has finished, so readers in this process never see a row
+go back to an older state.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    def __init__(self, write, interval=0.05, max_operations=100):
+        self.write = write
+        self.interval = interval
+        self.max_operations = max_operations
+        self._lock = threading.Lock()
+        # Held for a whole flush, so flush() also waits for one already in progress
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._flushing = {}
+        self._operations = 0
+        self._thread = None
+        self._stopping = False
+        self._updates = 0
+        self._coalesced = 0
+        self._flushes = 0
+        self._flushed = 0
+        self._failures = 0
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start the flusher thread once; returns False if it is already running."""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Stop the flusher thread and write whatever is still pending."""
+        with self._lock:
+            self._stopping = True
+            thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Lost %d buffered updates on shutdown', len(self._pending))
+
+    def put(self, key, changes):
+        with self._lock:
+            if key in self._pending:
+                self._coalesced += 1
+            self._pending.setdefault(key, {}).update(changes)
+            self._operations += 1
+            self._updates += 1
+            full = self._operations >= self.max_operations
+        if full:
+            self._wakeup.set()
+
+    def pending(self, key):
+        """Changes to key that are not written yet, or None."""
+        with self._lock:
+            flushing, pending = self._flushing.get(key), self._pending.get(key)
+            if flushing is None and pending is None:
+                return None
+            return {**(flushing or {}), **(pending or {})}
+
+    def has_pending(self):
+        with self._lock:
+            return bool(self._pending or self._flushing)
+
+    def flush(self):
+        """Write everything pending now; returns the number of keys written.
+
+        If the write fails the changes are put back (under any newer ones)
+        and the error is raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                self._operations = 0
+            if not batch:
+                return 0
+            try:
+                self.write(batch)
+            except Exception:
+                with self._lock:
+                    for key, changes in batch.items():
+                        self._pending[key] = {**changes, **self._pending.get(key, {})}
+                    self._flushing = {}
+                    self._failures += 1
+                raise
+            with self._lock:
+                self._flushing = {}
+                self._flushes += 1
+                self._flushed += len(batch)
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'updates': self._updates,
+                # Updates merged into one already pending for the same key
+                'coalesced': self._coalesced,
+                'flushes': self._flushes,
+                'flushed_rows': self._flushed,
+                'failed_flushes': self._failures,
+            }
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed; retrying')